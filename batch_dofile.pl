@@ -4,7 +4,11 @@
 # writing each result directly to its output file.  This avoids the
 # per-template process-creation overhead that dominates on Windows.
 #
-# Usage: batch_dofile.pl --in=<template> --out=<output> [--in=... --out=...] ...
+# Usage: batch_dofile.pl [--status] --in=<template> --out=<output> [--in=... --out=...] ...
+#
+# With --status, one "ok <output>" or "error <output>" line is printed to
+# STDOUT per pair and the remaining templates are still processed after a
+# failure; the exit code is nonzero if any template failed.
 #
 # Must be invoked with -Mconfigdata (and any other -M flags the
 # templates need, e.g. -Moids_to_c).
@@ -21,6 +25,7 @@ die "You must run this script with -Mconfigdata\n"
     if !exists($config{target});
 
 my @pairs;
+my $report_status = 0;
 my $i = 0;
 while ($i < scalar(@ARGV)) {
     my $arg = $ARGV[$i];
@@ -30,6 +35,8 @@ while ($i < scalar(@ARGV)) {
         die "Expected --out=<path> after --in=$in\n"
             if $i >= scalar(@ARGV) || $ARGV[$i] !~ /^--out=(.+)$/;
         push @pairs, { in => $in, out => $1 };
+    } elsif ($arg eq '--status') {
+        $report_status = 1;
     } else {
         die "Unexpected argument: $arg\n";
     }
@@ -58,7 +65,9 @@ use lib '$config{builddir}';
 use platform;
 _____
 
+my $failures = 0;
 for my $pair (@pairs) {
+    $failed = 0;
     my $template = OpenSSL::Template->new(
         TYPE     => 'FILE',
         SOURCE   => $pair->{in},
@@ -83,10 +92,18 @@ for my $pair (@pairs) {
         PREPEND => $prepend,
         PACKAGE => 'OpenSSL::safe',
     );
-    exit 1 if $failed;
+    if ($failed) {
+        exit 1 unless $report_status;
+        print "error $pair->{out}\n";
+        $failures++;
+        next;
+    }
 
     open(my $fh, '>', $pair->{out})
         or die "Can't open $pair->{out}: $!\n";
     print $fh $result;
     close $fh;
+    print "ok $pair->{out}\n" if $report_status;
 }
+
+exit 1 if $failures;
@@ -0,0 +1,419 @@
+"""Offline benchmark of the generate_constants.py stages.
+
+Builds a synthetic source tree shaped like OpenSSL 3.5: a stub Configure that
+writes a configdata.pm with as many sources, defines and perlasm scripts as the
+real one, util/dofile.pl and the OpenSSL::Template it loads, the ``*.in``
+templates and perlasm scripts that pipe through a *-xlate.pl translator.  The
+generator's stages then run against it, so their orchestration can be timed
+without downloading a tarball:
+
+  configure           Configure + extract_srcs.pl for every target
+  tiered_constants    compute_tiered_constants()
+  write_bzl           the .bzl writers
+  configdata_stubs    generate_configdata_stubs()
+  templates           pregenerate_templates()
+  progs               pregenerate_progs()
+  perlasm             pregenerate_perlasm() for the pre-generated flavors
+  bcr_files           write_bcr_files(), mostly hashing the overlay and archive
+
+The stub Perl does almost no work itself, so these timings measure process
+start-up, scheduling and the Python side rather than OpenSSL's Perl.
+
+Each stage's best time over --repeat runs is printed and written to --output
+as JSON.  The numbers only mean something next to others from the same kind of
+machine, so nothing here gates on them.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import generate_constants as gc
+from common import ALL_PLATFORMS, NO_ASM_TARGET, copy_from_here_to, get_simple_config_name
+from perlasm_inputs import scan_perlasm_inputs
+
+BENCHMARK_VERSION = 1
+
+
+class FixtureShape(NamedTuple):
+    """How many of each kind of file the synthetic tree has (defaults: OpenSSL 3.5)."""
+
+    crypto_srcs: int = 1150
+    ssl_srcs: int = 80
+    app_srcs: int = 70
+    build_infos: int = 190
+    templates: int = 45
+    x86_64_perlasm: int = 75
+    aarch64_perlasm: int = 45
+    disablables: int = 150
+    # Lines each perlasm script feeds through its translator.
+    perlasm_lines: int = 2000
+    # Size of the fake source tarball hashed by write_bcr_files().
+    source_archive_mib: int = 50
+
+
+# perlasm_scheme per Configure target; targets missing here get no assembly.
+_X86_64_SCHEMES = {
+    "linux-x86_64-clang": "elf",
+    "linux-x86_64": "elf",
+    "darwin64-x86_64-cc": "macosx",
+    "BSD-x86_64": "elf",
+    "VC-WIN64A-masm": "masm",
+}
+_AARCH64_SCHEMES = {
+    "darwin64-arm64-cc": "ios64",
+    "ios64-cross": "ios64",
+    "linux-aarch64": "linux64",
+    "BSD-aarch64": "linux64",
+    "VC-WIN64-CLANGASM-ARM": "win64",
+}
+
+_CONFIGURE = r"""#!/usr/bin/env perl
+# Stub Configure: writes a configdata.pm shaped like OpenSSL's.
+use strict;
+use Data::Dumper;
+
+my ($conf, @opts);
+foreach (@ARGV) {
+    if (/^--config=(.*)$/) { $conf = $1 } else { push @opts, $_ }
+}
+my %targets = do "./$conf";
+%targets = do $conf unless %targets;
+my $base = $targets{openssl_config}{inherit_from}[0];
+my %x86_64 = (@X86_64@);
+my %aarch64 = (@AARCH64@);
+my $scheme = $targets{openssl_config}{perlasm_scheme} // $x86_64{$base} // $aarch64{$base} // "";
+my ($arch, $scripts) = exists $aarch64{$base} ? ("armv8", @AARCH64_PERLASM@) : ("x86_64", @X86_64_PERLASM@);
+$scheme = "" if grep { $_ eq "no-asm" } @opts;
+my $b64l = $base =~ /armv4|WIN/ ? 0 : 1;
+print "Configuring for $base\n";
+
+my %u = (sources => {}, depends => {}, generate => {}, defines => {});
+sub add_srcs {
+    my ($lib, $prefix, $count) = @_;
+    foreach my $i (1 .. $count) {
+        push @{$u{sources}{$lib}}, "$prefix$i.o";
+        $u{sources}{"$prefix$i.o"} = ["$prefix$i.c"];
+    }
+}
+add_srcs("libcrypto", "crypto/c", @CRYPTO_SRCS@);
+add_srcs("libssl", "ssl/s", @SSL_SRCS@);
+add_srcs("apps/openssl", "apps/a", @APP_SRCS@);
+if ($scheme) {
+    foreach my $i (1 .. $scripts) {
+        my $asm = "crypto/asm/s$i-$arch.s";
+        push @{$u{sources}{libcrypto}}, "crypto/asm/s$i.o";
+        $u{sources}{"crypto/asm/s$i.o"} = [$asm];
+        $u{generate}{$asm} = ["crypto/asm/s$i-$arch.pl"];
+    }
+}
+$u{depends}{libssl} = ["libcrypto"];
+$u{depends}{"apps/openssl"} = ["libssl"];
+$u{defines}{libcrypto} = ["OPENSSL_CPUID_OBJ", "CRYPTO_DEF"];
+$u{defines}{libssl} = ["SSL_DEF"];
+$u{defines}{"apps/openssl"} = ["APP_DEF"];
+
+open my $fh, ">", "configdata.pm" or die "configdata.pm: $!\n";
+$Data::Dumper::Sortkeys = 1;
+$Data::Dumper::Indent = 1;
+print $fh "package configdata;\nuse Exporter;\nour \@ISA = qw(Exporter);\n";
+print $fh "our \@EXPORT = qw(\%config \%target \%unified_info \@disablables);\n";
+print $fh Data::Dumper->Dump([\%u], ["*unified_info"]) =~ s/^%/our %/r;
+print $fh "our %config = (b64l => $b64l, b64 => 0, b32 => " . (1 - $b64l) . ", bn_ll => 0, processor => '',"
+    . " defines => ['OPENSSL_BUILDING_OPENSSL'], lib_defines => ['OPENSSL_PIC'], openssl_sys_defines => [],"
+    . " openssl_api_defines => ['OPENSSL_CONFIGURED_API=30500'], openssl_feature_defines => ['OPENSSL_NO_MD2']);\n";
+print $fh "our %target = (perlasm_scheme => '$scheme', defines => ['L_ENDIAN'], dso_extension => '.so');\n";
+print $fh "our \@disablables = qw(@DISABLABLES@);\n1;\n";
+close $fh or die;
+"""
+
+_TEMPLATE_PM = r"""package OpenSSL::Template;
+# Minimal stand-in for OpenSSL's Text::Template wrapper: evaluates {- ... -}.
+use strict;
+
+sub new {
+    my ($class, %args) = @_;
+    open my $fh, "<", $args{SOURCE} or return undef;
+    local $/;
+    return bless { text => scalar <$fh> }, $class;
+}
+
+sub fill_in {
+    my ($self, %args) = @_;
+    my %hash = %{$args{HASH}};
+    no strict 'refs';
+    foreach my $key (keys %hash) {
+        my $value = $hash{$key};
+        *{"OpenSSL::safe::$key"} = ref($value) eq 'HASH' ? \%$value : ref($value) eq 'ARRAY' ? \@$value : \$value;
+    }
+    eval "package OpenSSL::safe; $args{PREPEND}; 1" or die $@;
+    my $text = $self->{text};
+    my $broken = 0;
+    $text =~ s/\{-(.*?)-\}/my $r = eval "package OpenSSL::safe; no strict; $1"; if ($@) { $args{BROKEN}->(error => $@); $broken = 1 } $r/ges;
+    return undef if $broken;
+    return "/* " . join(" ", @{$hash{autowarntext}}) . " */\n" . $text;
+}
+1;
+"""
+
+_DOFILE = r"""use strict;
+use FindBin;
+use lib "$FindBin::Bin/perl";
+use OpenSSL::Template;
+
+my $in = $ARGV[0];
+my $template = OpenSSL::Template->new(TYPE => 'FILE', SOURCE => $in, FILENAME => $in) or die "$in: $!\n";
+my $text = $template->fill_in(
+    HASH => {
+        config => \%configdata::config,
+        target => \%configdata::target,
+        autowarntext => ["WARNING: do not edit!", "Generated from $in"],
+    },
+    PREPEND => "use lib '$FindBin::Bin/../Configurations'; use platform;",
+    PACKAGE => 'OpenSSL::safe',
+    BROKEN => sub { my %args = @_; print STDERR $args{error}; exit 1 },
+);
+print $text;
+"""
+
+_XLATE = r"""my $flavour = shift;
+my $output = shift;
+open STDOUT, ">", $output or die "$output: $!\n";
+my $lines = 0;
+while (my $line = <STDIN>) {
+    $lines++;
+    print "$flavour: $line";
+}
+print "# $lines lines\n";
+close STDOUT or die;
+"""
+
+_PERLASM = r"""$flavour = shift;
+$output = shift;
+$0 =~ m/(.*[\/\\])[^\/\\]+$/;
+$dir = $1;
+($xlate = "${dir}../perlasm/@ARCH@-xlate.pl" and -f $xlate) or die "can't locate @ARCH@-xlate.pl";
+open OUT, "| \"$^X\" \"$xlate\" $flavour \"$output\"" or die "can't call $xlate: $!";
+*STDOUT = *OUT;
+for (1 .. @LINES@) { print "  mov %rax, %rbx # $_\n"; }
+close STDOUT or die "error closing STDOUT: $!";
+"""
+
+
+def _write(path: Path, content: str, executable: bool = False) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    if executable:
+        os.chmod(path, 0o755)
+
+
+def _perl_hash(schemes: dict[str, str]) -> str:
+    return ", ".join(f'"{target}" => "{scheme}"' for target, scheme in schemes.items())
+
+
+def build_fixture(root: Path, shape: FixtureShape) -> Path:
+    """Write a synthetic OpenSSL source tree of the given *shape* under *root*; return the fake tarball."""
+    configure = _CONFIGURE
+    for marker, value in {
+        "@X86_64@": _perl_hash(_X86_64_SCHEMES),
+        "@AARCH64@": _perl_hash(_AARCH64_SCHEMES),
+        "@X86_64_PERLASM@": str(shape.x86_64_perlasm),
+        "@AARCH64_PERLASM@": str(shape.aarch64_perlasm),
+        "@CRYPTO_SRCS@": str(shape.crypto_srcs),
+        "@SSL_SRCS@": str(shape.ssl_srcs),
+        "@APP_SRCS@": str(shape.app_srcs),
+        "@DISABLABLES@": " ".join(["asm", "threads"] + [f"feature{i}" for i in range(shape.disablables - 2)]),
+    }.items():
+        configure = configure.replace(marker, value)
+    _write(root / "Configure", configure, executable=True)
+    _write(
+        root / "VERSION.dat",
+        'MAJOR=3\nMINOR=5\nPATCH=5\nPRE_RELEASE_TAG=\nBUILD_METADATA=\nRELEASE_DATE="27 Jan 2026"\nSHLIB_VERSION=3\n',
+    )
+    _write(root / "Configurations" / "10-main.conf", "my %targets = ();\n")
+    _write(root / "Configurations" / "platform.pm", "package platform;\n1;\n")
+    _write(root / "external" / "perl" / "MODULES.txt", "")
+    _write(root / "util" / "perl" / "OpenSSL" / "Util.pm", "package OpenSSL::Util;\n1;\n")
+    _write(
+        root / "util" / "perl" / "OpenSSL" / "fallback.pm",
+        'package OpenSSL::fallback;\nsub import { -f $_[1] or die "no $_[1]" }\n1;\n',
+    )
+    _write(root / "util" / "perl" / "OpenSSL" / "Template.pm", _TEMPLATE_PM)
+    _write(root / "util" / "dofile.pl", _DOFILE)
+    _write(root / "apps" / "progs.pl", 'print "/* progs $ARGV[0] */\\n";\n')
+    _write(root / "providers" / "common" / "der" / "oids_to_c.pm", "package oids_to_c;\nsub oid { 'oid' }\n1;\n")
+
+    for i in range(shape.build_infos):
+        _write(root / "crypto" / f"d{i}" / "build.info", f"SOURCE[../../libcrypto]=c{i}.c\n")
+    # Every platform-specific template, then invariant ones spread over the
+    # directories discover_dofile_templates() scans.
+    templates = sorted(gc._PLATFORM_SPECIFIC_TEMPLATE_INPUTS)
+    dirs = ["include/openssl", "include/crypto", "crypto", "providers/common/include/prov", "providers/common/der"]
+    templates += [f"{dirs[i % len(dirs)]}/t{i}.h.in" for i in range(shape.templates - len(templates))]
+    for template in templates:
+        _write(root / template, '#define B64L {- $config{b64l} -}\n#define SCHEME "{- $target{perlasm_scheme} -}"\n')
+
+    for arch in ["x86_64", "armv8"]:
+        _write(root / "crypto" / "perlasm" / f"{arch}-xlate.pl", _XLATE)
+        script = _PERLASM.replace("@ARCH@", arch).replace("@LINES@", str(shape.perlasm_lines))
+        for i in range(1, max(shape.x86_64_perlasm, shape.aarch64_perlasm) + 1):
+            _write(root / "crypto" / "asm" / f"s{i}-{arch}.pl", script)
+
+    archive = root.parent / "openssl.tar.gz"
+    with archive.open("wb") as f:
+        chunk = bytes(range(256)) * 4096
+        for _ in range(shape.source_archive_mib):
+            f.write(chunk)
+    return archive
+
+
+@contextlib.contextmanager
+def _quiet() -> Iterator[None]:
+    """Discard stdout, of this process and of the Perl it starts, so the report stays readable."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            os.dup2(devnull.fileno(), 1)
+            yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+class _Stages:
+    """Times named stages, keeping each one's best time over repeated runs."""
+
+    def __init__(self) -> None:
+        self.best: dict[str, float] = {}
+
+    def run(self, name: str, fn: Callable[[], Any]) -> Any:
+        with _quiet():
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+        self.best[name] = min(elapsed, self.best.get(name, elapsed))
+        print(f"  {name:<20} {elapsed:8.3f}s")
+        return result
+
+
+def run_once(root: Path, openssl_dir: Path, archive: Path, perl_path: str, jobs: int, stages: _Stages) -> None:
+    """Run every stage once against the fixture in *openssl_dir*, writing under *root*."""
+    out = root / "out"
+    pregen = root / "pregen"
+    bcr_dir = root / "bcr"
+    for path in [out, pregen, bcr_dir]:
+        shutil.rmtree(path, ignore_errors=True)
+    (bcr_dir / "modules" / "openssl").mkdir(parents=True)
+    (bcr_dir / "modules" / "openssl" / "metadata.json").write_text('{"versions": []}\n')
+
+    platforms = ALL_PLATFORMS + [NO_ASM_TARGET]
+    results = stages.run(
+        "configure", lambda: gc.extract_all_platform_data(openssl_dir, platforms, perl_path=perl_path, jobs=jobs)
+    )
+    platform_data = {target: results[target] for target in ALL_PLATFORMS}
+    tiered = stages.run("tiered_constants", lambda: gc.compute_tiered_constants(platform_data, results[NO_ASM_TARGET]))
+
+    def _write_bzl() -> None:
+        constants_dir = out / "bazel" / "constants"
+        constants_dir.mkdir(parents=True, exist_ok=True)
+        gc.write_common_bzl(constants_dir, tiered)
+        gc.write_no_asm_bzl(constants_dir, tiered)
+        gc.write_constants_build(constants_dir)
+        for target in ALL_PLATFORMS:
+            gc.write_platform_bzl(constants_dir, get_simple_config_name(target), tiered["per_platform"][target])
+        perlasm_scripts = gc._perlasm_scripts(platform_data.values())
+        gc.write_perlasm_inputs_bzl(constants_dir, scan_perlasm_inputs(openssl_dir, perlasm_scripts))
+        disablables = next(iter(platform_data.values())).disablables
+        known_platforms = sorted(get_simple_config_name(p) for p in ALL_PLATFORMS)
+        gc.write_features_bzl(constants_dir, gc.get_user_features(disablables), known_platforms)
+
+    stages.run("write_bzl", _write_bzl)
+    profiles = stages.run(
+        "configdata_stubs", lambda: gc.generate_configdata_stubs(platform_data, results[NO_ASM_TARGET], out)
+    )
+    stages.run(
+        "templates",
+        lambda: gc.pregenerate_templates(openssl_dir, profiles, out / "configdata", pregen, perl_path=perl_path),
+    )
+
+    def _progs() -> None:
+        any_config = get_simple_config_name(ALL_PLATFORMS[0])
+        try:
+            local_configdata = gc._place_configdata_in_source(openssl_dir, out / "configdata" / any_config, any_config)
+            gc.pregenerate_progs(openssl_dir, pregen, local_configdata, perl_path=perl_path)
+        finally:
+            gc._cleanup_source_configdata(openssl_dir)
+
+    stages.run("progs", _progs)
+    stages.run(
+        "perlasm",
+        lambda: gc.pregenerate_perlasm(
+            openssl_dir, results, pregen, perl_path=perl_path, flavors=gc._PREGEN_PERLASM_FLAVORS, jobs=jobs
+        ),
+    )
+
+    for dst, src in gc._OVERLAY_FILES.items():
+        copy_from_here_to(src, out / dst)
+    stages.run("bcr_files", lambda: gc.write_bcr_files(out, str(bcr_dir), "0.0.0.bench", str(archive), jobs))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--perl", default=None, help="Path to Perl interpreter (default: as generate_constants.py)")
+    parser.add_argument("--jobs", type=int, default=4, help="--jobs passed to the stages")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best time is kept")
+    parser.add_argument("--work_dir", default=None, help="Where to build the fixture (default: a temporary directory)")
+    parser.add_argument(
+        "--fixture_only", action="store_true", help="Only build the fixture in --work_dir, e.g. to run the generator on"
+    )
+    parser.add_argument("--output", default=None, help="Write the stage timings to this JSON file")
+    args = parser.parse_args()
+    if args.fixture_only and not args.work_dir:
+        parser.error("--fixture_only needs --work_dir")
+    perl_path = gc._resolve_perl(args.perl)
+    shape = FixtureShape()
+
+    with contextlib.ExitStack() as stack:
+        root = Path(args.work_dir) if args.work_dir else Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        openssl_dir = root / "openssl"
+        shutil.rmtree(openssl_dir, ignore_errors=True)
+        print(f"Building fixture in {openssl_dir}")
+        archive = build_fixture(openssl_dir, shape)
+        if args.fixture_only:
+            return 0
+
+        stages = _Stages()
+        for i in range(args.repeat):
+            print(f"Run {i + 1} of {args.repeat}:")
+            run_once(root, openssl_dir, archive, perl_path, args.jobs, stages)
+
+    report = {
+        "version": BENCHMARK_VERSION,
+        "fixture": shape._asdict(),
+        "jobs": args.jobs,
+        "repeat": args.repeat,
+        "host": {"python": platform.python_version(), "perl": gc._perl_version(perl_path), "cpus": os.cpu_count()},
+        "stages": {name: round(seconds, 4) for name, seconds in stages.best.items()},
+    }
+    print("Best times:")
+    for name, seconds in stages.best.items():
+        print(f"  {name:<20} {seconds:8.3f}s")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Results written to: {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,10 +28,18 @@ int copy_file(const fs::path& dest_dir, const fs::path& file,
     return 0;
 }
 
+int copy_file_to(const fs::path& dest, const fs::path& file) {
+    fs::create_directories(dest.parent_path());
+    fs::copy_file(file, dest, fs::copy_options::overwrite_existing);
+    return 0;
+}
+
 struct ManifestEntry {
     std::string dest_dir;
     std::string file;
     std::string prefix;
+    // Set for "dest\tfile" lines: copy file to exactly dest.
+    bool exact;
 };
 
 std::vector<ManifestEntry> parse_manifest(const fs::path& manifest_path) {
@@ -47,16 +55,26 @@ std::vector<ManifestEntry> parse_manifest(const fs::path& manifest_path) {
         if (line.empty()) continue;
 
         auto first_tab = line.find('\t');
-        auto second_tab = line.find('\t', first_tab + 1);
-        if (first_tab == std::string::npos || second_tab == std::string::npos) {
+        if (first_tab == std::string::npos) {
             std::cerr << "Malformed manifest line: " << line << std::endl;
             continue;
         }
+        auto second_tab = line.find('\t', first_tab + 1);
+        if (second_tab == std::string::npos) {
+            entries.push_back({
+                line.substr(0, first_tab),
+                line.substr(first_tab + 1),
+                "",
+                true,
+            });
+            continue;
+        }
 
         entries.push_back({
             line.substr(0, first_tab),
             line.substr(first_tab + 1, second_tab - first_tab - 1),
             line.substr(second_tab + 1),
+            false,
         });
     }
     return entries;
@@ -71,7 +89,8 @@ int main(int argc, char* argv[]) {
             return 1;
         }
         for (const auto& e : entries) {
-            int rc = copy_file(e.dest_dir, e.file, e.prefix);
+            int rc = e.exact ? copy_file_to(e.dest_dir, e.file)
+                             : copy_file(e.dest_dir, e.file, e.prefix);
             if (rc != 0) return rc;
         }
         return 0;
@@ -83,5 +102,7 @@ int main(int argc, char* argv[]) {
 
     std::cerr << "Usage: " << argv[0] << " <manifest_file>" << std::endl;
     std::cerr << "       " << argv[0] << " /dest/dir file prefix" << std::endl;
+    std::cerr << "Manifest lines are \"dest_dir<TAB>file<TAB>prefix\" or"
+              << " \"dest_file<TAB>file\"." << std::endl;
     return 1;
 }
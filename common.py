@@ -2,11 +2,13 @@
 
 import base64
 import hashlib
+import json
 import os
-import platform
 import shutil
 from pathlib import Path
 
+from outputs import write_output
+
 OPENSSL_VERSION = "3.5.5"
 
 MAC_ARM64 = "darwin64-arm64-cc"
@@ -98,6 +100,49 @@ def integrity_hash(path: Path) -> str:
     return f"{algo}-{base64.b64encode(digest).decode('utf-8')}"
 
 
+def integrity_of(data: bytes) -> str:
+    """Return the integrity of *data*, in the same form as integrity_hash()."""
+    return f"sha256-{base64.b64encode(hashlib.sha256(data).digest()).decode('utf-8')}"
+
+
+# Written next to source.json by write_bcr_files(): the integrity, size and
+# mtime (in whole seconds, which is all tar keeps) of every overlay file, so
+# patch_bcr_pregen.py only rehashes the files that changed since.  It is
+# removed once the module has been patched.
+OVERLAY_HASHES = "overlay_hashes.json"
+
+# rel path -> (integrity, size, mtime)
+OverlayHashes = dict[str, tuple[str, int, int]]
+
+
+def copy_and_hash(src: Path, dst: Path) -> tuple[str, int, int]:
+    """Hardlink (or, failing that, copy) *src* to *dst*, reading it once; return (integrity, size, mtime)."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    data = src.read_bytes()
+    try:
+        os.link(src, dst)
+    except OSError:
+        dst.write_bytes(data)
+        shutil.copystat(src, dst)
+    st = dst.stat()
+    return integrity_of(data), st.st_size, int(st.st_mtime)
+
+
+def load_overlay_hashes(path: Path) -> OverlayHashes:
+    """Load the hashes written by save_overlay_hashes(), or none if *path* is missing or unreadable."""
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return {rel: (str(entry[0]), int(entry[1]), int(entry[2])) for rel, entry in data.items()}
+
+
+def save_overlay_hashes(path: Path, hashes: OverlayHashes) -> None:
+    path.write_text(json.dumps(hashes, indent=1, sort_keys=True) + "\n")
+
+
 def script_dir() -> Path:
     """Return the directory containing the generator scripts and templates.
 
@@ -112,10 +157,4 @@ def script_dir() -> Path:
 
 
 def copy_from_here_to(local_path: str, dst: Path, executable: bool = False) -> None:
-    dst.parent.mkdir(exist_ok=True, parents=True)
-    shutil.copyfile(script_dir() / local_path, dst)
-    if executable:
-        if platform.system() == "Windows":
-            os.access(dst, os.R_OK | os.W_OK | os.X_OK)
-        else:
-            os.chmod(dst, 0o755)
+    write_output(dst, (script_dir() / local_path).read_bytes(), executable=executable)
@@ -0,0 +1,157 @@
+# Resident Perl driver for generate_constants.py --perl_driver.
+#
+# Runs OpenSSL's Configure and extract_srcs.pl for many targets from a single
+# perl process.  Shared modules are loaded once up front; each target then
+# runs in a forked child that executes Configure in-process (via `do`, with
+# exit() trapped), loads the resulting configdata.pm and runs extract_srcs.pl
+# in the same interpreter.  Configure keeps its target tables in file-scoped
+# lexicals, so those are still read once per target.
+#
+# Usage: configure_driver.pl --openssl_dir=<dir> [--jobs=N] < requests.json
+#
+# requests.json is a JSON array of objects with keys:
+#   name         target name, echoed back in the result record
+#   dir          directory to configure in (the source tree or a staging copy)
+#   config_conf  contents of config.conf to write into dir
+#   args         Configure arguments
+#   env          extra environment variables for Configure
+#   extract_arg  argument passed to extract_srcs.pl ("unix" or "windows")
+#
+# One JSON object per line is written to STDOUT as each target finishes:
+#   {"name": ..., "status": "ok", "exit": <Configure exit code>, "data": {...}}
+#   {"name": ..., "status": "error", "exit": <code>, "log": "<Configure output>"}
+
+use strict;
+use warnings;
+
+use Cwd qw(abs_path);
+use File::Spec::Functions qw(catfile tmpdir);
+use FindBin;
+use JSON::PP;
+use POSIX ();
+
+my $openssl_dir;
+my $jobs = 1;
+foreach (@ARGV) {
+    if (/^--openssl_dir=(.+)$/) {
+        $openssl_dir = abs_path($1);
+    } elsif (/^--jobs=(\d+)$/) {
+        $jobs = $1 > 0 ? $1 : 1;
+    } else {
+        die "Unexpected argument: $_\n";
+    }
+}
+die "--openssl_dir is required\n" unless defined $openssl_dir;
+
+my $extract_srcs = catfile($FindBin::Bin, "extract_srcs.pl");
+my $json = JSON::PP->new->utf8->canonical;
+my $requests = $json->decode(do { local $/; <STDIN> });
+
+# Preload what Configure and extract_srcs.pl pull in so forked children
+# inherit it compiled.  Anything missing is simply loaded by the child.
+unshift @INC, catfile($openssl_dir, "util", "perl");
+foreach my $module (qw(
+    Config Cwd Data::Dumper File::Basename File::Copy File::Path
+    File::Spec::Functions IPC::Cmd Text::ParseWords
+    OpenSSL::Glob OpenSSL::Template OpenSSL::Util OpenSSL::config
+)) {
+    (my $file = "$module.pm") =~ s{::}{/}g;
+    eval { require $file };
+}
+
+# Configure ends with exit(); turn that into an exception we can catch so the
+# extraction can run in the same child.
+{
+    package Driver::Exit;
+    sub new { my ($class, $code) = @_; return bless { code => $code }, $class }
+}
+
+sub run_target {
+    my ($req, $result_file, $log_file) = @_;
+    chdir $req->{dir} or die "chdir $req->{dir}: $!\n";
+    unlink "configdata.pm";
+    open(my $conf, '>', "config.conf") or die "config.conf: $!\n";
+    print $conf $req->{config_conf};
+    close $conf;
+    $ENV{$_} = $req->{env}->{$_} foreach keys %{$req->{env}};
+
+    open(STDOUT, '>', $log_file) or die "$log_file: $!\n";
+    open(STDERR, '>&', \*STDOUT) or die "dup STDERR: $!\n";
+
+    my $exit = 0;
+    {
+        no warnings qw(once redefine);
+        local *CORE::GLOBAL::exit = sub { die Driver::Exit->new($_[0] // 0) };
+        local $0 = catfile($req->{dir}, "Configure");
+        local @ARGV = @{$req->{args}};
+        FindBin::again();
+        do $0;
+        if (ref($@) eq 'Driver::Exit') {
+            $exit = $@->{code};
+        } elsif ($@) {
+            print STDERR $@;
+            $exit = 1;
+        }
+    }
+    return $exit unless -f "configdata.pm";
+
+    # Written under a temporary name so the driver only ever sees complete output.
+    open(STDOUT, '>', "$result_file.tmp") or die "$result_file.tmp: $!\n";
+    require "./configdata.pm";
+    configdata->import();
+    local @ARGV = ($req->{extract_arg});
+    local $\ = "\n";
+    do $extract_srcs;
+    die $@ if $@;
+    close STDOUT;
+    rename("$result_file.tmp", $result_file) or die "rename $result_file: $!\n";
+    return $exit;
+}
+
+sub slurp {
+    my ($path) = @_;
+    open(my $fh, '<', $path) or return "";
+    local $/;
+    return scalar <$fh>;
+}
+
+my $tmpdir = tmpdir();
+my @queue = @$requests;
+my %running;
+$| = 1;
+
+while (@queue or %running) {
+    while (@queue and scalar(keys %running) < $jobs) {
+        my $req = shift @queue;
+        my $result_file = catfile($tmpdir, "configure_driver.$$.$req->{name}.json");
+        my $log_file = catfile($tmpdir, "configure_driver.$$.$req->{name}.log");
+        my $pid = fork();
+        die "fork: $!\n" unless defined $pid;
+        if ($pid == 0) {
+            my $exit = eval { run_target($req, $result_file, $log_file) };
+            if (!defined $exit) {
+                print STDERR $@;
+                $exit = 255;
+            }
+            # Skip END blocks and destructors inherited from the driver.
+            POSIX::_exit($exit > 255 ? 255 : $exit);
+        }
+        $running{$pid} = [$req, $result_file, $log_file];
+    }
+
+    my $pid = waitpid(-1, 0);
+    last if $pid <= 0;
+    my ($req, $result_file, $log_file) = @{delete $running{$pid}};
+    my $exit = $? >> 8;
+    my $result = slurp($result_file);
+    my %record = (name => $req->{name}, exit => $exit);
+    if ($result ne "") {
+        $record{status} = "ok";
+        $record{data} = $json->decode($result);
+    } else {
+        $record{status} = "error";
+        $record{log} = slurp($log_file);
+    }
+    unlink $result_file, "$result_file.tmp", $log_file;
+    print $json->encode(\%record), "\n";
+}
@@ -16,61 +16,59 @@ sub normalize_path {
     return $path;
 }
 
-sub get_recursive_srcs_of_one {
-    my ($value, %seen, %excludes) = @_;
+# Walk %unified_info from $root along sources and depends edges and return
+# (as a hash ref) the source files and terminal nodes reached.
+#
+# $visited is shared between calls: nodes reached by an earlier walk are not
+# entered again, so walking libcrypto, libssl and apps/openssl in that order
+# visits every node once and yields each library's own sources, minus those
+# already claimed by the libraries before it.
+sub get_recursive_srcs {
+    my ($root, $visited) = @_;
     my %result;
-    if (exists $seen{$value}) {
-        return(%result);
-    }
-    if (exists $excludes{$value}) {
-        return(%result);
-    }
-    $seen{$value} = ();
-    my $srcs = $unified_info{sources}->{$value};
-    my $deps = $unified_info{depends}->{$value};
-    # Add source files (.c, .h, .S, .s, .asm) to the result
-    # We want to capture all actual source files in the dependency tree
-    if ($value =~ m/\.(c|h|S|s|asm|inc)$/) {
-        $result{$value} = ();
-    }
-    # Also add terminal nodes (files with no sources or deps)
-    if (not ($srcs or $deps)) {
-        $result{$value} = ();
-    }
-    foreach my $s (@$srcs) {
-        %result = (%result, get_recursive_srcs_of_one($s, %seen));
-    }
-    foreach my $d (@$deps) {
-        %result = (%result, get_recursive_srcs_of_one($d, %seen));
+    my @stack = ($root);
+    while (@stack) {
+        my $value = pop @stack;
+        next if $visited->{$value}++;
+        my $srcs = $unified_info{sources}->{$value};
+        my $deps = $unified_info{depends}->{$value};
+        # Source files (.c, .h, .S, .s, .asm, .inc) and terminal nodes (no
+        # sources or deps) are what we capture from the dependency tree.
+        if ($value =~ m/\.(c|h|S|s|asm|inc)$/ or not ($srcs or $deps)) {
+            $result{$value} = ();
+        }
+        push @stack, @$srcs if $srcs;
+        push @stack, @$deps if $deps;
     }
-    return(%result);
+    return \%result;
 }
 
+# Collect the defines of $root and everything it (transitively) depends on,
+# without descending into any of @excludes.
 sub get_recursive_defines {
-    my ($target, %excludes) = @_;
+    my ($root, @excludes) = @_;
+    my %visited = map { $_ => 1 } @excludes;
     my %defines;
-    if (exists $excludes{$target}) {
-        return %defines;
-    }
-    my $defs = $unified_info{defines}->{$target};
-    foreach my $def (@$defs) {
-        $defines{$def} = ();
-    }
-    foreach my $dep (@{$unified_info{depends}->{$target}}) {
-        %defines = (%defines, get_recursive_defines($dep, %excludes));
+    my @stack = ($root);
+    while (@stack) {
+        my $target = pop @stack;
+        next if $visited{$target}++;
+        my $defs = $unified_info{defines}->{$target};
+        $defines{$_} = () foreach @{$defs // []};
+        my $deps = $unified_info{depends}->{$target};
+        push @stack, @$deps if $deps;
     }
-    return %defines;
+    return \%defines;
 }
 
-my %libcrypto_srcs = get_recursive_srcs_of_one("libcrypto");
-my %excludes = %libcrypto_srcs;
-my %libssl_srcs = get_recursive_srcs_of_one("libssl", (), %excludes);
-%excludes = (%excludes, %libssl_srcs);
-my %openssl_app_srcs = get_recursive_srcs_of_one("apps/openssl", (), %excludes);
+my %visited;
+my %libcrypto_srcs = %{get_recursive_srcs("libcrypto", \%visited)};
+my %libssl_srcs = %{get_recursive_srcs("libssl", \%visited)};
+my %openssl_app_srcs = %{get_recursive_srcs("apps/openssl", \%visited)};
 
-my %libcrypto_defines = get_recursive_defines("libcrypto");
-my %libssl_defines = get_recursive_defines("libssl", ("libcrypto", 1));
-my %openssl_app_defines = get_recursive_defines("apps/openssl", ("libcrypto", 1, "libssl", 1));
+my %libcrypto_defines = %{get_recursive_defines("libcrypto")};
+my %libssl_defines = %{get_recursive_defines("libssl", "libcrypto")};
+my %openssl_app_defines = %{get_recursive_defines("apps/openssl", "libcrypto", "libssl")};
 
 # Collect perlasm generation entries from libcrypto
 foreach my $src (keys %libcrypto_srcs) {
@@ -0,0 +1,37 @@
+"""Collect the OPENSSL_NO_* defines of the disabled features in a single target.
+
+Every user feature has a `no-<feature>` bool_flag. Rather than one
+config_setting and one select() per feature, openssl_feature_defines reads all
+the flags directly and exposes the defines of the ones that are set, both as
+OpenSSLFeatureDefinesInfo and as the $(OPENSSL_FEATURE_DEFINES) Make variable,
+which copts expand for targets listing it in `toolchains`.
+"""
+
+load("@bazel_skylib//rules:common_settings.bzl", "BuildSettingInfo")
+
+OpenSSLFeatureDefinesInfo = provider(
+    doc = "The compiler flags that disable the features turned off with --//:no-<feature>.",
+    fields = {
+        "defines": "List of -DOPENSSL_NO_* flags, in the order of the flags attribute.",
+    },
+)
+
+def _openssl_feature_defines_impl(ctx):
+    defines = [define for flag, define in ctx.attr.flags.items() if flag[BuildSettingInfo].value]
+    return [
+        OpenSSLFeatureDefinesInfo(defines = defines),
+        platform_common.TemplateVariableInfo({
+            "OPENSSL_FEATURE_DEFINES": " ".join(defines),
+        }),
+    ]
+
+openssl_feature_defines = rule(
+    implementation = _openssl_feature_defines_impl,
+    doc = "Provide the -DOPENSSL_NO_* flags of every set no-<feature> flag, without a config_setting per feature.",
+    attrs = {
+        "flags": attr.label_keyed_string_dict(
+            providers = [BuildSettingInfo],
+            doc = "bool_flag targets, each mapped to the compiler flag to add when it is True.",
+        ),
+    },
+)
@@ -12,14 +12,20 @@ on any host machine.
 """
 
 import argparse
+import hashlib
 import json
 import os
 import shutil
 import subprocess
+import sys
+import tempfile
 import time
+from collections.abc import Callable, Collection, Iterable, Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cache, partial
 from pathlib import Path
 from textwrap import dedent
-from typing import Any, NamedTuple
+from typing import Any, NamedTuple, TypeVar
 
 from common import (
     ALL_PLATFORMS,
@@ -27,14 +33,39 @@ from common import (
     MAC_PLATFORMS,
     NO_ASM_TARGET,
     OPENSSL_VERSION,
+    OVERLAY_HASHES,
     PLATFORM_CONSTRAINTS,
     WINDOWS_PLATFORMS,
+    copy_and_hash,
     copy_from_here_to,
     get_configure_target,
     get_simple_config_name,
     integrity_hash,
+    save_overlay_hashes,
     script_dir,
 )
+from manifest import FileHasher, load_manifest, outputs_match, record_outputs, resolve, save_manifest
+from outputs import (
+    ensure_dirs,
+    format_output_counts,
+    install_output,
+    link_output,
+    prune_outputs,
+    staging_dir,
+    write_output,
+)
+from perlasm_inputs import PerlasmInputs, scan_perlasm_inputs
+from pregen_index import COMMON, PregenIndex, build_index, render_index_bzl
+from process_stats import (
+    collected_stats,
+    format_usage_report,
+    run_measured,
+    wait_measured,
+    write_usage_report,
+)
+from scheduler import Task, critical_path, format_critical_path, process_slot, run_tasks
+from shards import SHARD_RECORD, check_shards, generated_files, label_part, load_shard, shard_plan, shard_record
+from tracing import span, start_tracing, write_trace
 
 
 def _resolve_from_rlocation(env_var: str) -> str | None:
@@ -77,6 +108,19 @@ def _resolve_buildifier(buildifier_flag: str | None) -> str:
     return _resolve_from_rlocation("BUILDIFIER_RLOCATIONPATH") or shutil.which("buildifier") or ""
 
 
+def _run_process(name: str, phase: str, cmd: list[str], **kwargs: Any) -> "subprocess.CompletedProcess[bytes]":
+    """subprocess.run() *cmd* while holding a process slot, traced and accounted as *name* in *phase*."""
+    with process_slot(), span(name, "process", {"argv": cmd, "phase": phase}) as args:
+        result, stats = run_measured(name, phase, cmd, **kwargs)
+        args.update(
+            exit=result.returncode,
+            output_bytes=sum(len(output) for output in (result.stdout, result.stderr) if output),
+            cpu_s=stats.cpu,
+            max_rss_kb=stats.max_rss_kb,
+        )
+    return result
+
+
 class ConfigHeaderData(NamedTuple):
     """Config header template values extracted from configdata.pm."""
 
@@ -109,6 +153,20 @@ class ConfigHeaderData(NamedTuple):
             openssl_feature_defines=_str_list("config_openssl_feature_defines"),
         )
 
+    def to_dict(self) -> dict[str, Any]:
+        """Inverse of from_dict()."""
+        return {
+            "config_b64l": self.b64l,
+            "config_b64": self.b64,
+            "config_b32": self.b32,
+            "config_bn_ll": self.bn_ll,
+            "config_rc4_int": self.rc4_int,
+            "config_processor": self.processor,
+            "config_openssl_sys_defines": self.openssl_sys_defines,
+            "config_openssl_api_defines": self.openssl_api_defines,
+            "config_openssl_feature_defines": self.openssl_feature_defines,
+        }
+
 
 class PlatformData(NamedTuple):
     """Source lists and build metadata extracted from configdata.pm for one platform."""
@@ -157,6 +215,12 @@ class PlatformData(NamedTuple):
             config_header_data=ConfigHeaderData.from_dict(data),
         )
 
+    def to_dict(self) -> dict[str, Any]:
+        """Inverse of from_dict()."""
+        data = {key: value for key, value in self._asdict().items() if key != "config_header_data"}
+        data.update(self.config_header_data.to_dict())
+        return data
+
     def all_crypto_srcs(self) -> set[str]:
         return set(self.libcrypto_srcs)
 
@@ -167,7 +231,20 @@ class PlatformData(NamedTuple):
         return set(self.openssl_app_srcs)
 
 
-def run_configure(openssl_dir: Path, platform: str, perl_path: str = "perl") -> None:
+def _configure_args(platform: str) -> list[str]:
+    """Return the Configure arguments (after the script name) for a platform."""
+    args = [
+        "--config=config.conf",
+        "openssl_config",
+        "no-afalgeng",
+        "no-dynamic-engine",
+    ]
+    if platform == NO_ASM_TARGET:
+        args.append("no-asm")
+    return args
+
+
+def run_configure(openssl_dir: Path, platform: str, perl_path: str = "perl", quiet: bool = False) -> None:
     """Run OpenSSL's Configure for a given target platform.
 
     We only need configdata.pm from this step. On non-Windows hosts,
@@ -175,6 +252,9 @@ def run_configure(openssl_dir: Path, platform: str, perl_path: str = "perl") ->
     (Perl can't produce Windows-style paths), but configdata.pm is
     created before that step. We tolerate the failure as long as
     configdata.pm exists.
+
+    With *quiet*, Configure's output is captured and only shown on failure
+    (used when several targets are configured concurrently).
     """
     configdata_path = openssl_dir / "configdata.pm"
     if configdata_path.exists():
@@ -182,31 +262,26 @@ def run_configure(openssl_dir: Path, platform: str, perl_path: str = "perl") ->
 
     write_config_file(openssl_dir, platform)
 
-    configure_cmd = [perl_path, "Configure"]
-    if platform == NO_ASM_TARGET:
-        configure_cmd += [
-            "--config=config.conf",
-            "openssl_config",
-            "no-afalgeng",
-            "no-dynamic-engine",
-            "no-asm",
-        ]
-    else:
-        configure_cmd += [
-            "--config=config.conf",
-            "openssl_config",
-            "no-afalgeng",
-            "no-dynamic-engine",
-        ]
+    configure_cmd = [perl_path, "Configure"] + _configure_args(platform)
 
     env = os.environ.copy()
     if platform in WINDOWS_PLATFORMS:
         env["CONFIGURE_INSIST"] = "1"
 
-    result = subprocess.run(configure_cmd, cwd=openssl_dir, env=env)
+    result = _run_process(
+        f"Configure {platform}",
+        "configure",
+        configure_cmd,
+        cwd=openssl_dir,
+        env=env,
+        stdout=subprocess.PIPE if quiet else None,
+        stderr=subprocess.STDOUT if quiet else None,
+    )
     if not configdata_path.exists():
+        output = result.stdout.decode(errors="replace") if quiet else ""
         raise RuntimeError(
-            f"Configure for {platform} failed and configdata.pm was not produced. Exit code: {result.returncode}"
+            f"Configure for {platform} failed and configdata.pm was not produced. "
+            f"Exit code: {result.returncode}\n{output}"
         )
     if result.returncode != 0:
         print(
@@ -233,13 +308,12 @@ _ANDROID_CONFIG_OVERRIDES = {
 }
 
 
-def write_config_file(openssl_dir: Path, platform: str) -> None:
+def _render_config_conf(platform: str) -> str:
+    """Render the config.conf that defines the ``openssl_config`` target for *platform*."""
     target = get_configure_target(platform)
     override = _ANDROID_CONFIG_OVERRIDES.get(target)
     if override:
-        with (openssl_dir / "config.conf").open("w") as f:
-            f.write(
-                f"""(
+        return f"""(
     'openssl_config' => {{
         inherit_from   => [ "{override["inherit_from"]}" ],
         asm_arch       => '{override["asm_arch"]}',
@@ -248,44 +322,374 @@ def write_config_file(openssl_dir: Path, platform: str) -> None:
     }}
 );
 """
-            )
-    else:
-        with (openssl_dir / "config.conf").open("w") as f:
-            f.write(
-                f"""(
+    return f"""(
     'openssl_config' => {{
         inherit_from => [ "{target}" ],
         dso_scheme   => undef,
     }}
 );
 """
-            )
 
 
-def extract_platform_data(
+def write_config_file(openssl_dir: Path, platform: str) -> None:
+    (openssl_dir / "config.conf").write_text(_render_config_conf(platform))
+
+
+def _extract_srcs_platform(platform: str) -> str:
+    """Return the platform family argument extract_srcs.pl expects."""
+    return "windows" if "WIN" in get_configure_target(platform) else "unix"
+
+
+def extract_platform_json(
     openssl_dir: Path,
     platform: str,
     perl_path: str = "perl",
-) -> PlatformData:
-    """Run Configure and extract source lists for a platform."""
-    run_configure(openssl_dir, platform, perl_path=perl_path)
+    quiet: bool = False,
+) -> dict[str, Any]:
+    """Run Configure and extract_srcs.pl for a platform, returning the raw JSON output."""
+    run_configure(openssl_dir, platform, perl_path=perl_path, quiet=quiet)
 
-    simple_platform = "windows" if "WIN" in get_configure_target(platform) else "unix"
-    proc = subprocess.run(
+    proc = _run_process(
+        f"extract_srcs.pl {platform}",
+        "extract_srcs",
         [
             perl_path,
             "-I.",
             "-l",
             "-Mconfigdata",
             str(script_dir() / "extract_srcs.pl"),
-            simple_platform,
+            _extract_srcs_platform(platform),
         ],
         cwd=openssl_dir,
         stdout=subprocess.PIPE,
         check=True,
     )
-    data = json.loads(proc.stdout.decode("utf-8"))
-    return PlatformData.from_dict(data)
+    data: dict[str, Any] = json.loads(proc.stdout.decode("utf-8"))
+    return data
+
+
+def extract_platform_data(
+    openssl_dir: Path,
+    platform: str,
+    perl_path: str = "perl",
+    quiet: bool = False,
+) -> PlatformData:
+    """Run Configure and extract source lists for a platform."""
+    return PlatformData.from_dict(extract_platform_json(openssl_dir, platform, perl_path=perl_path, quiet=quiet))
+
+
+# ---------------------------------------------------------------------------
+# Configure result cache
+# ---------------------------------------------------------------------------
+
+# Bump when the cached JSON layout or the key derivation changes.
+_PLATFORM_CACHE_VERSION = "1"
+
+
+@cache
+def _perl_version(perl_path: str) -> str:
+    proc = subprocess.run([perl_path, "-e", "print $^V"], stdout=subprocess.PIPE, check=True)
+    return proc.stdout.decode().strip()
+
+
+def _configure_input_files(openssl_dir: Path) -> list[Path]:
+    """List the target-independent files Configure reads, sorted by relative path.
+
+    That is Configure itself, VERSION.dat, the target tables under
+    Configurations/, the Perl helpers under util/perl/ and every build.info.
+    """
+    files = [openssl_dir / "Configure", openssl_dir / "VERSION.dat"]
+    for subdir in ["Configurations", "util/perl"]:
+        files += (p for p in (openssl_dir / subdir).rglob("*") if p.is_file())
+    for root, dirs, names in os.walk(openssl_dir):
+        # Temporary configdata stubs placed by pregenerate_templates().
+        if Path(root) == openssl_dir and "configdata" in dirs:
+            dirs.remove("configdata")
+        if "build.info" in names:
+            files.append(Path(root) / "build.info")
+    return sorted(set(files), key=lambda p: p.relative_to(openssl_dir).as_posix())
+
+
+def configure_inputs_digest(openssl_dir: Path, perl_path: str, hasher: FileHasher | None = None) -> str:
+    """Hash every target-independent input of Configure and extract_srcs.pl.
+
+    Combined with a platform's config.conf and arguments in
+    _platform_cache_key(), this identifies the PlatformData JSON exactly.
+    A *hasher* lets unchanged files be skipped by size and mtime.
+    """
+    h = hashlib.sha256()
+    h.update(f"v{_PLATFORM_CACHE_VERSION}\0perl {_perl_version(perl_path)}\0".encode())
+    h.update(b"extract_srcs.pl\0" + (script_dir() / "extract_srcs.pl").read_bytes() + b"\0")
+    for path in _configure_input_files(openssl_dir):
+        rel = path.relative_to(openssl_dir).as_posix()
+        digest = bytes.fromhex(hasher.digest(path)) if hasher else hashlib.sha256(path.read_bytes()).digest()
+        h.update(f"{rel}\0".encode() + digest)
+    return h.hexdigest()
+
+
+def _platform_cache_key(inputs_digest: str, platform: str) -> str:
+    h = hashlib.sha256()
+    h.update(f"{inputs_digest}\0{platform}\0".encode())
+    h.update(_render_config_conf(platform).encode() + b"\0")
+    h.update("\0".join(_configure_args(platform)).encode())
+    h.update(b"\0insist" if platform in WINDOWS_PLATFORMS else b"\0")
+    return h.hexdigest()
+
+
+def _load_cached_platform_json(cache_dir: Path, key: str) -> dict[str, Any] | None:
+    path = cache_dir / "platform_data" / f"{key}.json"
+    try:
+        data: dict[str, Any] = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    return data
+
+
+def _store_cached_platform_json(cache_dir: Path, key: str, data: dict[str, Any]) -> None:
+    entry_dir = cache_dir / "platform_data"
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    # Write-then-rename so concurrent generators never see a partial entry.
+    fd, tmp = tempfile.mkstemp(dir=entry_dir, prefix=f".{key}.", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp, entry_dir / f"{key}.json")
+
+
+# Top-level files Configure (re)writes in the directory it runs from.  These are
+# never hardlinked into a staging tree, so an in-place rewrite cannot reach back
+# into the shared source tree.
+_CONFIGURE_OUTPUTS = frozenset({"config.conf", "configdata.pm", "Makefile"})
+
+
+def _stage_source_tree(openssl_dir: Path, staging_dir: Path) -> None:
+    """Mirror the OpenSSL source tree into *staging_dir* for an isolated Configure run.
+
+    Files are hardlinked (falling back to a copy across filesystems).  Top-level
+    files are always copied: Configure writes its outputs next to itself and
+    Perl's ``open '>'`` truncates in place, which would otherwise clobber the
+    shared inode.
+    """
+    for root, dirs, files in os.walk(openssl_dir):
+        rel = Path(root).relative_to(openssl_dir)
+        dst_root = staging_dir / rel
+        dst_root.mkdir(parents=True, exist_ok=True)
+        top_level = rel == Path(".")
+        if top_level:
+            # Leftover stubs from an interrupted pregenerate_templates() run.
+            dirs[:] = [d for d in dirs if d != "configdata"]
+        for fn in files:
+            src = Path(root) / fn
+            dst = dst_root / fn
+            if top_level:
+                if fn not in _CONFIGURE_OUTPUTS:
+                    shutil.copy2(src, dst)
+                continue
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+
+def _extract_platform_json_isolated(openssl_dir: Path, platform: str, perl_path: str) -> dict[str, Any]:
+    """Like extract_platform_json(), but in a private staging copy of the source tree."""
+    # Stage next to the source tree so hardlinks stay on the same filesystem.
+    staging_dir = Path(
+        tempfile.mkdtemp(prefix=f".configure-{get_simple_config_name(platform)}-", dir=openssl_dir.resolve().parent)
+    )
+    try:
+        _stage_source_tree(openssl_dir, staging_dir)
+        return extract_platform_json(staging_dir, platform, perl_path=perl_path, quiet=True)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _extract_platform_json_with_driver(
+    openssl_dir: Path,
+    platforms: list[str],
+    perl_path: str,
+    jobs: int,
+) -> dict[str, dict[str, Any]]:
+    """Run Configure and extract_srcs.pl for *platforms* through one configure_driver.pl process.
+
+    The driver forks a child per target from a single preloaded interpreter and
+    streams back one JSON record per target as it finishes.  With ``jobs > 1``
+    every target gets its own staging copy of the source tree, as in
+    _extract_platform_json_isolated().
+    """
+    staging_root = None
+    if jobs > 1:
+        staging_root = Path(tempfile.mkdtemp(prefix=".configure-", dir=openssl_dir.resolve().parent))
+    try:
+        requests = []
+        for platform in platforms:
+            target_dir = openssl_dir.resolve()
+            if staging_root is not None:
+                target_dir = staging_root / get_simple_config_name(platform)
+                _stage_source_tree(openssl_dir, target_dir)
+            requests.append(
+                {
+                    "name": platform,
+                    "dir": str(target_dir),
+                    "config_conf": _render_config_conf(platform),
+                    "args": _configure_args(platform),
+                    "env": {"CONFIGURE_INSIST": "1"} if platform in WINDOWS_PLATFORMS else {},
+                    "extract_arg": _extract_srcs_platform(platform),
+                }
+            )
+
+        cmd = [
+            perl_path,
+            str(script_dir() / "configure_driver.pl"),
+            f"--openssl_dir={openssl_dir}",
+            f"--jobs={jobs}",
+        ]
+        with span("configure_driver.pl", "process", {"argv": cmd, "targets": len(platforms)}) as trace_args:
+            start = time.monotonic()
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            assert proc.stdin is not None and proc.stdout is not None
+            proc.stdin.write(json.dumps(requests))
+            proc.stdin.close()
+
+            results: dict[str, dict[str, Any]] = {}
+            errors = []
+            output_bytes = 0
+            for line in proc.stdout:
+                output_bytes += len(line)
+                record = json.loads(line)
+                platform = record["name"]
+                if record["status"] != "ok":
+                    errors.append(
+                        f"Configure for {platform} failed and configdata.pm was not produced. "
+                        f"Exit code: {record['exit']}\n{record.get('log', '')}"
+                    )
+                    continue
+                if record["exit"] != 0:
+                    print(
+                        f"  WARNING: Configure exited {record['exit']} for {platform}, "
+                        f"but configdata.pm exists -- proceeding (Makefile generation "
+                        f"failure is expected on cross-compilation hosts)"
+                    )
+                print(f"  Configured {platform} ({get_simple_config_name(platform)})")
+                results[platform] = record["data"]
+            stats = wait_measured(proc, "configure_driver.pl", "configure", start)
+            if stats.exit != 0:
+                errors.append(f"configure_driver.pl exited {stats.exit}")
+            trace_args.update(exit=stats.exit, output_bytes=output_bytes, cpu_s=stats.cpu, max_rss_kb=stats.max_rss_kb)
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return results
+    finally:
+        if staging_root is not None:
+            shutil.rmtree(staging_root, ignore_errors=True)
+
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+def _parallel_map(
+    fn: Callable[[_T], _R],
+    items: Sequence[_T],
+    jobs: int,
+    on_result: Callable[[_T, _R], None] | None = None,
+) -> list[_R]:
+    """Apply *fn* to every item on up to *jobs* worker threads, preserving order.
+
+    The workers only wait on Perl child processes, so threads are enough to keep
+    *jobs* cores busy.  The first failure cancels all tasks that have not started
+    yet and is re-raised.  With ``jobs <= 1`` this is a plain loop.
+
+    *on_result* is called on the calling thread for each finished item, in input
+    order, as soon as it and every item before it are done.
+    """
+    if jobs <= 1 or len(items) <= 1:
+        results = []
+        for item in items:
+            results.append(fn(item))
+            if on_result is not None:
+                on_result(item, results[-1])
+        return results
+    with ThreadPoolExecutor(max_workers=min(jobs, len(items))) as pool:
+        futures = [pool.submit(fn, item) for item in items]
+        pending = set(futures)
+        reported = 0
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            failed = next((future for future in done if future.exception() is not None), None)
+            if failed is not None:
+                for future in pending:
+                    future.cancel()
+                failed.result()
+            while reported < len(futures) and futures[reported].done():
+                if on_result is not None:
+                    on_result(items[reported], futures[reported].result())
+                reported += 1
+        return [future.result() for future in futures]
+
+
+def extract_all_platform_data(
+    openssl_dir: Path,
+    platforms: list[str],
+    perl_path: str = "perl",
+    jobs: int = 1,
+    cache_dir: Path | None = None,
+    perl_driver: bool = False,
+    inputs_digest: str | None = None,
+) -> dict[str, PlatformData]:
+    """Run Configure and extract_srcs.pl for each platform, returning results in input order.
+
+    With ``jobs == 1`` Configure runs in the source tree itself, one target at a
+    time.  Otherwise each target is configured in its own hardlinked staging copy
+    (see _stage_source_tree) and up to *jobs* targets run concurrently.
+
+    With a *cache_dir*, results are looked up by a hash of their inputs first
+    (see configure_inputs_digest; pass *inputs_digest* to reuse one already
+    computed) and only the misses run Perl.
+
+    With *perl_driver*, the misses are all handled by a single resident Perl
+    process (see configure_driver.pl) instead of two perl invocations per target.
+    """
+    raw: dict[str, dict[str, Any]] = {}
+    keys: dict[str, str] = {}
+    if cache_dir is not None:
+        if inputs_digest is None:
+            inputs_digest = configure_inputs_digest(openssl_dir, perl_path)
+        for platform in platforms:
+            keys[platform] = _platform_cache_key(inputs_digest, platform)
+            cached = _load_cached_platform_json(cache_dir, keys[platform])
+            if cached is not None:
+                raw[platform] = cached
+        print(f"  Configure cache: {len(raw)} of {len(platforms)} targets cached in {cache_dir}")
+    missing = [p for p in platforms if p not in raw]
+
+    if perl_driver and missing:
+        print(f"  Configuring {len(missing)} targets through configure_driver.pl with {jobs} jobs...")
+        raw.update(_extract_platform_json_with_driver(openssl_dir, missing, perl_path, jobs))
+    elif jobs <= 1:
+        for platform in missing:
+            print(f"  Configuring for {platform} ({get_simple_config_name(platform)})...")
+            raw[platform] = extract_platform_json(openssl_dir, platform, perl_path=perl_path)
+    elif missing:
+
+        def _one(platform: str) -> dict[str, Any]:
+            start = time.monotonic()
+            data = _extract_platform_json_isolated(openssl_dir, platform, perl_path)
+            print(f"  Configured {platform} ({get_simple_config_name(platform)}) in {time.monotonic() - start:.1f}s")
+            return data
+
+        print(f"  Configuring {len(missing)} targets with {jobs} jobs...")
+        raw.update(zip(missing, _parallel_map(_one, missing, jobs)))
+
+    if cache_dir is not None:
+        for platform in missing:
+            _store_cached_platform_json(cache_dir, keys[platform], raw[platform])
+
+    return {platform: PlatformData.from_dict(raw[platform]) for platform in platforms}
 
 
 def compute_tiered_constants(
@@ -338,58 +742,106 @@ def compute_tiered_constants(
     }
 
 
+def _render_string_list(items: Sequence[str]) -> str:
+    """Render *items* as a Starlark list, one string per line with trailing commas, as buildifier does."""
+    if not items:
+        return "[]"
+    return "[\n" + "".join(f"    {json.dumps(item)},\n" for item in items) + "]"
+
+
+def _render_string_dict(items: dict[str, str]) -> str:
+    """Render a Starlark dict of strings as buildifier formats it: one entry per line, trailing commas."""
+    if not items:
+        return "{}"
+    return "{\n" + "".join(f'    "{key}": "{value}",\n' for key, value in items.items()) + "}"
+
+
+def _render_string_list_dict(items: Mapping[str, Sequence[str]]) -> str:
+    """Render a Starlark dict of string lists as buildifier formats it, one list item per line."""
+    if not items:
+        return "{}"
+    entries = []
+    for key, values in items.items():
+        if not values:
+            entries.append(f"    {json.dumps(key)}: [],\n")
+            continue
+        lines = "".join(f"        {json.dumps(value)},\n" for value in values)
+        entries.append(f"    {json.dumps(key)}: [\n{lines}    ],\n")
+    return "{\n" + "".join(entries) + "}"
+
+
 def write_common_bzl(output_dir: Path, tiered: dict[str, Any]) -> None:
-    indent = " " * 4
     content = f"""\
 # Generated code. DO NOT EDIT.
 
-COMMON_CRYPTO_SRCS = {json.dumps(tiered["common_crypto_srcs"], indent=indent)}
+COMMON_CRYPTO_SRCS = {_render_string_list(tiered["common_crypto_srcs"])}
 
-COMMON_SSL_SRCS = {json.dumps(tiered["common_ssl_srcs"], indent=indent)}
+COMMON_SSL_SRCS = {_render_string_list(tiered["common_ssl_srcs"])}
 
-COMMON_APP_SRCS = {json.dumps(tiered["common_app_srcs"], indent=indent)}
+COMMON_APP_SRCS = {_render_string_list(tiered["common_app_srcs"])}
 """
-    (output_dir / "common.bzl").write_text(content)
+    write_output(output_dir / "common.bzl", content)
 
 
 def write_no_asm_bzl(output_dir: Path, tiered: dict[str, Any]) -> None:
-    indent = " " * 4
     content = f"""\
 # Generated code. DO NOT EDIT.
 
-NO_ASM_CRYPTO_EXTRA_SRCS = {json.dumps(tiered["no_asm_crypto_extra"], indent=indent)}
+NO_ASM_CRYPTO_EXTRA_SRCS = {_render_string_list(tiered["no_asm_crypto_extra"])}
 
-NO_ASM_SSL_EXTRA_SRCS = {json.dumps(tiered["no_asm_ssl_extra"], indent=indent)}
+NO_ASM_SSL_EXTRA_SRCS = {_render_string_list(tiered["no_asm_ssl_extra"])}
 
-NO_ASM_APP_EXTRA_SRCS = {json.dumps(tiered["no_asm_app_extra"], indent=indent)}
+NO_ASM_APP_EXTRA_SRCS = {_render_string_list(tiered["no_asm_app_extra"])}
 
-NO_ASM_DEFINES = {json.dumps(tiered["no_asm_defines"], indent=indent)}
+NO_ASM_DEFINES = {_render_string_list(tiered["no_asm_defines"])}
 """
-    (output_dir / "no_asm.bzl").write_text(content)
+    write_output(output_dir / "no_asm.bzl", content)
 
 
 def write_platform_bzl(output_dir: Path, config_name: str, platform_delta: dict[str, Any]) -> None:
-    indent = " " * 4
+    srcs_to_outs, srcs_to_outs_dupes = _perlasm_srcs_to_outs(platform_delta["perlasm_gen"])
     content = f"""\
 # Generated code. DO NOT EDIT.
 
-ASM_CRYPTO_EXTRA_SRCS = {json.dumps(platform_delta["asm_crypto_extra"], indent=indent)}
+ASM_CRYPTO_EXTRA_SRCS = {_render_string_list(platform_delta["asm_crypto_extra"])}
+
+ASM_SSL_EXTRA_SRCS = {_render_string_list(platform_delta["asm_ssl_extra"])}
+
+ASM_APP_EXTRA_SRCS = {_render_string_list(platform_delta["asm_app_extra"])}
+
+PERLASM_SRCS_TO_OUTS = {_render_string_dict(srcs_to_outs)}
+
+PERLASM_SRCS_TO_OUTS_DUPES = {_render_string_dict(srcs_to_outs_dupes)}
+
+LIBCRYPTO_DEFINES = {_render_string_list(platform_delta["libcrypto_defines"])}
+
+LIBSSL_DEFINES = {_render_string_list(platform_delta["libssl_defines"])}
 
-ASM_SSL_EXTRA_SRCS = {json.dumps(platform_delta["asm_ssl_extra"], indent=indent)}
+OPENSSL_APP_DEFINES = {_render_string_list(platform_delta["openssl_app_defines"])}
 
-ASM_APP_EXTRA_SRCS = {json.dumps(platform_delta["asm_app_extra"], indent=indent)}
+OPENSSL_DEFINES = {_render_string_list(platform_delta["openssl_defines"])}
+"""
+    write_output(output_dir / f"{config_name}.bzl", content)
 
-PERLASM_GEN = "\\n".join({json.dumps(platform_delta["perlasm_gen"], indent=indent)})
 
-LIBCRYPTO_DEFINES = {json.dumps(platform_delta["libcrypto_defines"], indent=indent)}
+def write_perlasm_inputs_bzl(output_dir: Path, perlasm_inputs: dict[str, PerlasmInputs]) -> None:
+    """Write the inputs of each perlasm script, which perl_genrule gives its action instead of all of them."""
+    inputs_dict = {script: inputs.files for script, inputs in sorted(perlasm_inputs.items())}
+    files = sorted({path for inputs in perlasm_inputs.values() for path in inputs.files})
+    cc_scripts = sorted(script for script, inputs in perlasm_inputs.items() if inputs.cc)
+    content = f"""\
+# Generated code. DO NOT EDIT.
 
-LIBSSL_DEFINES = {json.dumps(platform_delta["libssl_defines"], indent=indent)}
+# Perlasm script -> the files it reads besides itself (see perlasm_inputs.py).
+PERLASM_INPUTS = {_render_string_list_dict(inputs_dict)}
 
-OPENSSL_APP_DEFINES = {json.dumps(platform_delta["openssl_app_defines"], indent=indent)}
+# Every file in PERLASM_INPUTS.
+PERLASM_INPUT_FILES = {_render_string_list(files)}
 
-OPENSSL_DEFINES = {json.dumps(platform_delta["openssl_defines"], indent=indent)}
+# Perlasm scripts that run $CC to probe the assembler, and so need the C toolchain.
+PERLASM_CC_SCRIPTS = {_render_string_list(cc_scripts)}
 """
-    (output_dir / f"{config_name}.bzl").write_text(content)
+    write_output(output_dir / "perlasm_inputs.bzl", content)
 
 
 def _get_platform_metadata(platform: str) -> tuple[str, str, str]:
@@ -489,36 +941,46 @@ def _render_configdata_stub(profile: _ConfigProfile) -> str:
 
 def generate_configdata_stubs(
     platform_data: dict[str, PlatformData],
-    no_asm_data: PlatformData,
+    no_asm_data: PlatformData | None,
     output_dir: Path,
-) -> None:
+) -> dict[str, _ConfigProfile]:
     """Generate per-platform configdata stubs.
 
     Writes one configdata.pm per config_name into
     output_dir/configdata/<config_name>/configdata.pm, so that perl_library
-    can set includes to find it as 'configdata'.
+    can set includes to find it as 'configdata'.  Each distinct profile is
+    rendered once.
+
+    Returns the config profile of every config_name (including no_asm, unless
+    a --shard run did not configure it).
     """
     configdata_base = output_dir / "configdata"
     configdata_base.mkdir(parents=True, exist_ok=True)
 
     # @disablables is identical across all platforms; take from any.
-    disablables = next(iter(platform_data.values())).disablables
+    any_data = next(iter(platform_data.values()), no_asm_data)
+    if any_data is None:
+        raise RuntimeError("No platform data to generate configdata stubs from")
+    disablables = any_data.disablables
+
+    profiles = {
+        get_simple_config_name(platform): _make_profile(data.config_header_data, platform, disablables)
+        for platform, data in platform_data.items()
+    }
+    if no_asm_data is not None:
+        profiles["no_asm"] = _make_profile(no_asm_data.config_header_data, NO_ASM_TARGET, disablables)
 
-    for platform, data in platform_data.items():
-        config_name = get_simple_config_name(platform)
-        profile = _make_profile(data.config_header_data, platform, disablables)
+    rendered: dict[_ConfigProfile, str] = {}
+    for config_name, profile in profiles.items():
+        if profile not in rendered:
+            rendered[profile] = _render_configdata_stub(profile)
         subdir = configdata_base / config_name
-        subdir.mkdir(parents=True, exist_ok=True)
-        (subdir / "configdata.pm").write_text(_render_configdata_stub(profile))
-
-    no_asm_profile = _make_profile(no_asm_data.config_header_data, NO_ASM_TARGET, disablables)
-    no_asm_subdir = configdata_base / "no_asm"
-    no_asm_subdir.mkdir(parents=True, exist_ok=True)
-    (no_asm_subdir / "configdata.pm").write_text(_render_configdata_stub(no_asm_profile))
+        write_output(subdir / "configdata.pm", rendered[profile])
+    return profiles
 
 
 def write_constants_build(output_dir: Path) -> None:
-    (output_dir / "BUILD.bazel").write_text("")
+    write_output(output_dir / "BUILD.bazel", "")
 
 
 # ---------------------------------------------------------------------------
@@ -601,6 +1063,8 @@ _PERLASM_FLAVORS: dict[str, dict[str, Any]] = {
 # pre-generated) to ensure correct assembler probing.
 _WINDOWS_PERLASM_FLAVORS = frozenset({"masm", "win64"})
 
+_PREGEN_PERLASM_FLAVORS = [flavor for flavor in _PERLASM_FLAVORS if flavor not in _WINDOWS_PERLASM_FLAVORS]
+
 
 def _place_configdata_in_source(
     openssl_dir: Path,
@@ -631,110 +1095,175 @@ def _cleanup_source_configdata(openssl_dir: Path) -> None:
         shutil.rmtree(configdata_dir)
 
 
-def _run_dofile(
+def _place_batch_dofile_in_source(openssl_dir: Path) -> Path:
+    """Copy batch_dofile.pl next to util/dofile.pl in the OpenSSL source tree.
+
+    batch_dofile.pl locates OpenSSL's Perl modules, Configurations/ and
+    external/perl/MODULES.txt relative to its own directory, exactly like
+    util/dofile.pl, so it must run from util/.
+    """
+    local_script = openssl_dir / "util" / "batch_dofile.pl"
+    shutil.copy2(script_dir() / "batch_dofile.pl", local_script)
+    return local_script
+
+
+def _run_batch_dofile(
     openssl_dir: Path,
     configdata_dir: Path,
-    template_in: str,
-    output_path: Path,
+    templates: dict[str, Path],
+    staging_root: Path,
     perl_path: str = "perl",
 ) -> None:
-    """Run util/dofile.pl for a single template, capturing stdout."""
+    """Render templates (input path -> output path) in a single batch_dofile.pl process.
+
+    The templates are rendered under a staging_dir() in *staging_root*, which
+    must be on the same filesystem as the outputs, and then installed with
+    install_output(), so unchanged outputs are left untouched.
+    """
+    with staging_dir(staging_root) as staging:
+        # Staged files keep their output's name, one directory per template.
+        staged = {template_in: staging / str(i) / path.name for i, (template_in, path) in enumerate(templates.items())}
+        _render_batch_dofile(openssl_dir, configdata_dir, staged, perl_path)
+        for template_in, output_path in templates.items():
+            install_output(staged[template_in], output_path)
+
+
+def _render_batch_dofile(
+    openssl_dir: Path,
+    configdata_dir: Path,
+    templates: dict[str, Path],
+    perl_path: str,
+) -> None:
     cmd = [
         perl_path,
         f"-I{configdata_dir}",
+        f"-I{openssl_dir / 'util/perl'}",
+        f"-I{openssl_dir / 'providers/common/der'}",
         "-Mconfigdata",
+        "-Moids_to_c",
+        str(openssl_dir / "util" / "batch_dofile.pl"),
+        "--status",
     ]
-    if template_in.startswith("providers/common/"):
-        cmd += [
-            f"-I{openssl_dir / 'util/perl'}",
-            f"-I{openssl_dir / 'providers/common/der'}",
-            "-Moids_to_c",
-        ]
-    cmd += [str(openssl_dir / "util" / "dofile.pl"), template_in]
+    ensure_dirs(output_path.parent for output_path in templates.values())
+    for template_in, output_path in templates.items():
+        cmd += [f"--in={template_in}", f"--out={output_path}"]
 
     env = os.environ.copy()
     env.update(_HERMETIC_DOFILE_ENV)
-    result = subprocess.run(
+    result = _run_process(
+        f"batch_dofile.pl {configdata_dir.name}",
+        "templates",
         cmd,
         cwd=openssl_dir,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         env=env,
     )
-    if result.returncode != 0:
-        raise RuntimeError(f"dofile.pl failed for {template_in}:\n{result.stderr.decode()}")
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_bytes(result.stdout)
+    rendered: set[str] = set()
+    for line in result.stdout.decode().splitlines():
+        state, _, path = line.partition(" ")
+        if state == "ok":
+            rendered.add(path)
+    failed = [template_in for template_in, output_path in templates.items() if str(output_path) not in rendered]
+    if result.returncode != 0 or failed:
+        raise RuntimeError(f"batch_dofile.pl failed for {', '.join(failed)}:\n{result.stderr.decode()}")
+
+
+def _group_by_profile(config_profiles: dict[str, _ConfigProfile]) -> list[list[str]]:
+    """Group config_names with identical profiles, in first-seen order."""
+    groups: dict[_ConfigProfile, list[str]] = {}
+    for config_name, profile in config_profiles.items():
+        groups.setdefault(profile, []).append(config_name)
+    return list(groups.values())
 
 
 def pregenerate_templates(
     openssl_dir: Path,
-    platform_data: dict[str, PlatformData],
+    config_profiles: dict[str, _ConfigProfile],
+    configdata_dir: Path,
     output_dir: Path,
     perl_path: str = "perl",
+    config_names: Collection[str] | None = None,
+    common: bool = True,
 ) -> None:
-    """Pre-generate all dofile template outputs.
-
-    Invariant templates are generated once (using any platform's configdata
-    stub). Platform-specific templates are generated per known platform.
-
-    The configdata stubs are temporarily placed inside the OpenSSL source tree
-    so that $_repo_root (dirname^3 of __FILE__) resolves to the source root
-    rather than the overlay output directory.
+    """Pre-generate all dofile template outputs into output_dir/generated.
+
+    Invariant templates are generated once (using the first config_name's
+    configdata stub), unless *common* is false. Platform-specific templates are
+    generated once per distinct config profile; every other config_name sharing
+    that profile gets hardlinks to the same files, which also keeps them stored
+    once in the pregen archive.
+    Each of those batches is a single batch_dofile.pl process, so the whole
+    phase costs one Perl start-up per profile rather than one per template.
+
+    The configdata stubs under configdata_dir (see generate_configdata_stubs)
+    are temporarily placed inside the OpenSSL source tree so that $_repo_root
+    (dirname^3 of __FILE__) resolves to the source root rather than the
+    overlay output directory.
+
+    *config_names* limits the platform-specific templates to those config_names
+    (a --shard run configures some platforms only for their perlasm).
     """
     generated_dir = output_dir / "generated"
     all_dofile_templates = discover_dofile_templates(openssl_dir)
+    platform_templates = {
+        template_in: template_out
+        for template_in, template_out in all_dofile_templates.items()
+        if template_in in _PLATFORM_SPECIFIC_TEMPLATE_INPUTS
+    }
 
     try:
-        # Place any platform's configdata in the source tree for invariant templates.
-        any_platform = next(iter(platform_data))
-        any_config = get_simple_config_name(any_platform)
-        local_configdata = _place_configdata_in_source(
-            openssl_dir,
-            output_dir / "configdata" / any_config,
-            any_config,
-        )
-
-        common_dir = generated_dir / "common"
-        for template_in, template_out in all_dofile_templates.items():
-            if template_in in _PLATFORM_SPECIFIC_TEMPLATE_INPUTS:
-                continue
-            out_path = common_dir / template_out
-            print(f"    {template_out}")
-            _run_dofile(openssl_dir, local_configdata, template_in, out_path, perl_path=perl_path)
+        _place_batch_dofile_in_source(openssl_dir)
 
-        # Platform-specific templates: generate per known platform.
-        for platform in platform_data:
-            config_name = get_simple_config_name(platform)
+        if common:
+            # Place the first platform's configdata in the source tree for invariant templates.
+            any_config = next(iter(config_profiles))
             local_configdata = _place_configdata_in_source(
                 openssl_dir,
-                output_dir / "configdata" / config_name,
-                config_name,
+                configdata_dir / any_config,
+                any_config,
             )
-            platform_dir = generated_dir / config_name
-            for template_in, template_out in all_dofile_templates.items():
-                if template_in not in _PLATFORM_SPECIFIC_TEMPLATE_INPUTS:
-                    continue
-                out_path = platform_dir / template_out
-                print(f"    {config_name}/{template_out}")
-                _run_dofile(openssl_dir, local_configdata, template_in, out_path, perl_path=perl_path)
-
-        # Also generate for no_asm (it gets its own configdata stub).
-        local_configdata = _place_configdata_in_source(
-            openssl_dir,
-            output_dir / "configdata" / "no_asm",
-            "no_asm",
-        )
-        no_asm_dir = generated_dir / "no_asm"
-        for template_in, template_out in all_dofile_templates.items():
-            if template_in not in _PLATFORM_SPECIFIC_TEMPLATE_INPUTS:
-                continue
-            out_path = no_asm_dir / template_out
-            print(f"    no_asm/{template_out}")
-            _run_dofile(openssl_dir, local_configdata, template_in, out_path, perl_path=perl_path)
+            common_dir = generated_dir / "common"
+            common_templates = {
+                template_in: common_dir / template_out
+                for template_in, template_out in all_dofile_templates.items()
+                if template_in not in _PLATFORM_SPECIFIC_TEMPLATE_INPUTS
+            }
+            _run_batch_dofile(openssl_dir, local_configdata, common_templates, output_dir, perl_path=perl_path)
+            for template_in in common_templates:
+                print(f"    {all_dofile_templates[template_in]}")
+
+        # Platform-specific templates: render for the first config_name of each
+        # profile group, then link the results into the rest of the group.
+        if config_names is not None:
+            config_profiles = {name: profile for name, profile in config_profiles.items() if name in config_names}
+        groups = _group_by_profile(config_profiles)
+        print(f"    {len(config_profiles)} configs share {len(groups)} distinct profiles")
+        for group in groups:
+            rendered_config, *linked_configs = group
+            local_configdata = _place_configdata_in_source(
+                openssl_dir,
+                configdata_dir / rendered_config,
+                rendered_config,
+            )
+            rendered_dir = generated_dir / rendered_config
+            _run_batch_dofile(
+                openssl_dir,
+                local_configdata,
+                {template_in: rendered_dir / template_out for template_in, template_out in platform_templates.items()},
+                output_dir,
+                perl_path=perl_path,
+            )
+            for template_out in platform_templates.values():
+                print(f"    {rendered_config}/{template_out}")
+            for config_name in linked_configs:
+                print(f"    {config_name}/ -> {rendered_config}/")
+                for template_out in platform_templates.values():
+                    link_output(rendered_dir / template_out, generated_dir / config_name / template_out)
 
     finally:
         _cleanup_source_configdata(openssl_dir)
+        (openssl_dir / "util" / "batch_dofile.pl").unlink(missing_ok=True)
 
 
 def pregenerate_progs(
@@ -749,13 +1278,13 @@ def pregenerate_progs(
     $_repo_root resolves correctly (see _place_configdata_in_source).
     """
     generated_dir = output_dir / "generated" / "common" / "apps"
-    generated_dir.mkdir(parents=True, exist_ok=True)
-
     env = os.environ.copy()
     env.update(_HERMETIC_DOFILE_ENV)
 
     for flag, filename in [("-H", "progs.h"), ("-C", "progs.c")]:
-        result = subprocess.run(
+        result = _run_process(
+            f"progs.pl {flag}",
+            "progs",
             [
                 perl_path,
                 f"-I{configdata_dir}",
@@ -771,7 +1300,7 @@ def pregenerate_progs(
         )
         if result.returncode != 0:
             raise RuntimeError(f"progs.pl {flag} failed:\n{result.stderr.decode()}")
-        (generated_dir / filename).write_bytes(result.stdout)
+        write_output(generated_dir / filename, result.stdout)
         print(f"    apps/{filename}")
 
 
@@ -801,8 +1330,6 @@ def _render_compiler_flags_array(compiler_info: str) -> str:
 def generate_buildinf_h(output_dir: Path) -> None:
     """Generate crypto/buildinf.h from the buildinf.h.in template."""
     crypto_dir = output_dir / "generated" / "common" / "crypto"
-    crypto_dir.mkdir(parents=True, exist_ok=True)
-
     date = time.strftime("%a %b %d %H:%M:%S %Y", time.gmtime(_BUILDINF_EPOCH)) + " UTC"
 
     content = _buildinf_template()
@@ -810,7 +1337,7 @@ def generate_buildinf_h(output_dir: Path) -> None:
     content = content.replace("@@DATE@@", date)
     content = content.replace("@@COMPILER_FLAGS_ARRAY@@", _render_compiler_flags_array("compiler: bazel"))
 
-    (crypto_dir / "buildinf.h").write_text(content)
+    write_output(crypto_dir / "buildinf.h", content)
 
 
 def _parse_perlasm_commands(commands: list[str]) -> list[tuple[str, str]]:
@@ -818,18 +1345,45 @@ def _parse_perlasm_commands(commands: list[str]) -> list[tuple[str, str]]:
 
     Each command has the format (6 space-separated tokens):
       $(PERL) $(execpath <tool>) <scheme> $(execpath <output>);
+    Configure on some hosts leaves carriage returns around them, and blank
+    commands are skipped.  Anything else that is not six tokens is an error,
+    since dropping it would silently drop an assembly output.
     """
     pairs = []
     for cmd in commands:
-        parts = cmd.split(" ")
-        if len(parts) != 6:
+        if not cmd.strip():
             continue
+        parts = cmd.strip().split(" ")
+        if len(parts) != 6:
+            raise RuntimeError(f"Perlasm command is not six space-separated parts: {cmd!r}")
         tool = parts[2].rstrip(");")
         output = parts[5].rstrip(");")
         pairs.append((tool, output))
     return pairs
 
 
+def _perlasm_srcs_to_outs(commands: list[str]) -> tuple[dict[str, str], dict[str, str]]:
+    """Map each perlasm script to its output, for the srcs_to_outs attributes of perl_genrule.
+
+    A script run twice (with a different output each time) is mapped to its
+    first output in the first dict and to its second in the second; later runs
+    are dropped.
+    """
+    srcs_to_outs: dict[str, str] = {}
+    srcs_to_outs_dupes: dict[str, str] = {}
+    for tool, output in _parse_perlasm_commands(commands):
+        if tool not in srcs_to_outs:
+            srcs_to_outs[tool] = output
+        else:
+            srcs_to_outs_dupes.setdefault(tool, output)
+    return srcs_to_outs, srcs_to_outs_dupes
+
+
+def _perlasm_scripts(platform_data: Iterable[PlatformData]) -> set[str]:
+    """Every perlasm script that Configure runs for any of *platform_data*."""
+    return {tool for data in platform_data for tool, _ in _parse_perlasm_commands(data.perlasm_gen_commands)}
+
+
 def _fix_masm_segment(path: Path) -> None:
     """Ensure MASM output has a segment before any PROC directive.
 
@@ -855,17 +1409,56 @@ def _fix_masm_segment(path: Path) -> None:
         path.write_text("".join(lines))
 
 
+def _run_perlasm_script(
+    openssl_dir: Path,
+    tool_path: str,
+    flavor: str,
+    out_file: Path,
+    perl_path: str,
+    env: dict[str, str],
+) -> str:
+    """Run one perlasm script, returning its combined stdout/stderr."""
+    ensure_dirs([out_file.parent])
+    result = _run_process(
+        f"{tool_path} {flavor}",
+        f"perlasm:{flavor}",
+        [
+            perl_path,
+            str(openssl_dir / tool_path),
+            flavor,
+            str(out_file),
+        ],
+        cwd=openssl_dir,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        check=False,
+    )
+    output = result.stdout.decode(errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError(f"{tool_path} {flavor} failed with exit code {result.returncode}:\n{output}")
+    if flavor == "masm":
+        _fix_masm_segment(out_file)
+    return output
+
+
 def pregenerate_perlasm(
     openssl_dir: Path,
     platform_data: dict[str, PlatformData],
     output_dir: Path,
     perl_path: str = "perl",
     flavors: list[str] | None = None,
+    jobs: int = 1,
 ) -> None:
     """Pre-generate perlasm assembly for flavor groups.
 
     When *flavors* is ``None`` all known flavors are generated; otherwise
     only the listed subset is processed.
+
+    The scripts of all selected flavors share one pool of up to *jobs*
+    concurrent Perl processes.  Each script writes only its own output file,
+    so the result does not depend on *jobs*; progress is printed in script
+    order and the first failure stops scripts that have not started yet.
     """
     generated_asm = output_dir / "generated" / "asm"
 
@@ -879,6 +1472,7 @@ def pregenerate_perlasm(
         selected = ((f, info) for f, info in _PERLASM_FLAVORS.items() if f not in _WINDOWS_PERLASM_FLAVORS)
     else:
         selected = ((f, _PERLASM_FLAVORS[f]) for f in flavors if f in _PERLASM_FLAVORS)
+    scripts: list[tuple[str, str, str]] = []
     for flavor, info in selected:
         source_platform = info["source_platform"]
         data = lookup.get(source_platform)
@@ -887,25 +1481,24 @@ def pregenerate_perlasm(
             continue
 
         pairs = _parse_perlasm_commands(data.perlasm_gen_commands)
-        flavor_dir = generated_asm / flavor
         print(f"    {flavor}: {len(pairs)} scripts")
+        scripts += [(flavor, tool_path, output_path) for tool_path, output_path in pairs]
 
-        for tool_path, output_path in pairs:
-            out_file = flavor_dir / output_path
-            out_file.parent.mkdir(parents=True, exist_ok=True)
-            subprocess.run(
-                [
-                    perl_path,
-                    str(openssl_dir / tool_path),
-                    flavor,
-                    str(out_file),
-                ],
-                cwd=openssl_dir,
-                env=env,
-                check=True,
-            )
-            if flavor == "masm":
-                _fix_masm_segment(out_file)
+    with staging_dir(output_dir) as staging:
+        # Scripts write under *staging*, with the layout of generated/asm, and
+        # each output is installed over generated/asm once its script is done.
+        def _one(script: tuple[str, str, str]) -> str:
+            flavor, tool_path, output_path = script
+            return _run_perlasm_script(openssl_dir, tool_path, flavor, staging / flavor / output_path, perl_path, env)
+
+        def _report(script: tuple[str, str, str], output: str) -> None:
+            flavor, _, output_path = script
+            install_output(staging / flavor / output_path, generated_asm / flavor / output_path)
+            print(f"    {flavor}/{output_path}")
+            if output:
+                print(output, end="" if output.endswith("\n") else "\n")
+
+        _parallel_map(_one, scripts, jobs, on_result=_report)
 
 
 # Features that should NOT be exposed as user-facing bool_flags.
@@ -988,11 +1581,6 @@ def _feature_to_define(feature: str) -> str:
     return "-DOPENSSL_NO_" + feature.upper().replace("-", "_")
 
 
-def _feature_to_setting_name(feature: str) -> str:
-    """Map a disablable feature name to a config_setting name."""
-    return feature.replace("-", "_") + "_disabled"
-
-
 def get_user_features(disablables: list[str]) -> list[str]:
     """Filter disablables to user-relevant features, sorted."""
     return sorted(f for f in disablables if f not in _SKIP_DISABLABLES)
@@ -1003,61 +1591,44 @@ def write_features_bzl(
     features: list[str],
     known_platforms: list[str] | None = None,
 ) -> None:
-    """Generate features.bzl with FEATURE_DEFINES, flag macro, config_setting macro,
-    and pregen config_setting_group macro."""
-    loads = (
-        "# Generated code. DO NOT EDIT.\n\n"
-        'load("@bazel_skylib//lib:selects.bzl", "selects")\n'
-        'load("@bazel_skylib//rules:common_settings.bzl", "bool_flag")\n\n'
-    )
+    """Generate features.bzl with the feature flag macro and the pregen config_setting_group macro.
 
-    if not features:
-        (constants_dir / "features.bzl").write_text(
-            loads
-            + "FEATURE_DEFINES = []\n\n"
-            + "def openssl_feature_flags():\n    pass\n\n"
-            + "def openssl_feature_config_settings():\n    pass\n\n"
-            + _render_pregen_config_settings_macro(known_platforms or [])
-        )
-        return
-
-    lines = [loads]
-
-    # FEATURE_DEFINES
-    blocks = []
-    for feature in features:
-        setting = _feature_to_setting_name(feature)
-        define = _feature_to_define(feature)
-        blocks.append(f'select({{\n    "//configs:{setting}": ["{define}"],\n    "//conditions:default": [],\n}})')
-    joined = " + \\\n    ".join(blocks)
-    lines.append(f"FEATURE_DEFINES = {joined}\n\n")
+    openssl_feature_flags() declares a no-<feature> bool_flag per feature and a
+    single openssl_feature_defines target (bazel/feature_defines.bzl) that
+    turns the set flags into -DOPENSSL_NO_* copts, so analysis evaluates no
+    config_setting or select() per feature.
 
-    # openssl_feature_flags macro (creates bool_flag targets in root BUILD)
+    The file is written as buildifier would format it, loading only the
+    symbols it uses.
+    """
+    known_platforms = known_platforms or []
+    lines = ["# Generated code. DO NOT EDIT.\n\n"]
+    if known_platforms:
+        lines.append('load("@bazel_skylib//lib:selects.bzl", "selects")\n')
+    if features:
+        lines.append('load("@bazel_skylib//rules:common_settings.bzl", "bool_flag")\n')
+    lines.append('load("//bazel:feature_defines.bzl", "openssl_feature_defines")\n\n')
+
+    # openssl_feature_flags macro (creates the flags and feature_defines in the root BUILD)
     lines.append("def openssl_feature_flags():\n")
     for feature in features:
         lines.append(
             f'    bool_flag(name = "no-{feature}", build_setting_default = False,'
             f' visibility = ["//visibility:public"])\n'
         )
-    lines.append("\n")
-
-    # openssl_feature_config_settings macro (creates config_settings in configs/)
-    lines.append("def openssl_feature_config_settings():\n")
-    for feature in features:
-        setting = _feature_to_setting_name(feature)
-        lines.append(
-            f"    native.config_setting(\n"
-            f'        name = "{setting}",\n'
-            f'        flag_values = {{"//:no-{feature}": "True"}},\n'
-            f'        visibility = ["//visibility:public"],\n'
-            f"    )\n"
-        )
-    lines.append("\n")
+    lines.append('    openssl_feature_defines(\n        name = "feature_defines",\n')
+    if features:
+        lines.append("        flags = {\n")
+        lines += [f'            "//:no-{feature}": "{_feature_to_define(feature)}",\n' for feature in features]
+        lines.append("        },\n")
+    else:
+        lines.append("        flags = {},\n")
+    lines.append("    )\n\n")
 
     # openssl_pregen_config_settings macro
-    lines.append(_render_pregen_config_settings_macro(known_platforms or []))
+    lines.append(_render_pregen_config_settings_macro(known_platforms))
 
-    (constants_dir / "features.bzl").write_text("".join(lines))
+    write_output(constants_dir / "features.bzl", "".join(lines))
 
 
 _WINDOWS_CONFIG_NAMES = frozenset({"windows_arm64", "windows_x64"})
@@ -1126,6 +1697,22 @@ def _render_pregen_config_settings_macro(known_platforms: list[str]) -> str:
         "    )\n"
     )
 
+    # _pregen_tree: pregen_hdrs is a directory artifact (see pregen_tree_includes).
+    lines.append(
+        "    native.config_setting(\n"
+        '        name = "_use_pregen_tree_artifacts",\n'
+        '        flag_values = {"//:use-pregen-tree-artifacts": "True"},\n'
+        '        visibility = ["//visibility:public"],\n'
+        "    )\n"
+    )
+    lines.append(
+        "    selects.config_setting_group(\n"
+        '        name = "_pregen_tree",\n'
+        '        match_all = [":_pregen_enabled", ":_use_pregen_tree_artifacts"],\n'
+        '        visibility = ["//visibility:public"],\n'
+        "    )\n"
+    )
+
     # _asm_<platform>: all known platforms, gated on no-asm-fallback=False.
     for platform in known_platforms:
         constraints = PLATFORM_CONSTRAINTS.get(platform)
@@ -1172,7 +1759,7 @@ def _render_pregen_config_settings_macro(known_platforms: list[str]) -> str:
             f"    native.config_setting(\n"
             f'        name = "_pregen_asm_{platform}",\n'
             f'        constraint_values = ["{os_label}", "{cpu_label}"],\n'
-            f'        flag_values = {{"//:use-pregenerated": "True", "//:use-no-asm-fallback": "False"}},\n'
+            f'        flag_values = {{"//:use-no-asm-fallback": "False", "//:use-pregenerated": "True"}},\n'
             f'        visibility = ["//visibility:public"],\n'
             f"    )\n"
         )
@@ -1180,11 +1767,330 @@ def _render_pregen_config_settings_macro(known_platforms: list[str]) -> str:
     return "".join(lines)
 
 
+def write_constants_bzl(
+    constants_dir: Path,
+    platform_data: dict[str, PlatformData],
+    no_asm_data: PlatformData,
+    perlasm_inputs: dict[str, PerlasmInputs],
+) -> None:
+    """Write the tiered source constants, per-platform deltas, perlasm inputs and feature flags into constants_dir."""
+    print("=== Computing tiered constants ===")
+    tiered = compute_tiered_constants(platform_data, no_asm_data)
+
+    print("=== Writing .bzl files ===")
+    constants_dir.mkdir(parents=True, exist_ok=True)
+    write_common_bzl(constants_dir, tiered)
+    write_no_asm_bzl(constants_dir, tiered)
+    write_constants_build(constants_dir)
+
+    for platform in ALL_PLATFORMS:
+        config_name = get_simple_config_name(platform)
+        write_platform_bzl(constants_dir, config_name, tiered["per_platform"][platform])
+    write_perlasm_inputs_bzl(constants_dir, perlasm_inputs)
+
+    # @disablables is identical across all platforms; take from any.
+    disablables = next(iter(platform_data.values())).disablables
+    user_features = get_user_features(disablables)
+
+    # Known platform config_names for pregen routing.
+    known_platforms = sorted(get_simple_config_name(p) for p in ALL_PLATFORMS)
+
+    print("=== Generating feature toggle flags ===")
+    write_features_bzl(constants_dir, user_features, known_platforms)
+
+
+def _configure_tasks(
+    openssl_dir: Path,
+    platforms: list[str],
+    platform_data: dict[str, PlatformData],
+    perl_path: str,
+    jobs: int,
+    cache_dir: Path | None,
+    perl_driver: bool,
+) -> tuple[list[Task], dict[str, str]]:
+    """Build the tasks that fill *platform_data*, and map each platform to the task producing it.
+
+    Every platform is its own task, so whatever needs only that platform can
+    start before the others are configured.  With ``jobs == 1`` Configure runs
+    in the source tree itself, so those tasks are chained; with *perl_driver*
+    a single task configures every target through configure_driver.pl.
+    """
+    inputs_digest = configure_inputs_digest(openssl_dir, perl_path) if cache_dir is not None else None
+
+    def _configure(targets: list[str]) -> None:
+        platform_data.update(
+            extract_all_platform_data(
+                openssl_dir,
+                targets,
+                perl_path=perl_path,
+                jobs=jobs,
+                cache_dir=cache_dir,
+                perl_driver=perl_driver,
+                inputs_digest=inputs_digest,
+            )
+        )
+
+    if perl_driver:
+        return [Task("configure", (), partial(_configure, platforms))], dict.fromkeys(platforms, "configure")
+
+    tasks: list[Task] = []
+    producers = {}
+    for platform in platforms:
+        deps = (tasks[-1].name,) if tasks and jobs <= 1 else ()
+        tasks.append(Task(f"configure:{platform}", deps, partial(_configure, [platform])))
+        producers[platform] = tasks[-1].name
+    return tasks, producers
+
+
+def _perlasm_tasks(
+    openssl_dir: Path,
+    flavors: list[str],
+    platform_data: dict[str, PlatformData],
+    producers: dict[str, str],
+    out: Path,
+    perl_path: str,
+    jobs: int,
+) -> list[Task]:
+    """Build one perlasm task per flavor, each waiting only on its source platform."""
+    flavors = [flavor for flavor in flavors if flavor in _PERLASM_FLAVORS]
+
+    def _perlasm(selected: list[str]) -> None:
+        sources = {_PERLASM_FLAVORS[flavor]["source_platform"] for flavor in selected}
+        pregenerate_perlasm(
+            openssl_dir,
+            {platform: platform_data[platform] for platform in sorted(sources)},
+            out,
+            perl_path=perl_path,
+            flavors=selected,
+            jobs=jobs,
+        )
+
+    def _deps(selected: list[str]) -> tuple[str, ...]:
+        return tuple(dict.fromkeys(producers[_PERLASM_FLAVORS[flavor]["source_platform"]] for flavor in selected))
+
+    return [Task(f"perlasm:{flavor}", _deps([flavor]), partial(_perlasm, [flavor])) for flavor in flavors]
+
+
+# ---------------------------------------------------------------------------
+# Incremental regeneration
+# ---------------------------------------------------------------------------
+
+# Overlay path -> repo file copied there verbatim.
+_OVERLAY_FILES = {
+    "BUILD.bazel": "BUILD.openssl.bazel",
+    "bazel/batch_dofile.pl": "batch_dofile.pl",
+    "bazel/build_test.cc": "build_test.cc",
+    "bazel/BUILD.bazel": "BUILD.bazel.bazel",
+    "configs/BUILD.bazel": "BUILD.configs.bazel",
+    "bazel/collate_into_directory.bzl": "collate_into_directory.bzl",
+    "bazel/collate_into_directory.cc": "collate_into_directory.cc",
+    "bazel/feature_defines.bzl": "feature_defines.bzl",
+    "bazel/openssl_genrule.bzl": "openssl_genrule.bzl",
+    "bazel/perl_genrule.bzl": "perl_genrule.bzl",
+    "bazel/pregen.bzl": "pregen.bzl",
+    "presubmit.yml": "presubmit.yml",
+    "bazel/redirect_stdout.cc": "redirect_stdout.cc",
+    "bazel/sha256_test.cc": "sha256_test.cc",
+    "bazel/utils.bzl": "utils.bzl",
+}
+
+
+class _Unit(NamedTuple):
+    """A piece of main()'s output tracked in the manifest (see manifest.py)."""
+
+    key: str
+    outputs: tuple[str, ...]
+    # Units that run Perl are skipped when up to date; the rest always rerun.
+    perl: bool
+    # Configure units keep their target's PlatformData in the manifest.
+    platform: str | None = None
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _default_manifest_path(out: Path) -> Path:
+    # Outside the overlay: write_bcr_files() publishes everything inside it.
+    out = out.resolve()
+    return out.parent / f"{out.name}.manifest.json"
+
+
+def _generator_digest(hasher: FileHasher, perl_path: str) -> str:
+    """Hash this generator's own scripts and templates, and the Perl version."""
+    here = script_dir()
+    files = [path for pattern in ("*.py", "*.pl", "*.in") for path in here.glob(pattern)]
+    return _digest(f"perl {_perl_version(perl_path)}", hasher.digest_tree(here, files))
+
+
+def _source_tree_files(openssl_dir: Path) -> list[Path]:
+    """List the OpenSSL source files, minus anything the generator itself writes there."""
+    files: list[Path] = []
+    for root, dirs, names in os.walk(openssl_dir):
+        if Path(root) == openssl_dir:
+            if "configdata" in dirs:
+                dirs.remove("configdata")
+            names = [name for name in names if name not in _CONFIGURE_OUTPUTS]
+        files += (Path(root) / name for name in names)
+    return files
+
+
+def _pipeline_units(
+    openssl_dir: Path,
+    platforms: list[str],
+    flavors: list[str],
+    perl_path: str,
+    hasher: FileHasher,
+) -> dict[str, _Unit]:
+    """Describe each unit of main()'s output: the key of its inputs and the files it owns.
+
+    Every key covers this generator's scripts and the Perl version, the
+    OpenSSL files the unit reads, and the keys of the Configure targets whose
+    results it uses.  Output labels are described in manifest.py.
+    """
+    generator = _generator_digest(hasher, perl_path)
+    sources = _source_tree_files(openssl_dir)
+    scripts = hasher.digest_tree(openssl_dir, (path for path in sources if path.suffix in (".pl", ".pm")))
+    der_dir = openssl_dir / "providers" / "common" / "der"
+    templates = hasher.digest_tree(
+        openssl_dir, (path for path in sources if path.suffix == ".in" or path.is_relative_to(der_dir))
+    )
+    configure_digest = configure_inputs_digest(openssl_dir, perl_path, hasher)
+
+    configure = {
+        platform: _digest(generator, _platform_cache_key(configure_digest, platform)) for platform in platforms
+    }
+    configured = _digest(*configure.values())
+    units = {
+        f"configure:{platform}": _Unit(key, (), perl=True, platform=platform) for platform, key in configure.items()
+    }
+    units["constants"] = _Unit(_digest(generator, scripts, configured), ("overlay:bazel/constants",), perl=False)
+    units["configdata_stubs"] = _Unit(_digest(generator, configured), ("overlay:configdata",), perl=False)
+    common_templates = [
+        f"pregen:generated/common/{template_out}"
+        for template_in, template_out in discover_dofile_templates(openssl_dir).items()
+        if template_in not in _PLATFORM_SPECIFIC_TEMPLATE_INPUTS
+    ]
+    units["templates"] = _Unit(
+        _digest(generator, scripts, templates, configured),
+        (*common_templates, *(f"pregen:generated/{get_simple_config_name(platform)}" for platform in platforms)),
+        perl=True,
+    )
+    units["progs"] = _Unit(
+        _digest(generator, scripts, configured),
+        ("pregen:generated/common/apps/progs.h", "pregen:generated/common/apps/progs.c"),
+        perl=True,
+    )
+    units["buildinf"] = _Unit(generator, ("pregen:generated/common/crypto/buildinf.h",), perl=False)
+    cc = os.environ.get("CC", "cc")
+    for flavor in flavors:
+        source = configure[_PERLASM_FLAVORS[flavor]["source_platform"]]
+        units[f"perlasm:{flavor}"] = _Unit(
+            _digest(generator, scripts, f"CC={cc}", flavor, source), (f"pregen:generated/asm/{flavor}",), perl=True
+        )
+    overlay_sources = [script_dir() / src for src in [*_OVERLAY_FILES.values(), "BUILD.pregen.bazel"]]
+    units["overlay"] = _Unit(
+        _digest(generator, hasher.digest_tree(script_dir(), overlay_sources)),
+        (
+            *(f"overlay:{dst}" for dst in _OVERLAY_FILES),
+            "overlay:bazel/pregen_index.bzl",
+            "overlay:bazel/dofile_costs.bzl",
+            "pregen:BUILD.bazel",
+            "pregen:WORKSPACE.bazel",
+        ),
+        perl=False,
+    )
+    return units
+
+
+def _unit_is_fresh(unit: _Unit, entry: dict[str, Any] | None, roots: dict[str, Path], hasher: FileHasher) -> bool:
+    if entry is None or entry["key"] != unit.key:
+        return False
+    if unit.platform is not None and "data" not in entry:
+        return False
+    return outputs_match(entry["outputs"], unit.outputs, roots, hasher)
+
+
+def _task_units(task: Task, units: dict[str, _Unit]) -> list[str]:
+    """Name the units *task* produces: its own, or every "<task>:..." one for the --perl_driver Configure task."""
+    if task.name in units:
+        return [task.name]
+    return [name for name in units if name.startswith(f"{task.name}:")]
+
+
+def _incremental_tasks(
+    tasks: list[Task],
+    units: dict[str, _Unit],
+    manifest: dict[str, Any],
+    roots: dict[str, Path],
+    hasher: FileHasher,
+    platform_data: dict[str, PlatformData],
+) -> list[Task]:
+    """Skip every task whose units all run Perl and are up to date in *manifest*.
+
+    A skipped Configure task restores its PlatformData from the manifest.
+    Every other task runs, writing its outputs through outputs.py, and then
+    removes whatever it produced last time but not this time.
+    """
+    entries: dict[str, Any] = manifest["tasks"]
+
+    def _skip(task: Task, names: list[str]) -> None:
+        for name in names:
+            platform = units[name].platform
+            if platform is not None:
+                platform_data[platform] = PlatformData.from_dict(entries[name]["data"])
+        print(f"  {task.name}: up to date")
+
+    def _rerun(task: Task, names: list[str]) -> None:
+        task.run()
+        for name in names:
+            labels = [*entries.get(name, {}).get("outputs", {}), *units[name].outputs]
+            prune_outputs(resolve(label, roots) for label in labels)
+
+    incremental = []
+    for task in tasks:
+        names = _task_units(task, units)
+        fresh = bool(names) and all(
+            units[name].perl and _unit_is_fresh(units[name], entries.get(name), roots, hasher) for name in names
+        )
+        incremental.append(task._replace(run=partial(_skip if fresh else _rerun, task, names)))
+    return incremental
+
+
+def _record_units(
+    units: dict[str, _Unit],
+    roots: dict[str, Path],
+    hasher: FileHasher,
+    platform_data: dict[str, PlatformData],
+) -> dict[str, Any]:
+    entries = {}
+    for name, unit in units.items():
+        entry: dict[str, Any] = {"key": unit.key, "outputs": record_outputs(unit.outputs, roots, hasher)}
+        if unit.platform is not None:
+            entry["data"] = platform_data[unit.platform].to_dict()
+        entries[name] = entry
+    return entries
+
+
+def _run_pipeline(tasks: list[Task], jobs: int) -> None:
+    """Run *tasks* with at most *jobs* Perl processes at once and report the critical path."""
+
+    def _traced(task: Task) -> None:
+        with span(task.name, "phase", {"deps": list(task.deps)}):
+            task.run()
+
+    timings = run_tasks([task._replace(run=partial(_traced, task)) for task in tasks], jobs)
+    print(format_critical_path(critical_path(tasks, timings)))
+
+
 def perlasm_only(
     openssl_source_dir: str,
     output_dir: str,
     flavors: list[str],
     perl_path: str = "perl",
+    jobs: int = 1,
+    cache_dir: str | None = None,
+    perl_driver: bool = False,
 ) -> None:
     """Generate only perlasm assembly for the requested flavors.
 
@@ -1198,16 +2104,23 @@ def perlasm_only(
     print(f"Using Perl: {perl_path}")
     print(f"Perlasm-only mode: flavors={flavors}")
 
-    source_platforms = {_PERLASM_FLAVORS[f]["source_platform"] for f in flavors if f in _PERLASM_FLAVORS}
+    source_platforms = sorted({_PERLASM_FLAVORS[f]["source_platform"] for f in flavors if f in _PERLASM_FLAVORS})
 
+    print("=== Configuring source platforms and pre-generating perlasm assembly ===")
     platform_data: dict[str, PlatformData] = {}
-    for sp in source_platforms:
-        print(f"  Configuring for {sp}...")
-        platform_data[sp] = extract_platform_data(openssl_dir, sp, perl_path=perl_path)
-
-    print("=== Pre-generating perlasm assembly ===")
-    pregenerate_perlasm(openssl_dir, platform_data, out, perl_path=perl_path, flavors=flavors)
+    tasks, producers = _configure_tasks(
+        openssl_dir,
+        source_platforms,
+        platform_data,
+        perl_path,
+        jobs,
+        Path(cache_dir) if cache_dir else None,
+        perl_driver,
+    )
+    tasks += _perlasm_tasks(openssl_dir, flavors, platform_data, producers, out, perl_path, jobs)
+    _run_pipeline(tasks, jobs)
 
+    print(format_output_counts())
     print("=== Done (perlasm-only) ===")
     print(f"Assembly written to: {out / 'generated' / 'asm'}")
 
@@ -1221,128 +2134,497 @@ def main(
     source_archive: str | None = None,
     perl_path: str = "perl",
     pregen_dir: str | None = None,
+    jobs: int = 1,
+    cache_dir: str | None = None,
+    perl_driver: bool = False,
+    manifest_path: str | None = None,
+    full: bool = False,
+    buildifier_mode: str = "fix",
+    shard: tuple[int, int] | None = None,
 ) -> None:
     openssl_dir = Path(openssl_source_dir)
     out = Path(output_dir)
+    pregen = Path(pregen_dir) if pregen_dir else out.parent / "pregen"
+    manifest_file = Path(manifest_path) if manifest_path else _default_manifest_path(out)
+    roots = {"overlay": out, "pregen": pregen}
 
     print(f"Using Perl: {perl_path}")
 
-    constants_dir = out / "bazel" / "constants"
-    constants_dir.mkdir(parents=True, exist_ok=True)
-
-    platform_data: dict[str, PlatformData] = {}
+    # Every phase is a task that starts once the data it needs exists: e.g.
+    # perlasm for a flavor only waits for its source platform's Configure.
+    platforms = ALL_PLATFORMS + [NO_ASM_TARGET]
+    flavors = _PREGEN_PERLASM_FLAVORS
+    # A --shard run makes only its parts of the pregen tree, configuring only
+    # the targets they need; merge() writes the overlay from all the shards.
+    parts: tuple[str, ...] | None = None
+    if shard is not None:
+        if bcr_dir:
+            raise RuntimeError("--bcr_dir cannot be used with --shard; pass it to merge instead")
+        index, count = shard
+        parts = shard_plan(_shard_parts(), count)[index]
+        platforms = _shard_platforms(parts)
+        flavors = [flavor for flavor in flavors if f"asm_{flavor}" in parts]
+        print(f"Shard {index}/{count}: {', '.join(parts)}")
+    results: dict[str, PlatformData] = {}
+    config_profiles: dict[str, _ConfigProfile] = {}
+
+    # Perl phases whose inputs and outputs are unchanged since the run that
+    # wrote the manifest are skipped.
+    manifest = {"tasks": {}, "files": {}} if full else load_manifest(manifest_file)
+    hasher = FileHasher(manifest["files"])
+    with span("hash inputs", "phase"):
+        # Keys are those of the whole run, so merged shards record the same manifest.
+        all_units = _pipeline_units(
+            openssl_dir, ALL_PLATFORMS + [NO_ASM_TARGET], _PREGEN_PERLASM_FLAVORS, perl_path, hasher
+        )
+    units = all_units if parts is None else _shard_units(all_units, parts, platforms)
 
-    print("=== Extracting source lists for all platforms ===")
-    for platform in ALL_PLATFORMS:
-        config_name = get_simple_config_name(platform)
-        print(f"  Configuring for {platform} ({config_name})...")
-        data = extract_platform_data(openssl_dir, platform, perl_path=perl_path)
-        platform_data[platform] = data
+    def _platform_data() -> dict[str, PlatformData]:
+        return {platform: results[platform] for platform in ALL_PLATFORMS if platform in results}
 
-    print("  Configuring for no-asm fallback...")
-    no_asm_data = extract_platform_data(openssl_dir, NO_ASM_TARGET, perl_path=perl_path)
+    def _perlasm_inputs() -> dict[str, PerlasmInputs]:
+        return scan_perlasm_inputs(openssl_dir, _perlasm_scripts(results.values()))
 
-    print("=== Computing tiered constants ===")
-    tiered = compute_tiered_constants(platform_data, no_asm_data)
+    def _write_constants() -> None:
+        write_constants_bzl(out / "bazel" / "constants", _platform_data(), results[NO_ASM_TARGET], _perlasm_inputs())
 
-    print("=== Writing .bzl files ===")
-    write_common_bzl(constants_dir, tiered)
-    write_no_asm_bzl(constants_dir, tiered)
-    write_constants_build(constants_dir)
+    def _write_configdata_stubs() -> None:
+        print("=== Generating per-platform configdata stubs ===")
+        config_profiles.update(generate_configdata_stubs(_platform_data(), results.get(NO_ASM_TARGET), out))
 
-    for platform in ALL_PLATFORMS:
-        config_name = get_simple_config_name(platform)
-        write_platform_bzl(constants_dir, config_name, tiered["per_platform"][platform])
+    def _pregenerate_templates() -> None:
+        print("=== Pre-generating template outputs ===")
+        pregenerate_templates(
+            openssl_dir,
+            config_profiles,
+            out / "configdata",
+            pregen,
+            perl_path=perl_path,
+            config_names=parts,
+            common=parts is None or COMMON in parts,
+        )
 
-    # @disablables is identical across all platforms; take from any.
-    disablables = next(iter(platform_data.values())).disablables
-    user_features = get_user_features(disablables)
+    def _pregenerate_progs() -> None:
+        # Place configdata in the source tree so $_repo_root resolves correctly.
+        any_config = get_simple_config_name(ALL_PLATFORMS[0])
+        try:
+            local_configdata = _place_configdata_in_source(
+                openssl_dir,
+                out / "configdata" / any_config,
+                any_config,
+            )
+            print("=== Pre-generating progs.h/progs.c ===")
+            pregenerate_progs(openssl_dir, pregen, local_configdata, perl_path=perl_path)
+        finally:
+            _cleanup_source_configdata(openssl_dir)
+
+    def _generate_buildinf_h() -> None:
+        print("=== Pre-generating buildinf.h ===")
+        generate_buildinf_h(pregen)
+
+    print("=== Running generation pipeline ===")
+    tasks, producers = _configure_tasks(
+        openssl_dir,
+        platforms,
+        results,
+        perl_path,
+        jobs,
+        Path(cache_dir) if cache_dir else None,
+        perl_driver,
+    )
+    configured = tuple(dict.fromkeys(producers.values()))
+    tasks += [
+        Task("constants", configured, _write_constants),
+        Task("configdata_stubs", configured, _write_configdata_stubs),
+        Task("templates", ("configdata_stubs",), _pregenerate_templates),
+        # progs.pl runs from the same in-tree configdata stubs that the
+        # templates task places and removes, so the two must not overlap.
+        Task("progs", ("templates",), _pregenerate_progs),
+        Task("buildinf", (), _generate_buildinf_h),
+    ]
+    if parts is not None:
+        # Only the phases with outputs in this shard run, plus the stubs the templates need.
+        tasks = [task for task in tasks if task.name == "configdata_stubs" or _task_units(task, units)]
+    tasks += _perlasm_tasks(
+        openssl_dir,
+        flavors,
+        results,
+        producers,
+        pregen,
+        perl_path,
+        jobs,
+    )
+    _run_pipeline(_incremental_tasks(tasks, units, manifest, roots, hasher, results), jobs)
+    if not manifest["tasks"]:
+        # Nothing was known about the files already there, so every task ran;
+        # whatever none of them produced is stale.
+        prune_outputs([pregen / "generated"])
+
+    if shard is None:
+        prune_outputs([pregen / SHARD_RECORD])
+        _finish_overlay(out, pregen, units, results, hasher, manifest_file, buildifier_path, buildifier_mode, jobs)
+        _write_bcr(out, bcr_dir, tag, source_archive, jobs)
+    else:
+        index, count = shard
+        with span("manifest", "phase"):
+            save_manifest(manifest_file, _record_units(units, roots, hasher, results), hasher)
+            record = shard_record(
+                index,
+                count,
+                shard_plan(_shard_parts(), count)[index],
+                {name: unit._asdict() for name, unit in all_units.items()},
+                {platform: data.to_dict() for platform, data in results.items()},
+                {script: inputs._asdict() for script, inputs in _perlasm_inputs().items()},
+                pregen,
+                hasher.digest,
+            )
+            write_output(pregen / SHARD_RECORD, record)
+        print(f"Manifest written to: {manifest_file}")
 
-    # Known platform config_names for pregen routing.
-    known_platforms = sorted(get_simple_config_name(p) for p in ALL_PLATFORMS)
+    print(format_output_counts())
+    print("=== Done ===")
+    print(f"Overlay written to: {out}" if shard is None else f"Shard written to: {pregen}")
 
-    print("=== Generating feature toggle flags ===")
-    write_features_bzl(constants_dir, user_features, known_platforms)
 
-    print("=== Generating per-platform configdata stubs ===")
-    generate_configdata_stubs(platform_data, no_asm_data, out)
+# Pre-generated files that are not the output of a dofile template.
+_NOT_DOFILE_OUTPUTS = frozenset({"apps/progs.c", "apps/progs.h", "crypto/buildinf.h"})
 
-    print("=== Pre-generating template outputs ===")
-    pregenerate_templates(openssl_dir, platform_data, out, perl_path=perl_path)
 
-    # Place configdata in the source tree so $_repo_root resolves correctly.
-    any_config = get_simple_config_name(next(iter(platform_data)))
-    try:
-        local_configdata = _place_configdata_in_source(
-            openssl_dir,
-            out / "configdata" / any_config,
-            any_config,
-        )
-        print("=== Pre-generating progs.h/progs.c ===")
-        pregenerate_progs(openssl_dir, out, local_configdata, perl_path=perl_path)
-    finally:
-        _cleanup_source_configdata(openssl_dir)
+def render_dofile_costs_bzl(index: PregenIndex, blob_paths: Mapping[str, Path]) -> str:
+    """Render bazel/dofile_costs.bzl, already formatted as buildifier would.
 
-    print("=== Pre-generating buildinf.h ===")
-    generate_buildinf_h(out)
+    The cost of a template is the size of its output, the largest across
+    config_names for the platform-specific ones.  Sizes rather than timings keep
+    the overlay reproducible, and dofile.pl's time grows with the text it emits.
+    """
+    costs: dict[str, int] = {}
+    for part, files in index.items():
+        if part.startswith("asm_"):
+            continue
+        for canonical, blob in files.items():
+            if canonical not in _NOT_DOFILE_OUTPUTS:
+                costs[canonical] = max(costs.get(canonical, 0), blob_paths[blob].stat().st_size)
+    lines = [
+        '"""Generated code. DO NOT EDIT.',
+        "",
+        "Maps the output path of every dofile template to the size in bytes of its",
+        "pre-generated output, which openssl_genrule balances its batches by.",
+        '"""',
+        "",
+    ]
+    if not costs:
+        lines.append("DOFILE_COSTS = {}")
+    else:
+        lines.append("DOFILE_COSTS = {")
+        lines += [f'    "{canonical}": {cost},' for canonical, cost in sorted(costs.items())]
+        lines.append("}")
+    return "\n".join(lines) + "\n"
 
-    print("=== Pre-generating perlasm assembly ===")
-    pregenerate_perlasm(openssl_dir, platform_data, out, perl_path=perl_path)
 
-    # Move generated/ to a separate pregen directory so the overlay stays small.
-    pregen = Path(pregen_dir) if pregen_dir else out.parent / "pregen"
+def _finish_overlay(
+    out: Path,
+    pregen: Path,
+    units: dict[str, _Unit],
+    platform_data: dict[str, PlatformData],
+    hasher: FileHasher,
+    manifest_file: Path,
+    buildifier_path: str,
+    buildifier_mode: str,
+    jobs: int,
+) -> None:
+    """Write the static overlay and pregen files around the generated ones, and record *units* in the manifest."""
+    # generated/ goes to a separate pregen directory so the overlay stays small.
     pregen.mkdir(parents=True, exist_ok=True)
-    generated_src = out / "generated"
-    if generated_src.exists():
-        generated_dst = pregen / "generated"
-        if generated_dst.exists():
-            shutil.rmtree(generated_dst)
-        shutil.move(str(generated_src), str(generated_dst))
     copy_from_here_to("BUILD.pregen.bazel", pregen / "BUILD.bazel")
-    (pregen / "WORKSPACE.bazel").write_text('workspace(name = "openssl_pregen")\n')
+    write_output(pregen / "WORKSPACE.bazel", 'workspace(name = "openssl_pregen")\n')
     print(f"Pregen files written to: {pregen}")
 
     # Overlay root = out. All overlay files go under out for correct load paths.
     overlay_dir = out
-    copy_from_here_to("BUILD.openssl.bazel", overlay_dir / "BUILD.bazel")
-
-    (overlay_dir / "bazel").mkdir(parents=True, exist_ok=True)
-    copy_from_here_to("batch_dofile.pl", overlay_dir / "bazel" / "batch_dofile.pl")
-    copy_from_here_to("build_test.cc", overlay_dir / "bazel" / "build_test.cc")
-    copy_from_here_to("BUILD.bazel.bazel", overlay_dir / "bazel" / "BUILD.bazel")
-    copy_from_here_to("BUILD.configs.bazel", overlay_dir / "configs" / "BUILD.bazel")
-    copy_from_here_to("collate_into_directory.bzl", overlay_dir / "bazel" / "collate_into_directory.bzl")
-    copy_from_here_to("collate_into_directory.cc", overlay_dir / "bazel" / "collate_into_directory.cc")
-    copy_from_here_to("openssl_genrule.bzl", overlay_dir / "bazel" / "openssl_genrule.bzl")
-    copy_from_here_to("perl_genrule.bzl", overlay_dir / "bazel" / "perl_genrule.bzl")
-    copy_from_here_to("pregen.bzl", overlay_dir / "bazel" / "pregen.bzl")
-    copy_from_here_to("presubmit.yml", overlay_dir / "presubmit.yml")
-    copy_from_here_to("redirect_stdout.cc", overlay_dir / "bazel" / "redirect_stdout.cc")
-    copy_from_here_to("sha256_test.cc", overlay_dir / "bazel" / "sha256_test.cc")
-    copy_from_here_to("utils.bzl", overlay_dir / "bazel" / "utils.bzl")
-
-    (overlay_dir / "configs").mkdir(parents=True, exist_ok=True)
+    with span("overlay", "phase"):
+        for dst, src in _OVERLAY_FILES.items():
+            copy_from_here_to(src, overlay_dir / dst)
+        index, blob_paths = build_index(pregen, hasher.digest)
+        write_output(overlay_dir / "bazel" / "pregen_index.bzl", render_index_bzl(index))
+        write_output(overlay_dir / "bazel" / "dofile_costs.bzl", render_dofile_costs_bzl(index, blob_paths))
 
     if buildifier_path:
-        print("=== Formatting with buildifier ===")
-        subprocess.run(
-            [buildifier_path, "-lint=fix", "-mode=fix", "-r", str(out)],
-            check=True,
-        )
+        print(f"=== Running buildifier ({buildifier_mode}) on generated Starlark ===")
+        with span("buildifier", "phase"):
+            run_buildifier(buildifier_path, _generated_starlark(out), buildifier_mode, jobs)
 
+    with span("manifest", "phase"):
+        roots = {"overlay": out, "pregen": pregen}
+        save_manifest(manifest_file, _record_units(units, roots, hasher, platform_data), hasher)
+    print(f"Manifest written to: {manifest_file}")
+
+
+def _write_bcr(out: Path, bcr_dir: str | None, tag: str | None, source_archive: str | None, jobs: int) -> None:
     if bcr_dir and tag:
         if not source_archive:
             raise RuntimeError(
                 "--source_archive is required when generating BCR files (--bcr_dir and --tag were provided)"
             )
-        write_bcr_files(out, bcr_dir, tag, source_archive)
+        with span("bcr", "phase"):
+            write_bcr_files(out, bcr_dir, tag, source_archive, jobs)
 
-    print("=== Done ===")
+
+# ---------------------------------------------------------------------------
+# Sharded generation (see shards.py)
+# ---------------------------------------------------------------------------
+
+
+def _shard_parts() -> list[str]:
+    """Return every pregen part in the order shard_plan() deals them out: the costliest, perlasm, first."""
+    configs = [get_simple_config_name(platform) for platform in ALL_PLATFORMS + [NO_ASM_TARGET]]
+    return [f"asm_{flavor}" for flavor in _PREGEN_PERLASM_FLAVORS] + [COMMON] + configs
+
+
+def _shard_platforms(parts: Collection[str]) -> list[str]:
+    """Return the Configure targets that the pregen *parts* are generated from."""
+    needed = set()
+    for part in parts:
+        if part == COMMON:
+            # The invariant templates and progs use its configdata stub.
+            needed.add(ALL_PLATFORMS[0])
+        elif part.startswith("asm_"):
+            needed.add(_PERLASM_FLAVORS[part.removeprefix("asm_")]["source_platform"])
+        else:
+            needed.update(p for p in ALL_PLATFORMS + [NO_ASM_TARGET] if get_simple_config_name(p) == part)
+    return [platform for platform in ALL_PLATFORMS + [NO_ASM_TARGET] if platform in needed]
+
+
+def _shard_units(units: dict[str, _Unit], parts: Collection[str], platforms: Collection[str]) -> dict[str, _Unit]:
+    """Narrow *units* to what a --shard run makes: its Configure targets and its pregen parts."""
+    narrowed = {}
+    for name, unit in units.items():
+        if unit.platform is not None:
+            if unit.platform in platforms:
+                narrowed[name] = unit
+            continue
+        outputs = tuple(label for label in unit.outputs if label_part(label) in parts)
+        if outputs:
+            narrowed[name] = unit._replace(outputs=outputs)
+    return narrowed
+
+
+def _missing_outputs(
+    units: dict[str, _Unit], platform_data: dict[str, PlatformData], files: Collection[str]
+) -> list[str]:
+    """Compare the merged pregen *files* (relative to the pregen dir) with what a whole run produces."""
+    errors = []
+    for name, unit in units.items():
+        for label in unit.outputs:
+            if label_part(label) is None:
+                continue
+            rel = label.partition(":")[2]
+            if not any(file == rel or file.startswith(f"{rel}/") for file in files):
+                errors.append(f"No shard produced {rel} ({name})")
+
+    for flavor in _PREGEN_PERLASM_FLAVORS:
+        prefix = f"generated/asm/{flavor}/"
+        data = platform_data.get(_PERLASM_FLAVORS[flavor]["source_platform"])
+        expected = {prefix + output for _, output in _parse_perlasm_commands(data.perlasm_gen_commands if data else [])}
+        actual = {file for file in files if file.startswith(prefix)}
+        errors += [f"No shard produced {file}" for file in sorted(expected - actual)]
+        errors += [f"{file} is not an output of the {flavor} perlasm scripts" for file in sorted(actual - expected)]
+
+    # Every config_name gets the same platform-specific templates.
+    configs = [get_simple_config_name(platform) for platform in ALL_PLATFORMS + [NO_ASM_TARGET]]
+    templates = {
+        config: {file.removeprefix(f"generated/{config}/") for file in files if file.startswith(f"generated/{config}/")}
+        for config in configs
+    }
+    errors += [
+        f"generated/{config} and generated/{configs[0]} hold different templates"
+        for config in configs[1:]
+        if templates[config] != templates[configs[0]]
+    ]
+    return errors
+
+
+def merge(
+    shard_dirs: Sequence[str],
+    output_dir: str,
+    bcr_dir: str | None,
+    tag: str | None,
+    buildifier_path: str,
+    source_archive: str | None = None,
+    pregen_dir: str | None = None,
+    override_dirs: Sequence[str] = (),
+    jobs: int = 1,
+    manifest_path: str | None = None,
+    buildifier_mode: str = "fix",
+) -> None:
+    """Combine the pregen directories of every --shard run into what main() would have written.
+
+    *override_dirs* are --perlasm-only output directories: each perlasm flavor
+    in one replaces the shards' assembly for that flavor, as the platform-native
+    CI runners do for macOS.  Nothing is written unless the shards add up to
+    one run (see check_shards()) holding every file a whole run produces.
+    """
+    out = Path(output_dir)
+    pregen = Path(pregen_dir) if pregen_dir else out.parent / "pregen"
+    manifest_file = Path(manifest_path) if manifest_path else _default_manifest_path(out)
+
+    print(f"=== Checking {len(shard_dirs)} shards ===")
+    shards = [load_shard(Path(shard_dir)) for shard_dir in shard_dirs]
+    errors = check_shards(shards, _shard_parts())
+    files = {rel: shard.root / rel for shard in shards for rel in shard.files}
+    overridden: dict[str, Path] = {}
+    for override in map(Path, override_dirs):
+        asm_dir = override / "generated" / "asm"
+        flavors = sorted(path.name for path in asm_dir.iterdir() if path.is_dir()) if asm_dir.is_dir() else []
+        if not flavors:
+            errors.append(f"{override}: no perlasm output under generated/asm")
+        for flavor in flavors:
+            if flavor not in _PREGEN_PERLASM_FLAVORS:
+                errors.append(f"{override}: {flavor} is not a pre-generated perlasm flavor")
+                continue
+            if flavor in overridden:
+                errors.append(f"{override} and {overridden[flavor]} both override {flavor}")
+                continue
+            overridden[flavor] = override
+            prefix = f"generated/asm/{flavor}/"
+            files = {rel: path for rel, path in files.items() if not rel.startswith(prefix)}
+            files.update((rel, override / rel) for rel in generated_files(override) if rel.startswith(prefix))
+    if errors:
+        raise RuntimeError("Cannot merge the shards:\n  " + "\n  ".join(errors))
+
+    results = {
+        platform: PlatformData.from_dict(data) for shard in shards for platform, data in shard.platform_data.items()
+    }
+    units = {
+        name: _Unit(entry["key"], tuple(entry["outputs"]), entry["perl"], entry["platform"])
+        for name, entry in shards[0].units.items()
+    }
+    errors = _missing_outputs(units, results, files.keys())
+    if errors:
+        raise RuntimeError("The shards do not add up to a whole run:\n  " + "\n  ".join(errors))
+    for flavor, override in overridden.items():
+        print(f"  asm_{flavor}: from {override}")
+
+    print(f"=== Merging {len(files)} pregen files ===")
+    with span("merge", "phase"):
+        for rel, path in sorted(files.items()):
+            link_output(path, pregen / rel)
+        prune_outputs([pregen / "generated", pregen / SHARD_RECORD])
+
+    platform_data = {platform: results[platform] for platform in ALL_PLATFORMS}
+    perlasm_inputs = {
+        script: PerlasmInputs(tuple(inputs["files"]), inputs["cc"])
+        for shard in shards
+        for script, inputs in shard.perlasm_inputs.items()
+    }
+    write_constants_bzl(out / "bazel" / "constants", platform_data, results[NO_ASM_TARGET], perlasm_inputs)
+    print("=== Generating per-platform configdata stubs ===")
+    generate_configdata_stubs(platform_data, results[NO_ASM_TARGET], out)
+    hasher = FileHasher(load_manifest(manifest_file)["files"])
+    _finish_overlay(out, pregen, units, results, hasher, manifest_file, buildifier_path, buildifier_mode, jobs)
+    _write_bcr(out, bcr_dir, tag, source_archive, jobs)
+
+    print(format_output_counts())
+    print("=== Done (merge) ===")
     print(f"Overlay written to: {out}")
 
 
-def write_bcr_files(out: Path, bcr_dir: str, tag: str, source_archive: str) -> None:
-    """Write BCR module files. Overlay root is out (contains BUILD.bazel, bazel/, configs/, etc.)."""
+def _generated_starlark(out: Path) -> list[Path]:
+    """Return the Starlark files main() writes; the rest of the overlay is copied already formatted."""
+    constants_dir = out / "bazel" / "constants"
+    return sorted(constants_dir.iterdir()) + [out / "bazel" / "dofile_costs.bzl", out / "bazel" / "pregen_index.bzl"]
+
+
+def run_buildifier(buildifier_path: str, files: Sequence[Path], mode: str, jobs: int) -> None:
+    """Run buildifier on *files*, split into up to *jobs* concurrent batches.
+
+    The emitters already write what buildifier would, so with *mode* "fix" this
+    is a safety net, and with "check" it fails if any file would be reformatted.
+    Buildifier only applies lint fixes in fix mode; check mode checks formatting alone.
+    """
+    batches = [files[i :: max(jobs, 1)] for i in range(min(max(jobs, 1), len(files)))]
+    lint = "-lint=fix" if mode == "fix" else "-lint=off"
+
+    def _run(batch: Sequence[Path]) -> int:
+        cmd = [buildifier_path, lint, f"-mode={mode}", *(str(path) for path in batch)]
+        return _run_process("buildifier", "buildifier", cmd).returncode
+
+    if any(_parallel_map(_run, batches, jobs)):
+        raise RuntimeError(f"buildifier -mode={mode} failed on the generated Starlark; see its output above")
+
+
+def check(
+    openssl_source_dir: str,
+    output_dir: str,
+    perl_path: str = "perl",
+    pregen_dir: str | None = None,
+    manifest_path: str | None = None,
+) -> bool:
+    """Report whether main() would regenerate anything, without running any of it.
+
+    Compares the inputs and outputs recorded in the manifest with the current
+    ones; unchanged files are recognised by size and mtime, so this takes
+    about as long as a stat() of each file.
+    """
+    openssl_dir = Path(openssl_source_dir)
+    out = Path(output_dir)
+    pregen = Path(pregen_dir) if pregen_dir else out.parent / "pregen"
+    manifest_file = Path(manifest_path) if manifest_path else _default_manifest_path(out)
+    roots = {"overlay": out, "pregen": pregen}
+
+    manifest = load_manifest(manifest_file)
+    hasher = FileHasher(manifest["files"])
+    units = _pipeline_units(openssl_dir, ALL_PLATFORMS + [NO_ASM_TARGET], _PREGEN_PERLASM_FLAVORS, perl_path, hasher)
+    stale = [
+        name for name, unit in units.items() if not _unit_is_fresh(unit, manifest["tasks"].get(name), roots, hasher)
+    ]
+    for name in stale:
+        print(f"Out of date: {name}")
+    if not stale:
+        print(f"Up to date: {out} and {pregen} match {manifest_file}")
+    return not stale
+
+
+def _pregen_archive_parts() -> list[str]:
+    """Return every pregen archive part besides the common one (see pregen_index.py).
+
+    patch_bcr_pregen.py writes one archive per config_name and pre-generated
+    perlasm flavor, so a build only fetches the parts its platform selects.
+    """
+    configs = sorted(get_simple_config_name(platform) for platform in ALL_PLATFORMS) + ["no_asm"]
+    return configs + [f"asm_{flavor}" for flavor in _PREGEN_PERLASM_FLAVORS]
+
+
+_PREGEN_PART_BUILD_FILE = 'load("@openssl//bazel:pregen.bzl", "pregen_filegroups")\n\npregen_filegroups()\n'
+
+
+def _render_pregen_http_archive(tag: str, part: str | None) -> str:
+    """Render the http_archive for one part of the pregen archive (the common part if *part* is None).
+
+    Integrities are left as placeholders for patch_bcr_pregen.py to fill in.
+    """
+    name = f"openssl_pregen_{part}" if part else "openssl_pregen"
+    archive = f"bazel-openssl-cc-{tag}-{part}.tar.gz" if part else f"bazel-openssl-cc-{tag}.tar.gz"
+    lines = [
+        "http_archive(",
+        f'    name = "{name}",',
+        "    urls = [",
+        f'        "https://github.com/raccoons-build/bazel-openssl-cc/releases/download/{tag}/{archive}",',
+        "    ],",
+        f'    integrity = "{f"PLACEHOLDER:{part}" if part else "PLACEHOLDER"}",',
+        '    strip_prefix = "pregen",',
+    ]
+    if part:
+        lines.append(f"    build_file_content = {json.dumps(_PREGEN_PART_BUILD_FILE)},")
+    lines.append(")")
+    return "\n".join(lines) + "\n"
+
+
+def write_bcr_files(out: Path, bcr_dir: str, tag: str, source_archive: str, jobs: int = 1) -> None:
+    """Write BCR module files. Overlay root is out (contains BUILD.bazel, bazel/, configs/, etc.).
+
+    The overlay is copied (hardlinked where possible) and hashed on up to *jobs*
+    threads, and the hashes are left in OVERLAY_HASHES for patch_bcr_pregen.py.
+    """
     openssl_module_dir = Path(bcr_dir) / "modules" / "openssl"
     out_dir = openssl_module_dir / tag
 
@@ -1365,16 +2647,10 @@ def write_bcr_files(out: Path, bcr_dir: str, tag: str, source_archive: str) -> N
             "@bazel_tools//tools/build_defs/repo:http.bzl",
             "http_archive",
         )
-
-        http_archive(
-            name = "openssl_pregen",
-            urls = [
-                "https://github.com/raccoons-build/bazel-openssl-cc/releases/download/{tag}/bazel-openssl-cc-{tag}.tar.gz",
-            ],
-            integrity = "PLACEHOLDER",
-            strip_prefix = "pregen",
-        )
     """)
+    module_bazel_content += "\n" + _render_pregen_http_archive(tag, None)
+    for part in _pregen_archive_parts():
+        module_bazel_content += "\n" + _render_pregen_http_archive(tag, part)
 
     module_path = out_dir / "MODULE.bazel"
     module_path.parent.mkdir(parents=True, exist_ok=True)
@@ -1385,22 +2661,23 @@ def write_bcr_files(out: Path, bcr_dir: str, tag: str, source_archive: str) -> N
         overlay_module.unlink()
     shutil.copy2(module_path, overlay_module)
 
-    overlay_info: dict[str, str] = {}
+    rels: list[str] = []
     overlay_dst = out_dir / "overlay"
     for root, dirs, files in os.walk(out):
         # generated/ has been moved to the pregen archive; skip if still present.
         if "generated" in dirs:
             dirs.remove("generated")
-        for file in files:
-            full_path = Path(root) / file
-            rel = os.path.relpath(full_path, out)
-            overlay_info[rel] = integrity_hash(full_path)
-            dst = overlay_dst / rel
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(full_path, dst)
+        rels += (os.path.relpath(Path(root) / file, out) for file in files)
+
+    # Each file is read once, to be hashed while it is linked or copied.
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        source_integrity = pool.submit(integrity_hash, Path(source_archive))
+        hashes = dict(zip(rels, pool.map(lambda rel: copy_and_hash(out / rel, overlay_dst / rel), rels)))
+    save_overlay_hashes(out_dir / OVERLAY_HASHES, hashes)
+    overlay_info = {rel: integrity for rel, (integrity, _, _) in hashes.items()}
 
     source_json = {
-        "integrity": integrity_hash(Path(source_archive)),
+        "integrity": source_integrity.result(),
         "url": f"https://github.com/openssl/openssl/releases/download/openssl-{OPENSSL_VERSION}/openssl-{OPENSSL_VERSION}.tar.gz",
         "strip_prefix": f"openssl-{OPENSSL_VERSION}",
         "overlay": overlay_info,
@@ -1419,7 +2696,84 @@ def add_to_metadata(openssl_module_dir: Path, tag: str) -> None:
         f.write(json.dumps(content, sort_keys=True, indent="  ") + "\n")
 
 
+def _shard_arg(value: str) -> tuple[int, int]:
+    index, _, count = value.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {value!r}") from None
+    if not 0 <= shard[0] < shard[1]:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {shard[1]}), got {value!r}")
+    return shard
+
+
+def _merge_cli(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog="generate_constants.py merge",
+        description="Check and combine the pregen directories of --shard runs into the overlay and pregen tree",
+    )
+    parser.add_argument(
+        "--shard",
+        action="append",
+        required=True,
+        dest="shards",
+        help="Pregen directory of a --shard run; pass once per shard",
+    )
+    parser.add_argument(
+        "--override",
+        action="append",
+        default=[],
+        help="Output directory of a --perlasm-only run whose flavors replace the shards' assembly",
+    )
+    parser.add_argument("--output_dir", required=True, help="Output directory for the overlay")
+    parser.add_argument(
+        "--pregen_dir",
+        default=None,
+        help="Output directory for the merged pre-generated files (default: <output_dir>/../pregen)",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Manifest to write (default: <output_dir>.manifest.json next to <output_dir>)",
+    )
+    parser.add_argument("--bcr_dir", required=False, help="BCR directory for module registration")
+    parser.add_argument("--tag", required=False, help="Version tag for BCR")
+    parser.add_argument("--source_archive", required=False, help="Path to source tarball for BCR integrity hash")
+    parser.add_argument(
+        "--buildifier",
+        default=None,
+        help="Path to buildifier (auto-detected from Bazel toolchain or PATH if omitted; pass empty string to skip)",
+    )
+    parser.add_argument(
+        "--buildifier_mode",
+        choices=["fix", "check"],
+        default="fix",
+        help="Whether buildifier fixes the generated Starlark or fails if it is not already formatted",
+    )
+    parser.add_argument("--jobs", type=int, default=1, help="Threads for buildifier and the BCR overlay")
+    args = parser.parse_args(argv)
+    buildifier = _resolve_buildifier(args.buildifier)
+    print(f"Resolved buildifier: {buildifier or '(skipped)'}")
+    merge(
+        args.shards,
+        args.output_dir,
+        args.bcr_dir,
+        args.tag,
+        buildifier,
+        args.source_archive,
+        pregen_dir=args.pregen_dir,
+        override_dirs=args.override,
+        jobs=args.jobs,
+        manifest_path=args.manifest,
+        buildifier_mode=args.buildifier_mode,
+    )
+
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["merge"]:
+        _merge_cli(sys.argv[2:])
+        sys.exit(0)
+
     parser = argparse.ArgumentParser(description="Generate tiered OpenSSL Bazel constants")
     parser.add_argument("--openssl_source_dir", required=True, help="Path to OpenSSL source tree")
     parser.add_argument("--output_dir", required=True, help="Output directory for generated files")
@@ -1430,6 +2784,12 @@ if __name__ == "__main__":
         default=None,
         help="Path to buildifier (auto-detected from Bazel toolchain or PATH if omitted; pass empty string to skip)",
     )
+    parser.add_argument(
+        "--buildifier_mode",
+        choices=["fix", "check"],
+        default="fix",
+        help="Whether buildifier fixes the generated Starlark or fails if it is not already formatted",
+    )
     parser.add_argument("--source_archive", required=False, help="Path to source tarball for BCR integrity hash")
     parser.add_argument(
         "--perl",
@@ -1449,26 +2809,119 @@ if __name__ == "__main__":
         "Only runs perlasm pre-generation for the specified flavors, "
         "then exits. Used by platform-native CI runners.",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Maximum number of Perl processes (Configure, templates, perlasm scripts) to run at once "
+        "across the pipeline. Values above 1 configure each target in its own hardlinked copy of the "
+        "source tree instead of in place.",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory for caching per-target Configure/extract_srcs.pl results, keyed by a hash "
+        "of their inputs. Unchanged targets skip Configure entirely.",
+    )
+    parser.add_argument(
+        "--perl_driver",
+        action="store_true",
+        help="Configure all targets from one resident Perl process (configure_driver.pl) that forks "
+        "per target, instead of starting perl twice per target. Requires a host with fork().",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Manifest of the inputs and outputs of the last run, used to skip up-to-date Perl phases "
+        "(default: <output_dir>.manifest.json next to <output_dir>)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the manifest and regenerate everything",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_shard_arg,
+        default=None,
+        help="Generate only shard i of N (e.g. 0/3) of the pregen tree, configuring only the targets it "
+        "needs, and record it for the merge subcommand. Run every shard, then 'merge' their pregen "
+        "directories into the overlay, pregen tree and manifest.",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only check the overlay and pregen files against the manifest, without running anything. "
+        "Exits 1 and lists the out-of-date phases if any.",
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="Write a Chrome trace (chrome://tracing, Perfetto) of every phase and Perl process to this file",
+    )
+    parser.add_argument(
+        "--stats",
+        default=None,
+        help="Write the wall time, CPU time and peak RSS of every process, and their totals by phase and "
+        "perlasm flavor, to this JSON file",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Number of most expensive processes listed in the usage report printed at the end",
+    )
     args = parser.parse_args()
     perl = _resolve_perl(args.perl)
 
-    if args.perlasm_only:
-        perlasm_only(
-            args.openssl_source_dir,
-            args.output_dir,
-            flavors=args.perlasm_only.split(","),
-            perl_path=perl,
-        )
-    else:
-        buildifier = _resolve_buildifier(args.buildifier)
-        print(f"Resolved buildifier: {buildifier or '(skipped)'}")
-        main(
-            args.openssl_source_dir,
-            args.output_dir,
-            args.bcr_dir,
-            args.tag,
-            buildifier,
-            args.source_archive,
-            perl_path=perl,
-            pregen_dir=args.pregen_dir,
-        )
+    if args.trace:
+        start_tracing()
+    try:
+        if args.check:
+            up_to_date = check(
+                args.openssl_source_dir,
+                args.output_dir,
+                perl_path=perl,
+                pregen_dir=args.pregen_dir,
+                manifest_path=args.manifest,
+            )
+            sys.exit(0 if up_to_date else 1)
+        elif args.perlasm_only:
+            perlasm_only(
+                args.openssl_source_dir,
+                args.output_dir,
+                flavors=args.perlasm_only.split(","),
+                perl_path=perl,
+                jobs=args.jobs,
+                cache_dir=args.cache_dir,
+                perl_driver=args.perl_driver,
+            )
+        else:
+            buildifier = _resolve_buildifier(args.buildifier)
+            print(f"Resolved buildifier: {buildifier or '(skipped)'}")
+            main(
+                args.openssl_source_dir,
+                args.output_dir,
+                args.bcr_dir,
+                args.tag,
+                buildifier,
+                args.source_archive,
+                perl_path=perl,
+                pregen_dir=args.pregen_dir,
+                jobs=args.jobs,
+                cache_dir=args.cache_dir,
+                perl_driver=args.perl_driver,
+                manifest_path=args.manifest,
+                full=args.full,
+                buildifier_mode=args.buildifier_mode,
+                shard=args.shard,
+            )
+    finally:
+        if args.trace:
+            write_trace(Path(args.trace))
+            print(f"Trace written to: {args.trace}")
+        if not args.check:
+            print(format_usage_report(collected_stats(), args.top))
+        if args.stats:
+            write_usage_report(Path(args.stats), collected_stats(), args.top)
+            print(f"Process usage written to: {args.stats}")
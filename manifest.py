@@ -0,0 +1,129 @@
+"""Manifest of generated outputs, for incremental regeneration and --check.
+
+For every unit of the pipeline (a Configure target, the templates, a perlasm
+flavor, ...) the manifest records a key hashing everything the unit's outputs
+are derived from, plus the size, mtime and SHA-256 of each output file.  A
+unit whose key is unchanged and whose outputs still match is up to date.  File hashes are memoized by size and mtime in
+the manifest itself, so checking an unchanged tree only costs stat() calls.
+
+Output paths are written as "<root>:<relative path>", where the root is
+"overlay" (--output_dir) or "pregen" (--pregen_dir).  A path may name a
+directory, in which case the task owns every file beneath it.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Iterable, Mapping, Sequence
+from pathlib import Path
+from typing import Any
+
+MANIFEST_VERSION = 1
+
+# (size, mtime_ns, sha256) of a file when it was last hashed.
+_FileStat = tuple[int, int, str]
+
+
+class FileHasher:
+    """SHA-256 of file contents, memoized by size and mtime."""
+
+    def __init__(self, known: Mapping[str, Sequence[Any]] | None = None) -> None:
+        self._known: dict[str, _FileStat] = {
+            path: (int(entry[0]), int(entry[1]), str(entry[2])) for path, entry in (known or {}).items()
+        }
+        # Every file looked at during this run; saved as the next run's memo.
+        self.seen: dict[str, _FileStat] = {}
+
+    def stat(self, path: Path) -> _FileStat | None:
+        """Return (size, mtime_ns, sha256) of *path*, or None if it does not exist."""
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        name = os.path.abspath(path)
+        entry = self._known.get(name)
+        if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            entry = (st.st_size, st.st_mtime_ns, hashlib.sha256(path.read_bytes()).hexdigest())
+            self._known[name] = entry
+        self.seen[name] = entry
+        return entry
+
+    def digest(self, path: Path) -> str:
+        entry = self.stat(path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        return entry[2]
+
+    def digest_tree(self, root: Path, paths: Iterable[Path]) -> str:
+        """Hash the relative names and contents of *paths* (all under *root*), in sorted order."""
+        h = hashlib.sha256()
+        for path in sorted(paths, key=lambda p: p.relative_to(root).as_posix()):
+            h.update(f"{path.relative_to(root).as_posix()}\0{self.digest(path)}\0".encode())
+        return h.hexdigest()
+
+
+def resolve(label: str, roots: Mapping[str, Path]) -> Path:
+    """Map an output label to a path under its root."""
+    root, _, rel = label.partition(":")
+    return roots[root] / rel
+
+
+def expand_outputs(labels: Iterable[str], roots: Mapping[str, Path]) -> dict[str, Path]:
+    """Map every existing file named by *labels* (files or directories) to its path."""
+    files: dict[str, Path] = {}
+    for label in labels:
+        path = resolve(label, roots)
+        if path.is_dir():
+            for child in path.rglob("*"):
+                if child.is_file():
+                    files[f"{label}/{child.relative_to(path).as_posix()}"] = child
+        elif path.is_file():
+            files[label] = path
+    return files
+
+
+def record_outputs(labels: Iterable[str], roots: Mapping[str, Path], hasher: FileHasher) -> dict[str, list[Any]]:
+    records = {}
+    for name, path in sorted(expand_outputs(labels, roots).items()):
+        entry = hasher.stat(path)
+        assert entry is not None
+        records[name] = list(entry)
+    return records
+
+
+def outputs_match(
+    recorded: Mapping[str, Sequence[Any]],
+    labels: Iterable[str],
+    roots: Mapping[str, Path],
+    hasher: FileHasher,
+) -> bool:
+    """Whether the files under *labels* are exactly the *recorded* ones, with the same contents."""
+    current = expand_outputs(labels, roots)
+    if current.keys() != recorded.keys():
+        return False
+    for name, path in current.items():
+        entry = hasher.stat(path)
+        if entry is None or entry[2] != recorded[name][2]:
+            return False
+    return True
+
+
+def load_manifest(path: Path) -> dict[str, Any]:
+    """Load a manifest, or return an empty one if it is missing, unreadable or from another version."""
+    try:
+        data: dict[str, Any] = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {"tasks": {}, "files": {}}
+    if data.get("version") != MANIFEST_VERSION:
+        return {"tasks": {}, "files": {}}
+    return data
+
+
+def save_manifest(path: Path, tasks: Mapping[str, Any], hasher: FileHasher) -> None:
+    data = {"version": MANIFEST_VERSION, "tasks": tasks, "files": hasher.seen}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp, path)
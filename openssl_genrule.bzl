@@ -2,11 +2,20 @@
 
 Generates platform-independent files from OpenSSL's .h.in templates,
 DER table generators, progs.pl, and mkbuildinf.pl. Template processing
-is batched into a single Perl invocation via batch_dofile to avoid
+is batched into a few Perl invocations via batch_dofile to avoid
 per-template process-creation overhead on Windows. Uses redirect_stdout
 for single-output actions (mkbuildinf, progs).
+
+--//:dofile-batches sets how many batch_dofile actions the templates are
+spread over (default 1). Templates are dealt out largest first, each to the
+batch with the least work so far, by the size of their pre-generated output
+(DOFILE_COSTS). More batches let a remote executor run them in parallel and
+make cache hits finer-grained, at the cost of one Perl start-up each.
 """
 
+load("@bazel_skylib//rules:common_settings.bzl", "BuildSettingInfo")
+load(":dofile_costs.bzl", "DOFILE_COSTS")
+
 # Fixed epoch for SOURCE_DATE_EPOCH to ensure reproducible timestamps.
 _HERMETIC_ENV = {"SOURCE_DATE_EPOCH": "443779200"}
 
@@ -72,29 +81,56 @@ _DOFILE_DER_SRC_TEMPLATES = {
     "providers/common/der/der_wrap_gen.c.in": "providers/common/der/der_wrap_gen.c",
 }
 
+def _dofile_batches(templates_map, count):
+    """Split templates_map into up to count lists of (target, output), balanced by DOFILE_COSTS."""
+    items = sorted(
+        templates_map.items(),
+        key = lambda item: (-DOFILE_COSTS.get(item[1], 1), item[1]),
+    )
+    batches = [[] for _ in range(count)]
+    loads = [0] * count
+    for target, output in items:
+        lightest = 0
+        for i in range(1, count):
+            if (loads[i], len(batches[i])) < (loads[lightest], len(batches[lightest])):
+                lightest = i
+        batches[lightest].append((target, output))
+        loads[lightest] += DOFILE_COSTS.get(output, 1)
+    return [batch for batch in batches if batch]
+
 def _run_dofile(ctx, out_files_list):
-    """Run batch_dofile once for all templates."""
-    inputs = []
-    outputs = []
-    args = ctx.actions.args()
+    """Run batch_dofile for all templates, in --//:dofile-batches actions."""
+    count = ctx.attr._batches[BuildSettingInfo].value
+    if count < 1:
+        fail("--//:dofile-batches must be at least 1, got %d" % count)
+    batches = _dofile_batches(ctx.attr.templates_map, count)
 
-    for target, output in ctx.attr.templates_map.items():
-        template_file = target.files.to_list()[0]
-        out_file = ctx.actions.declare_file(output)
-        inputs.append(template_file)
-        outputs.append(out_file)
-        out_files_list.append(out_file)
-        args.add("--in=" + template_file.path)
-        args.add("--out=" + out_file.path)
+    for number, batch in enumerate(batches, start = 1):
+        inputs = []
+        outputs = []
+        args = ctx.actions.args()
 
-    ctx.actions.run(
-        executable = ctx.executable._batch_dofile,
-        arguments = [args],
-        inputs = inputs,
-        outputs = outputs,
-        mnemonic = "OpenSSLDofile",
-        progress_message = "Generating %d template files" % len(outputs),
-    )
+        for target, output in batch:
+            template_file = target.files.to_list()[0]
+            out_file = ctx.actions.declare_file(output)
+            inputs.append(template_file)
+            outputs.append(out_file)
+            out_files_list.append(out_file)
+            args.add("--in=" + template_file.path)
+            args.add("--out=" + out_file.path)
+
+        if len(batches) == 1:
+            progress_message = "Generating %d template files" % len(outputs)
+        else:
+            progress_message = "Generating %d template files (batch %d of %d)" % (len(outputs), number, len(batches))
+        ctx.actions.run(
+            executable = ctx.executable._batch_dofile,
+            arguments = [args],
+            inputs = inputs,
+            outputs = outputs,
+            mnemonic = "OpenSSLDofile",
+            progress_message = progress_message,
+        )
 
 def _run_progs(ctx, flag, out_path):
     """Run the progs_gen perl_binary via redirect_stdout."""
@@ -179,6 +215,10 @@ Template outputs go into DefaultInfo; app outputs go into OutputGroupInfo("app")
             allow_files = True,
             doc = "Map of .in template file labels to their canonical output paths.",
         ),
+        "_batches": attr.label(
+            default = Label("//:dofile-batches"),
+            providers = [BuildSettingInfo],
+        ),
         "_batch_dofile": attr.label(
             cfg = "exec",
             executable = True,
@@ -0,0 +1,178 @@
+"""Write-if-changed output files.
+
+Every file the generator produces goes through write_output(), install_output()
+or link_output().  A file whose contents are already on disk (compared by size,
+then bytes) is left alone, so regenerating unchanged outputs keeps their mtimes
+and inodes, and with them file-watcher, rsync and Bazel caches.  Changed files
+are written to a temporary file in the same directory and renamed over the
+target, so nothing ever sees a partial file, and hardlinks to the old contents
+(e.g. a BCR overlay made by write_bcr_files()) keep them.
+
+Files written by a child process (Perl) are staged under staging_dir() and then
+moved into place by install_output().  prune_outputs() removes the files under
+a path that were not produced during this run.  output_counts() reports how
+many files were written, left unchanged and removed.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple
+
+
+class OutputCounts(NamedTuple):
+    written: int
+    unchanged: int
+    removed: int
+
+
+# The umask of this process; mkstemp() creates files 0600 regardless of it.
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+_lock = threading.Lock()
+_dirs: set[Path] = set()
+# Every output produced (written or found unchanged) so far.
+_produced: set[Path] = set()
+_counts = {"written": 0, "unchanged": 0, "removed": 0}
+
+
+def output_counts() -> OutputCounts:
+    with _lock:
+        return OutputCounts(**_counts)
+
+
+def format_output_counts() -> str:
+    counts = output_counts()
+    return f"Outputs: {counts.written} written, {counts.unchanged} unchanged, {counts.removed} removed"
+
+
+def _record(path: Path, written: bool) -> bool:
+    with _lock:
+        _produced.add(Path(os.path.abspath(path)))
+        _counts["written" if written else "unchanged"] += 1
+    return written
+
+
+def ensure_dirs(dirs: Iterable[Path]) -> None:
+    """Create each of *dirs* (and its parents) unless it was already created during this run."""
+    with _lock:
+        missing = sorted(set(dirs) - _dirs)
+    for path in missing:
+        path.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        _dirs.update(missing)
+
+
+def _same_contents(path: Path, data: bytes) -> bool:
+    try:
+        if path.is_symlink() or path.stat().st_size != len(data):
+            return False
+        return path.read_bytes() == data
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+
+def _replace(path: Path, data: bytes, mode: int) -> None:
+    """Write *data* to a temporary file next to *path* and rename it over *path*."""
+    ensure_dirs([path.parent])
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def write_output(path: Path, data: bytes | str, executable: bool = False) -> bool:
+    """Write *data* (text is UTF-8 encoded) to *path* unless it already holds exactly that.
+
+    Returns whether the file was written.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if _same_contents(path, data):
+        return _record(path, False)
+    _replace(path, data, (0o777 if executable else 0o666) & ~_UMASK)
+    return _record(path, True)
+
+
+def install_output(staged: Path, path: Path) -> bool:
+    """Move *staged*, a file under staging_dir(), to *path* unless *path* already holds its contents.
+
+    *staged* is gone afterwards either way.  Returns whether *path* was replaced.
+    """
+    if _same_contents(path, staged.read_bytes()):
+        staged.unlink()
+        return _record(path, False)
+    ensure_dirs([path.parent])
+    os.replace(staged, path)
+    return _record(path, True)
+
+
+def link_output(src: Path, path: Path) -> bool:
+    """Hardlink *src* to *path* (copying if linking is not possible) unless *path* already holds its contents.
+
+    Returns whether *path* was replaced.
+    """
+    data = src.read_bytes()
+    if _same_contents(path, data):
+        return _record(path, False)
+    ensure_dirs([path.parent])
+    tmp = path.parent / f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        _replace(path, data, src.stat().st_mode & 0o777)
+    else:
+        os.replace(tmp, path)
+    return _record(path, True)
+
+
+def prune_outputs(paths: Iterable[Path]) -> None:
+    """Remove every file at or under *paths* that was not produced during this run, and empty directories."""
+    with _lock:
+        produced = set(_produced)
+    removed = 0
+    for path in paths:
+        if path.is_dir() and not path.is_symlink():
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    file = Path(os.path.abspath(Path(root) / name))
+                    if file not in produced:
+                        file.unlink()
+                        removed += 1
+                for name in dirs:
+                    try:
+                        (Path(root) / name).rmdir()
+                    except OSError:
+                        continue
+            try:
+                path.rmdir()
+            except OSError:
+                pass
+        elif (path.is_file() or path.is_symlink()) and Path(os.path.abspath(path)) not in produced:
+            path.unlink()
+            removed += 1
+    with _lock:
+        _counts["removed"] += removed
+        # Directories removed above may be needed again.
+        _dirs.clear()
+
+
+@contextmanager
+def staging_dir(root: Path) -> Iterator[Path]:
+    """Yield a new temporary directory under *root*, on the same filesystem as the outputs there."""
+    ensure_dirs([root])
+    path = Path(tempfile.mkdtemp(dir=root, prefix=".staging."))
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
@@ -4,61 +4,263 @@ Computes the integrity hash of the pregen tarball, patches the
 PLACEHOLDER in MODULE.bazel, optionally overrides the download URL
 (for local CI testing with file:// paths), and recomputes all overlay
 file hashes in source.json.
+
+The tarballs are first written from --pregen_dir by write_archives():
+reproducible archives whose integrities are computed as they are written,
+rather than by reading back the output of ``tar czf``.  It is required, since
+pregen_files only finds files in archives with the blobs/ layout that
+write_archives() produces.
+
+The pregen directory is split into parts, each its own archive and Bazel
+repository (see pregen_index.py): the common part (@openssl_pregen, --tarball
+itself) and one part per config_name and per perlasm flavor.  A part's tarball
+is --tarball with "-<part>" before ".tar.gz".  Archives store each distinct
+file once, as a blob, and the overlay's bazel/pregen_index.bzl is rewritten to
+map canonical paths to the blobs archived.
+
+Overlay hashes are reused from the OVERLAY_HASHES file left by the generator
+for every file whose size and mtime are unchanged; only the files patched here
+and any edited since are rehashed.
 """
 
 import argparse
 import base64
+import gzip
 import hashlib
+import io
 import json
 import os
 import re
-from pathlib import Path
+import tarfile
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import IO
+
+from common import OVERLAY_HASHES, integrity_hash, load_overlay_hashes
+from pregen_index import COMMON, PregenIndex, blob_homes, build_index, render_index_bzl
+
+# Every archive entry gets this mtime and root ownership, so archives depend only
+# on the names, modes and contents of the archived files.
+ARCHIVE_MTIME = 0
+
+# Uncompressed bytes per gzip member; members are compressed concurrently.
+_GZIP_CHUNK_SIZE = 1 << 20
+
+
+class _ParallelGzipWriter:
+    """Write-only file object that gzips its input in independent members.
+
+    Each chunk of input is compressed on its own by a thread pool (zlib releases
+    the GIL) and the members are written to *out* in input order.  A gzip
+    stream may consist of several members, and gunzip, Python's gzip module and
+    Bazel all read it as one.  The SHA-256 of everything written is kept in
+    *sha256*.
+    """
+
+    def __init__(self, out: IO[bytes], jobs: int) -> None:
+        self._out = out
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._pending: deque[Future[bytes]] = deque()
+        self._max_pending = 2 * jobs
+        self._buffer = bytearray()
+        self._position = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= _GZIP_CHUNK_SIZE:
+            self._submit(bytes(self._buffer[:_GZIP_CHUNK_SIZE]))
+            del self._buffer[:_GZIP_CHUNK_SIZE]
+        return len(data)
+
+    # tarfile's stream mode only writes; these complete the file protocol it expects.
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int) -> bytes:
+        raise io.UnsupportedOperation("read")
+
+    def seek(self, pos: int) -> int:
+        raise io.UnsupportedOperation("seek")
+
+    def _submit(self, chunk: bytes) -> None:
+        self._pending.append(self._executor.submit(gzip.compress, chunk, 6, mtime=ARCHIVE_MTIME))
+        while len(self._pending) > self._max_pending:
+            self._drain_one()
+
+    def _drain_one(self) -> None:
+        member = self._pending.popleft().result()
+        self.sha256.update(member)
+        self._out.write(member)
+
+    def close(self) -> None:
+        if self._buffer or not self._pending:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._drain_one()
+        self._executor.shutdown()
+
+
+def _tarinfo(arcname: str, source: Path | None) -> tarfile.TarInfo:
+    """Header for *arcname*: a directory if *source* is None, else a file with *source*'s size and mode."""
+    info = tarfile.TarInfo(arcname)
+    info.mtime = ARCHIVE_MTIME
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    if source is None:
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+    else:
+        info.size = source.stat().st_size
+        info.mode = 0o755 if os.access(source, os.X_OK) else 0o644
+    return info
+
 
+def write_archive(dest: Path, root: str, files: Mapping[str, Path], jobs: int = os.cpu_count() or 1) -> str:
+    """Write *files* (archive path relative to *root* -> source file) as a .tar.gz at *dest*; return its integrity.
 
-def integrity_hash(path: Path) -> str:
-    with path.open("rb") as f:
-        digest = hashlib.file_digest(f, "sha256").digest()
-    return "sha256-" + base64.b64encode(digest).decode()
+    Entries are sorted, parents first, with a fixed mtime, root ownership and
+    modes reduced to 0644/0755, so the same files always produce the same bytes.
+    """
+    dirs = {parent for name in files for parent in PurePosixPath(name).parents if parent.parts}
+    entries = sorted([*dirs, *map(PurePosixPath, files)], key=lambda path: path.parts)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with dest.open("wb") as out:
+        gz = _ParallelGzipWriter(out, jobs)
+        try:
+            with tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                tar.addfile(_tarinfo(root, None))
+                for entry in entries:
+                    source = files.get(entry.as_posix())
+                    info = _tarinfo(f"{root}/{entry}", source)
+                    if source is None:
+                        tar.addfile(info)
+                    else:
+                        with source.open("rb") as f:
+                            tar.addfile(info, f)
+        finally:
+            gz.close()
+    return "sha256-" + base64.b64encode(gz.sha256.digest()).decode()
 
 
-def patch_module_bazel(path: Path, integrity: str, url_override: str | None) -> None:
+def part_path(tarball: Path | str, part: str) -> str:
+    """Return where the archive of *part* goes, given the common *tarball*."""
+    tarball = str(tarball)
+    if part == COMMON:
+        return tarball
+    stem = tarball.removesuffix(".tar.gz")
+    return f"{stem}-{part}.tar.gz"
+
+
+def write_archives(src_dir: Path, tarball: Path, jobs: int = os.cpu_count() or 1) -> tuple[PregenIndex, dict[str, str]]:
+    """Write every part of the pregen directory *src_dir* next to *tarball*.
+
+    Each part's archive holds the blobs that blob_homes() assigns to it under
+    blobs/, and the common one also the files outside generated/ (its BUILD
+    file).  Returns the index of the blobs and the integrity of every archive.
+    """
+    index, blob_paths = build_index(src_dir)
+    files: dict[str, dict[str, Path]] = {part: {} for part in [COMMON, *index]}
+    for path in sorted(src_dir.rglob("*")):
+        rel = PurePosixPath(path.relative_to(src_dir).as_posix())
+        if path.is_file() and rel.parts[0] != "generated":
+            files[COMMON][rel.as_posix()] = path
+    for blob, part in blob_homes(index).items():
+        files[part][f"blobs/{blob}"] = blob_paths[blob]
+    integrities = {}
+    for part, part_files in files.items():
+        integrities[part] = write_archive(Path(part_path(tarball, part)), src_dir.name, part_files, jobs)
+        print(f"Wrote {part_path(tarball, part)} ({len(part_files)} files)")
+    return index, integrities
+
+
+_PLACEHOLDER = re.compile(r'integrity = "PLACEHOLDER(?::(\w+))?"')
+
+
+def patch_module_bazel(path: Path, tag: str, integrities: dict[str, str], url_override: str | None) -> None:
+    """Fill in the pregen integrities and, with *url_override*, point each part at its archive there."""
     text = path.read_text()
-    text = text.replace('integrity = "PLACEHOLDER"', f'integrity = "{integrity}"')
+
+    def _integrity(match: re.Match[str]) -> str:
+        part = match.group(1) or COMMON
+        if part not in integrities:
+            raise RuntimeError(f"No pregen archive for part {part} referenced by {path}")
+        return f'integrity = "{integrities[part]}"'
+
+    text = _PLACEHOLDER.sub(_integrity, text)
     if url_override:
+        release = re.escape(f"https://github.com/raccoons-build/bazel-openssl-cc/releases/download/{tag}/")
+        archive = re.escape(f"bazel-openssl-cc-{tag}")
         text = re.sub(
-            r'"https://github\.com/raccoons-build/bazel-openssl-cc/releases/download/[^"]*"',
-            f'"{url_override}"',
+            rf'"{release}{archive}(?:-(\w+))?\.tar\.gz"',
+            lambda match: f'"{part_path(url_override, match.group(1) or COMMON)}"',
             text,
         )
+    _replace_text(path, text)
+
+
+def _replace_text(path: Path, text: str) -> None:
+    # Overlay files may be hardlinks to the generator's output; unlinking first
+    # leaves that copy as it was.
+    path.unlink(missing_ok=True)
     path.write_text(text)
 
 
-def recompute_overlay_hashes(bcr_dir: Path, tag: str) -> None:
-    overlay_dir = bcr_dir / "modules" / "openssl" / tag / "overlay"
-    source_json_path = bcr_dir / "modules" / "openssl" / tag / "source.json"
+def recompute_overlay_hashes(bcr_dir: Path, tag: str, changed: set[Path]) -> None:
+    """Rewrite the overlay integrities in source.json.
+
+    Hashes recorded in OVERLAY_HASHES are reused for files whose size and mtime
+    still match, except for the *changed* files; the record is then removed.
+    """
+    module_dir = bcr_dir / "modules" / "openssl" / tag
+    overlay_dir = module_dir / "overlay"
+    source_json_path = module_dir / "source.json"
+    hashes_path = module_dir / OVERLAY_HASHES
+    recorded = load_overlay_hashes(hashes_path)
 
     with open(source_json_path) as f:
         sj = json.load(f)
 
     sj["overlay"] = {}
+    rehashed = 0
     for root, _, files in os.walk(overlay_dir):
         for fn in files:
             full = Path(root) / fn
             rel = os.path.relpath(full, overlay_dir)
-            sj["overlay"][rel] = integrity_hash(full)
+            st = full.stat()
+            entry = recorded.get(rel)
+            if entry is not None and full not in changed and entry[1:] == (st.st_size, int(st.st_mtime)):
+                sj["overlay"][rel] = entry[0]
+            else:
+                sj["overlay"][rel] = integrity_hash(full)
+                rehashed += 1
+    print(f"Rehashed {rehashed} of {len(sj['overlay'])} overlay files")
 
     with open(source_json_path, "w") as f:
         json.dump(sj, f, indent="    ", sort_keys=True)
         f.write("\n")
+    hashes_path.unlink(missing_ok=True)
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("--tarball", required=True, help="Path to the pregen tarball")
+    parser.add_argument(
+        "--tarball", required=True, help="Path to the common pregen tarball; the other parts are next to it"
+    )
+    parser.add_argument(
+        "--pregen_dir", required=True, help="Write the tarballs from this directory (its name is the archive root)"
+    )
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Threads compressing --pregen_dir")
     parser.add_argument("--bcr_dir", required=True, help="Path to the bazel-central-registry checkout")
     parser.add_argument("--tag", required=True, help="Version tag (e.g. 3.5.5.bcr.1)")
     parser.add_argument(
-        "--url_override", default=None, help="Override the pregen download URL (e.g. file:///tmp/pregen.tar.gz)"
+        "--url_override",
+        default=None,
+        help="Override the common pregen download URL (e.g. file:///tmp/pregen.tar.gz); parts are named after it",
     )
     args = parser.parse_args()
 
@@ -66,16 +268,26 @@ def main() -> None:
     bcr_dir = Path(args.bcr_dir)
     tag = args.tag
 
-    integrity = integrity_hash(tarball)
-    print(f"Pregen integrity: {integrity}")
-
     module_dir = bcr_dir / "modules" / "openssl" / tag
-    for module_path in [module_dir / "MODULE.bazel", module_dir / "overlay" / "MODULE.bazel"]:
-        if module_path.exists():
-            patch_module_bazel(module_path, integrity, args.url_override)
-            print(f"Patched {module_path}")
+    module_paths = [
+        path for path in [module_dir / "MODULE.bazel", module_dir / "overlay" / "MODULE.bazel"] if path.exists()
+    ]
+    changed = set(module_paths)
+    index, integrities = write_archives(Path(args.pregen_dir), tarball, args.jobs)
+    # The macOS assembly is merged in after generation, so the generator's
+    # index is rebuilt from what was actually archived.
+    index_path = module_dir / "overlay" / "bazel" / "pregen_index.bzl"
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    _replace_text(index_path, render_index_bzl(index))
+    changed.add(index_path)
+    for part, integrity in sorted(integrities.items()):
+        print(f"Pregen integrity ({part}): {integrity}")
+
+    for module_path in module_paths:
+        patch_module_bazel(module_path, tag, integrities, args.url_override)
+        print(f"Patched {module_path}")
 
-    recompute_overlay_hashes(bcr_dir, tag)
+    recompute_overlay_hashes(bcr_dir, tag, changed)
     print("Recomputed overlay hashes in source.json")
 
 
@@ -2,12 +2,21 @@
 
 Each perlasm script is run as an individual action for per-file caching
 and full parallelism. No shell scripts are generated.
+
+An action's inputs are only the script, the files it reads (script_inputs)
+and, if it runs $CC (cc_scripts), the C toolchain, so that its input digest
+and sandbox do not grow with the whole perlasm tree and toolchain.
 """
 
 load("@rules_cc//cc:action_names.bzl", "ACTION_NAMES")
 load("@rules_cc//cc:defs.bzl", "CcInfo", "cc_common")
 load("@rules_cc//cc:find_cc_toolchain.bzl", "find_cc_toolchain", "use_cc_toolchain")
 
+def _repo_path(file):
+    """Path of a source file relative to the root of its repository."""
+    root = file.owner.workspace_root
+    return file.path[len(root) + 1:] if root else file.path
+
 def _perl_genrule_impl(ctx):
     cc_toolchain = find_cc_toolchain(ctx)
 
@@ -29,11 +38,11 @@ def _perl_genrule_impl(ctx):
     additional_srcs = []
     for src in ctx.attr.additional_srcs:
         additional_srcs.extend(src.files.to_list())
+    srcs_by_path = {_repo_path(f): f for f in additional_srcs}
+    cc_scripts = {script: True for script in ctx.attr.cc_scripts}
 
-    tools = depset(
-        direct = [perl_interpreter],
-        transitive = [cc_toolchain.all_files, perl_runtime.runtime],
-    )
+    perl_tools = depset(direct = [perl_interpreter], transitive = [perl_runtime.runtime])
+    tools = depset(transitive = [perl_tools, cc_toolchain.all_files])
 
     outs_as_files = []
     all_dicts = [ctx.attr.srcs_to_outs, ctx.attr.srcs_to_outs_dupes]
@@ -43,13 +52,23 @@ def _perl_genrule_impl(ctx):
             out_file = ctx.actions.declare_file(out)
             outs_as_files.append(out_file)
 
+            script = _repo_path(src_file)
+            script_inputs = [srcs_by_path.get(path) for path in ctx.attr.script_inputs.get(script, [])]
+            if script in ctx.attr.script_inputs and None not in script_inputs:
+                inputs = [src_file] + script_inputs
+                script_tools = tools if script in cc_scripts else perl_tools
+            else:
+                # Not scanned, or reads a file missing from additional_srcs.
+                inputs = [src_file] + additional_srcs
+                script_tools = tools
+
             ctx.actions.run(
                 executable = perl_interpreter,
                 arguments = [src_file.path, ctx.attr.assembly_flavor, out_file.path],
-                inputs = depset(direct = [src_file] + additional_srcs),
+                inputs = depset(direct = inputs),
                 outputs = [out_file],
                 env = env,
-                tools = tools,
+                tools = script_tools,
                 mnemonic = "OpenSSLPerlasm",
             )
 
@@ -73,12 +92,19 @@ perl_genrule = rule(
     doc = "Generate assembly files from OpenSSL perlasm scripts.",
     attrs = {
         "additional_srcs": attr.label_list(
-            doc = "Additional input files used by the perlasm scripts.",
+            doc = "Every file the perlasm scripts may read besides themselves. " +
+                  "A script missing from script_inputs gets all of them, and the C toolchain.",
             allow_files = True,
         ),
         "assembly_flavor": attr.string(
             doc = "Assembly output format (e.g. elf, ios64, masm).",
         ),
+        "cc_scripts": attr.string_list(
+            doc = "Scripts, by path in the repository, that run $CC and so need the C toolchain.",
+        ),
+        "script_inputs": attr.string_list_dict(
+            doc = "Script path in the repository -> paths of the files in additional_srcs that it reads.",
+        ),
         "srcs_to_outs": attr.label_keyed_string_dict(
             doc = "Dict of perlasm script to output file path.",
             allow_files = True,
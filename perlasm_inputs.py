@@ -0,0 +1,112 @@
+"""Finding the files each perlasm script reads besides itself.
+
+perl_genrule runs every perlasm script as its own action.  Instead of giving
+each action every perlasm helper and the whole C toolchain, the generator
+scans the scripts and writes the exact inputs of each to
+bazel/constants/perlasm_inputs.bzl.
+
+A perlasm script names the files it reads relative to its own directory:
+``$dir`` (taken from ``$0``) or FindBin's ``$Bin``.  That covers the translator
+it pipes its output through (x86_64-xlate.pl, arm-xlate.pl, ...) and the tables
+it opens.  It also pushes such directories onto @INC (``push(@INC, ...)``,
+``use lib``) before it does ``require "x86asm.pl"`` or ``use perlasm::s390x``.
+scan_perlasm_inputs() resolves every quoted file name and every module in a
+script the same way and keeps those that exist.  It then scans the Perl files
+among them in turn, with the @INC directories of the files that load them.
+
+The scan errs towards too many inputs: a file named in a comment or in
+another flavor's branch still counts.  A script needs the C toolchain only if
+it, or a file it loads, runs ``$ENV{CC}``, which the x86_64 scripts do to probe
+the assembler's version.
+"""
+
+import posixpath
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+
+class PerlasmInputs(NamedTuple):
+    # Files the script reads besides itself, relative to the source root.
+    files: tuple[str, ...]
+    # Whether the script or a file it loads runs $ENV{CC}.
+    cc: bool
+
+
+_STRING = re.compile(r'"((?:[^"\\\n]|\\.)*)"|\'([^\'\n]*)\'')
+# A file name in a string, optionally starting with the directory of the file.
+_FILE_NAME = re.compile(r"(\$\{?(?:dir|Bin|FindBin::Bin)\}?)?([\w./+-]*\.(?:pl|pm|c|h))(?![\w.])")
+_INC_DIRS = re.compile(r"(?:\b(?:push|unshift)\s*\(?\s*@INC\s*,|\buse\s+lib\b)([^;]*);")
+_MODULE = re.compile(r"^\s*(?:use|require)\s+([A-Za-z_][\w:]*)", re.MULTILINE)
+_DIR_VAR = re.compile(r"\$\{?(?:dir|Bin|FindBin::Bin)\}?")
+_CC = re.compile(r"\$ENV\{\s*[\"']?CC[\"']?\s*\}")
+
+
+def _strings(text: str) -> Iterator[str]:
+    for match in _STRING.finditer(text):
+        yield match.group(1) if match.group(1) is not None else match.group(2)
+
+
+def _inside(path: str) -> str | None:
+    """Normalize *path*, relative to the source root, or return None if it leaves the root."""
+    path = posixpath.normpath(path)
+    return None if path == ".." or path.startswith("../") or posixpath.isabs(path) else path
+
+
+def _inc_dirs(text: str, directory: str) -> list[str]:
+    """The directories *text*, a file in *directory*, adds to @INC."""
+    dirs = []
+    for match in _INC_DIRS.finditer(text):
+        for string in _strings(match.group(1)):
+            if _DIR_VAR.match(string):
+                resolved = _inside(posixpath.join(directory, _DIR_VAR.sub("", string, count=1).lstrip("/")))
+            else:
+                resolved = _inside(string)
+            if resolved is not None:
+                dirs.append(resolved)
+    return dirs
+
+
+def _candidates(text: str, directory: str, inc: Iterable[str]) -> Iterator[list[str]]:
+    """Yield, for every file *text* may read, where it may be, in the order Perl would look."""
+    inc = list(inc)
+    for string in _strings(text):
+        for match in _FILE_NAME.finditer(string):
+            relative_to_dir, name = match.groups()
+            if relative_to_dir:
+                yield [posixpath.join(directory, name)]
+            elif "/" in name:
+                yield [name]
+            else:
+                yield [posixpath.join(path, name) for path in [directory, *inc]]
+    for match in _MODULE.finditer(text):
+        name = match.group(1).replace("::", "/") + ".pm"
+        yield [posixpath.join(path, name) for path in inc]
+
+
+def _scan(source_dir: Path, script: str) -> PerlasmInputs:
+    files: set[str] = set()
+    cc = False
+    pending: list[tuple[str, tuple[str, ...]]] = [(script, ())]
+    seen = {script}
+    while pending:
+        rel, inherited = pending.pop()
+        text = (source_dir / rel).read_text(errors="replace")
+        directory = posixpath.dirname(rel)
+        inc = (*inherited, *_inc_dirs(text, directory))
+        cc = cc or _CC.search(text) is not None
+        for paths in _candidates(text, directory, inc):
+            found = next((path for path in map(_inside, paths) if path and (source_dir / path).is_file()), None)
+            if found is None or found in seen:
+                continue
+            seen.add(found)
+            files.add(found)
+            if found.endswith((".pl", ".pm")):
+                pending.append((found, inc))
+    return PerlasmInputs(tuple(sorted(files)), cc)
+
+
+def scan_perlasm_inputs(source_dir: Path, scripts: Iterable[str]) -> dict[str, PerlasmInputs]:
+    """Return the inputs of each perlasm script in *scripts*, given relative to *source_dir*."""
+    return {script: _scan(source_dir, script) for script in sorted(set(scripts))}
@@ -1,5 +1,8 @@
 """Rules and macros for pre-generated OpenSSL files."""
 
+load("@bazel_skylib//rules:common_settings.bzl", "BuildSettingInfo")
+load(":pregen_index.bzl", "PREGEN_INDEX")
+
 _PREGEN_PLATFORMS = [
     "android_arm64",
     "android_x86_64",
@@ -18,143 +21,197 @@ _PREGEN_PLATFORMS = [
     "windows_x64",
 ]
 
-def _strip_prefix(path, prefix):
-    parts = path.split(prefix, 1)
-    if len(parts) != 2:
-        fail("Cannot find prefix '{}' in '{}'".format(prefix, path))
-    return parts[1]
+# Pre-generated perlasm flavor used by each platform with a _pregen_asm_* config_setting.
+_PREGEN_ASM_FLAVORS = {
+    "android_arm64": "linux64",
+    "android_x86_64": "elf",
+    "darwin_arm64": "ios64",
+    "darwin_x86_64": "macosx",
+    "freebsd_aarch64": "linux64",
+    "freebsd_x86_64": "elf",
+    "ios_arm64": "ios64",
+    "linux_aarch64": "linux64",
+    "linux_x86_64": "elf",
+}
 
-def _pregen_files_impl(ctx):
-    crypto_outs = []
-    app_outs = []
+# The pregen_files target whose headers --//:use-pregen-tree-artifacts collects
+# into a directory artifact of the same name.
+_TREE_HDRS = "pregen_hdrs"
 
-    for src in ctx.files.common_srcs:
-        canonical = _strip_prefix(src.short_path, ctx.attr.common_prefix)
+def pregen_tree_includes(includes):
+    """Include paths under the pregen_hdrs directory artifact matching *includes*.
+
+    With --//:use-pregen-tree-artifacts the pre-generated headers sit under
+    pregen_hdrs/ instead of at their canonical paths, so the cc_library
+    consuming them adds these next to its usual includes.  This is a select()
+    on //configs:_pregen_tree: with per-file pregen headers or the Perl
+    fallback it is empty, so no compile gets the extra include paths.
+    """
+    return select({
+        "//configs:_pregen_tree": [_TREE_HDRS + "/" + include for include in includes],
+        "//conditions:default": [],
+    })
+
+def _pregen_symlinks(ctx, files):
+    outs = []
+    for canonical, blob in files.items():
         out = ctx.actions.declare_file(canonical)
-        ctx.actions.symlink(output = out, target_file = src)
+        ctx.actions.symlink(output = out, target_file = blob)
+        outs.append(out)
+    return outs
+
+def _pregen_tree(ctx, files):
+    """Copy *files* (canonical path -> blob) into one directory artifact named after the target."""
+    tree = ctx.actions.declare_directory(ctx.label.name)
+    manifest = ctx.actions.declare_file(ctx.label.name + ".manifest")
+    ctx.actions.write(
+        output = manifest,
+        content = "".join(["{}/{}\t{}\n".format(tree.path, canonical, blob.path) for canonical, blob in files.items()]),
+    )
+    ctx.actions.run(
+        inputs = depset([manifest] + files.values()),
+        executable = ctx.executable._collate,
+        arguments = [manifest.path],
+        outputs = [tree],
+        mnemonic = "OpenSSLPregenTree",
+        progress_message = "Collecting pre-generated OpenSSL files into %{output}",
+    )
+    return tree
+
+def _pregen_files_impl(ctx):
+    blobs = {src.basename: src for src in ctx.files.blobs}
+    crypto_files = {}
+    app_files = {}
+
+    for canonical, blob in ctx.attr.paths.items():
+        if blob not in blobs:
+            fail("No blob {} for {} in {}".format(blob, canonical, ctx.attr.blobs))
         if canonical.startswith("apps/"):
-            app_outs.append(out)
+            app_files[canonical] = blobs[blob]
         else:
-            crypto_outs.append(out)
+            crypto_files[canonical] = blobs[blob]
 
-    prefix = ctx.attr.platform_prefix
-    for src in ctx.files.platform_srcs:
-        canonical = _strip_prefix(src.short_path, prefix)
-        out = ctx.actions.declare_file(canonical)
-        ctx.actions.symlink(output = out, target_file = src)
-        crypto_outs.append(out)
+    if ctx.attr.tree and crypto_files and ctx.attr._use_tree_artifacts[BuildSettingInfo].value:
+        crypto_outs = [_pregen_tree(ctx, crypto_files)]
+    else:
+        crypto_outs = _pregen_symlinks(ctx, crypto_files)
 
     return [
         DefaultInfo(files = depset(crypto_outs)),
-        OutputGroupInfo(app = depset(app_outs)),
+        OutputGroupInfo(app = depset(_pregen_symlinks(ctx, app_files))),
     ]
 
 pregen_files = rule(
     implementation = _pregen_files_impl,
     doc = """Symlinks pre-generated overlay files to canonical OpenSSL output paths.
 
-Produces outputs at the same paths as the Perl genrule fallback
-(e.g. include/openssl/bio.h, crypto/buildinf.h, apps/progs.h) so
-downstream cc_library targets can switch between pregen and Perl via
-select() without changing include paths.
+The pregen archives store each distinct file once, as a blob named after
+its contents (see PREGEN_INDEX in pregen_index.bzl).  This rule maps
+them back to the same paths as the Perl genrule fallback (e.g.
+include/openssl/bio.h, crypto/buildinf.h, apps/progs.h) so downstream
+cc_library targets can switch between pregen and Perl via select()
+without changing include paths.
 
 Files whose canonical path starts with "apps/" are placed in the "app"
-output group; all others appear in DefaultInfo.""",
+output group; all others appear in DefaultInfo.
+
+Every file gets its own symlink action and output.  For a target with
+tree = True, --//:use-pregen-tree-artifacts instead copies the files outside
+apps/ into one directory artifact named after the target, laid out like the
+canonical paths, in a single action; consumers find them through
+pregen_tree_includes().  Sources stay per file either way, since cc_library
+compiles the sources of a directory artifact through action templates.""",
     attrs = {
-        "common_prefix": attr.string(
-            doc = "Path prefix to strip from common_srcs entries.",
-            default = "generated/common/",
-        ),
-        "common_srcs": attr.label_list(
-            doc = "Platform-independent source files under generated/common/. " +
-                  "The common_prefix is stripped from each path to derive the " +
-                  "canonical output location.",
+        "blobs": attr.label_list(
+            doc = "Blob files, from the blobs filegroups of the pregen archives.",
             allow_files = True,
         ),
-        "platform_prefix": attr.string(
-            doc = "Path prefix to strip from platform_srcs entries. Must match " +
-                  "the directory used in platform_srcs (e.g. 'generated/darwin_arm64/'). " +
-                  "Typically wrapped in a select() parallel to platform_srcs.",
-            default = "",
+        "paths": attr.string_dict(
+            doc = "Canonical output path -> name of the blob holding its contents. " +
+                  "Typically wrapped in a select() parallel to blobs.",
         ),
-        "platform_srcs": attr.label_list(
-            doc = "Platform-specific source files (e.g. configuration.h) under " +
-                  "a generated/<platform>/ directory. Typically wrapped in a " +
-                  "select() keyed on platform config_settings.",
-            allow_files = True,
+        "tree": attr.bool(
+            doc = "Whether --//:use-pregen-tree-artifacts collects the files into a directory artifact. " +
+                  "Only for headers.",
+        ),
+        "_collate": attr.label(
+            default = Label("//bazel:collate_into_directory"),
+            executable = True,
+            cfg = "exec",
+        ),
+        "_use_tree_artifacts": attr.label(
+            default = Label("//:use-pregen-tree-artifacts"),
+            providers = [BuildSettingInfo],
         ),
     },
 )
 
 # buildifier: disable=unnamed-macro
 def pregen_filegroups():
-    """Create filegroup targets in the @openssl_pregen archive.
+    """Create the blobs filegroup of a pregen archive.
 
-    Exposes the raw generated files so that pregen_files rules in the
-    @openssl overlay can consume them as label inputs.
+    Every @openssl_pregen* archive holds its blobs under blobs/, for the
+    pregen_files rules in the @openssl overlay to consume.  An archive may
+    have none, when all of its files are shared with other parts and so
+    stored in @openssl_pregen.
     """
     native.filegroup(
-        name = "common_hdrs",
-        srcs = native.glob([
-            "generated/common/include/**/*.h",
-            "generated/common/providers/common/include/**/*.h",
-        ]) + [
-            "generated/common/crypto/buildinf.h",
-            "generated/common/apps/progs.h",
-        ],
-    )
-    native.filegroup(
-        name = "common_srcs",
-        srcs = native.glob([
-            "generated/common/crypto/**/*.c",
-            "generated/common/providers/**/*.c",
-        ]) + ["generated/common/apps/progs.c"],
-    )
-    for plat in _PREGEN_PLATFORMS:
-        native.filegroup(
-            name = plat + "_hdrs",
-            srcs = native.glob(["generated/" + plat + "/include/**/*.h"]),
-        )
-    native.filegroup(
-        name = "no_asm_hdrs",
-        srcs = native.glob(["generated/no_asm/include/**/*.h"]),
+        name = "blobs",
+        srcs = native.glob(["blobs/*"], allow_empty = True),
+        visibility = ["//visibility:public"],
     )
-    for flavor in ["elf", "ios64", "linux64", "macosx"]:
-        native.filegroup(
-            name = "asm_" + flavor,
-            srcs = native.glob(["generated/asm/" + flavor + "/**"]),
-        )
+
+def _blobs(part):
+    """Labels of the blobs a pregen part's files may be stored in."""
+    if part == "common":
+        return ["@openssl_pregen//:blobs"]
+    return ["@openssl_pregen//:blobs", "@openssl_pregen_" + part + "//:blobs"]
+
+def _merged(a, b):
+    merged = dict(a)
+    merged.update(b)
+    return merged
 
 # buildifier: disable=unnamed-macro
 def pregen_overlay_targets():
-    """Create pregen targets in @openssl consuming files from @openssl_pregen.
+    """Create pregen targets in @openssl consuming files from the @openssl_pregen* archives.
 
     The pregen_files rules run inside @openssl so that declare_file
     places outputs in @openssl's tree, making the existing cc_library
-    includes work without any additional include-path plumbing.
+    includes work without any additional include-path plumbing.  Each
+    platform selects only its own parts, so Bazel only fetches those.
     """
-    platform_prefix = {
-        "//configs:" + p: "generated/" + p + "/"
-        for p in _PREGEN_PLATFORMS
-    }
-    platform_prefix["//conditions:default"] = "generated/no_asm/"
-
-    platform_srcs = {
-        "//configs:" + p: ["@openssl_pregen//:" + p + "_hdrs"]
-        for p in _PREGEN_PLATFORMS
-    }
-    platform_srcs["//conditions:default"] = ["@openssl_pregen//:no_asm_hdrs"]
+    common = PREGEN_INDEX.get("common", {})
+    common_hdrs = {canonical: blob for canonical, blob in common.items() if canonical.endswith(".h")}
+    common_srcs = {canonical: blob for canonical, blob in common.items() if canonical.endswith(".c")}
+
+    hdr_blobs = {"//configs:" + p: _blobs(p) for p in _PREGEN_PLATFORMS}
+    hdr_blobs["//conditions:default"] = _blobs("no_asm")
+    hdr_paths = {"//configs:" + p: _merged(common_hdrs, PREGEN_INDEX.get(p, {})) for p in _PREGEN_PLATFORMS}
+    hdr_paths["//conditions:default"] = _merged(common_hdrs, PREGEN_INDEX.get("no_asm", {}))
+
+    asm_blobs = {"//configs:_pregen_asm_" + p: _blobs("asm_" + f) for p, f in _PREGEN_ASM_FLAVORS.items()}
+    asm_blobs["//conditions:default"] = []
+    asm_paths = {"//configs:_pregen_asm_" + p: PREGEN_INDEX.get("asm_" + f, {}) for p, f in _PREGEN_ASM_FLAVORS.items()}
+    asm_paths["//conditions:default"] = {}
 
     pregen_files(
-        name = "pregen_hdrs",
-        common_srcs = ["@openssl_pregen//:common_hdrs"],
-        platform_prefix = select(platform_prefix),
-        platform_srcs = select(platform_srcs),
+        name = _TREE_HDRS,
+        blobs = select(hdr_blobs),
+        paths = select(hdr_paths),
+        tree = True,
         tags = ["manual"],
     )
     pregen_files(
         name = "pregen_srcs",
-        common_srcs = ["@openssl_pregen//:common_srcs"],
+        blobs = _blobs("common"),
+        paths = common_srcs,
+        tags = ["manual"],
+    )
+    pregen_files(
+        name = "pregen_asm",
+        blobs = select(asm_blobs),
+        paths = select(asm_paths),
         tags = ["manual"],
     )
     native.filegroup(name = "pregen_app_hdrs", srcs = [":pregen_hdrs"], output_group = "app", tags = ["manual"])
@@ -0,0 +1,96 @@
+"""Content-addressed index of the pre-generated files.
+
+Many files under ``generated/`` are byte-identical across config_names (most
+platforms share bn_conf.h, dso_conf.h and often configuration.h) and some
+across perlasm flavors.  The pregen archives therefore store each distinct file
+once, as a blob named after its SHA-256, and bazel/pregen_index.bzl maps the
+canonical path of every file of every part to its blob.
+
+Parts are the pregen archives written by patch_bcr_pregen.py: "common"
+(generated/common/, @openssl_pregen), each config_name (generated/<config>/,
+@openssl_pregen_<config>) and each perlasm flavor (generated/asm/<flavor>/,
+@openssl_pregen_asm_<flavor>).  A blob used by a single part is stored in that
+part's archive; one used by several is stored in the common archive, which
+every pregen build fetches anyway.
+"""
+
+import hashlib
+from collections.abc import Callable, Mapping
+from pathlib import Path, PurePosixPath
+
+COMMON = "common"
+
+# part -> {canonical path -> blob name}
+PregenIndex = dict[str, dict[str, str]]
+
+
+def part_of(rel: PurePosixPath) -> tuple[str, str] | None:
+    """Split the path of a file relative to the pregen dir into (part, canonical path).
+
+    Returns None for files outside generated/, such as the BUILD file.
+    """
+    parts = rel.parts
+    if len(parts) < 3 or parts[0] != "generated":
+        return None
+    if parts[1] == "asm":
+        if len(parts) < 4:
+            return None
+        return f"asm_{parts[2]}", "/".join(parts[3:])
+    return parts[1], "/".join(parts[2:])
+
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def build_index(pregen_dir: Path, digest: Callable[[Path], str] = _sha256) -> tuple[PregenIndex, dict[str, Path]]:
+    """Index every file under *pregen_dir*/generated.
+
+    Returns the index and a path holding the contents of each blob.  Blobs keep
+    the extension of the file, so the same contents under different extensions
+    are separate blobs.
+    """
+    index: PregenIndex = {}
+    blob_paths: dict[str, Path] = {}
+    generated = pregen_dir / "generated"
+    files = sorted(path for path in generated.rglob("*") if path.is_file()) if generated.is_dir() else []
+    for path in files:
+        located = part_of(PurePosixPath(path.relative_to(pregen_dir).as_posix()))
+        if located is None:
+            continue
+        part, canonical = located
+        blob = digest(path) + PurePosixPath(canonical).suffix
+        index.setdefault(part, {})[canonical] = blob
+        blob_paths.setdefault(blob, path)
+    return index, blob_paths
+
+
+def blob_homes(index: Mapping[str, Mapping[str, str]]) -> dict[str, str]:
+    """Return the part whose archive stores each blob."""
+    users: dict[str, set[str]] = {}
+    for part, files in index.items():
+        for blob in files.values():
+            users.setdefault(blob, set()).add(part)
+    return {blob: parts.pop() if len(parts) == 1 else COMMON for blob, parts in users.items()}
+
+
+def render_index_bzl(index: Mapping[str, Mapping[str, str]]) -> str:
+    """Render bazel/pregen_index.bzl, already formatted as buildifier would."""
+    lines = [
+        '"""Generated code. DO NOT EDIT.',
+        "",
+        "Maps the canonical path of every pre-generated file, per pregen archive part,",
+        "to the blob under blobs/ that holds its contents (see pregen_index.py).",
+        '"""',
+        "",
+        "PREGEN_INDEX = {",
+    ]
+    for part in sorted(index):
+        if not index[part]:
+            lines.append(f'    "{part}": {{}},')
+            continue
+        lines.append(f'    "{part}": {{')
+        lines += [f'        "{canonical}": "{blob}",' for canonical, blob in sorted(index[part].items())]
+        lines.append("    },")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
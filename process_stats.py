@@ -0,0 +1,157 @@
+"""Resource accounting for the processes the generator starts.
+
+run_measured() and wait_measured() reap each child with os.wait4(), which
+reports the CPU time and peak RSS of exactly that child (plus whatever it
+reaped itself), even while other Perl processes run concurrently.  Every
+process is recorded, and format_usage_report()/write_usage_report() summarise
+them by phase and by perlasm flavor, along with the most expensive ones.
+
+Hosts without os.wait4() (Windows) only record wall time.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Sequence
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, Any, NamedTuple
+
+
+class ProcessStats(NamedTuple):
+    name: str
+    # Pipeline phase, e.g. "configure", "templates" or "perlasm:elf".
+    phase: str
+    exit: int
+    wall: float
+    user: float
+    system: float
+    max_rss_kb: int
+
+    @property
+    def cpu(self) -> float:
+        return self.user + self.system
+
+
+_lock = threading.Lock()
+_collected: list[ProcessStats] = []
+
+
+def collected_stats() -> list[ProcessStats]:
+    """Return every process recorded so far, in the order they finished."""
+    with _lock:
+        return list(_collected)
+
+
+def wait_measured(proc: "subprocess.Popen[Any]", name: str, phase: str, start: float) -> ProcessStats:
+    """Reap *proc*, which was started at time.monotonic() *start*, and record its usage."""
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        user, system = usage.ru_utime, usage.ru_stime
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+        max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    else:
+        proc.wait()
+        user = system = 0.0
+        max_rss_kb = 0
+    stats = ProcessStats(name, phase, proc.returncode, time.monotonic() - start, user, system, max_rss_kb)
+    with _lock:
+        _collected.append(stats)
+    return stats
+
+
+def run_measured(
+    name: str,
+    phase: str,
+    cmd: list[str],
+    check: bool = False,
+    **kwargs: Any,
+) -> tuple["subprocess.CompletedProcess[bytes]", ProcessStats]:
+    """Like subprocess.run(), but also record and return the process's resource usage.
+
+    Captured output goes through temporary files rather than pipes, so the
+    child can be reaped with os.wait4() instead of by communicate().
+    """
+    files: dict[str, IO[bytes]] = {}
+    outputs: dict[str, bytes] = {}
+    with ExitStack() as stack:
+        for stream in ("stdout", "stderr"):
+            if kwargs.get(stream) == subprocess.PIPE:
+                files[stream] = kwargs[stream] = stack.enter_context(tempfile.TemporaryFile())
+        start = time.monotonic()
+        proc = subprocess.Popen(cmd, **kwargs)
+        stats = wait_measured(proc, name, phase, start)
+        for stream, f in files.items():
+            f.seek(0)
+            outputs[stream] = f.read()
+    result = subprocess.CompletedProcess(cmd, stats.exit, outputs.get("stdout"), outputs.get("stderr"))
+    if check:
+        result.check_returncode()
+    return result, stats
+
+
+def _totals(stats: Sequence[ProcessStats], key: str) -> dict[str, Any]:
+    return {
+        "key": key,
+        "count": len(stats),
+        "wall": sum(s.wall for s in stats),
+        "cpu": sum(s.cpu for s in stats),
+        "max_rss_kb": max(s.max_rss_kb for s in stats),
+    }
+
+
+def summarize(stats: Sequence[ProcessStats], top: int) -> dict[str, Any]:
+    """Group *stats* by phase and by perlasm flavor, and pick the *top* processes by CPU time."""
+    by_phase: dict[str, list[ProcessStats]] = {}
+    by_flavor: dict[str, list[ProcessStats]] = {}
+    for s in stats:
+        phase, _, flavor = s.phase.partition(":")
+        by_phase.setdefault(phase, []).append(s)
+        if phase == "perlasm" and flavor:
+            by_flavor.setdefault(flavor, []).append(s)
+
+    def _sorted_totals(groups: dict[str, list[ProcessStats]]) -> list[dict[str, Any]]:
+        return sorted((_totals(group, key) for key, group in groups.items()), key=lambda t: -float(t["cpu"]))
+
+    return {
+        "by_phase": _sorted_totals(by_phase),
+        "by_flavor": _sorted_totals(by_flavor),
+        "top": [s._asdict() | {"cpu": s.cpu} for s in sorted(stats, key=lambda s: -s.cpu)[:top]],
+    }
+
+
+def format_usage_report(stats: Sequence[ProcessStats], top: int) -> str:
+    if not stats:
+        return "No processes recorded."
+    summary = summarize(stats, top)
+    lines = []
+    for title, groups in [("phase", summary["by_phase"]), ("perlasm flavor", summary["by_flavor"])]:
+        if not groups:
+            continue
+        lines.append(f"Process usage by {title}:")
+        lines.append(f"  {'':<24} {'count':>6} {'wall s':>9} {'cpu s':>9} {'max RSS MiB':>12}")
+        for group in groups:
+            lines.append(
+                f"  {group['key']:<24} {group['count']:>6} {group['wall']:>9.1f} {group['cpu']:>9.1f}"
+                f" {group['max_rss_kb'] / 1024:>12.1f}"
+            )
+    lines.append(f"Top {len(summary['top'])} processes by CPU time:")
+    lines.append(f"  {'wall s':>7} {'cpu s':>7} {'RSS MiB':>8}  {'phase':<16} name")
+    for s in summary["top"]:
+        lines.append(
+            f"  {s['wall']:>7.2f} {s['cpu']:>7.2f} {s['max_rss_kb'] / 1024:>8.1f}  {s['phase']:<16} {s['name']}"
+        )
+    return "\n".join(lines)
+
+
+def write_usage_report(path: Path, stats: Sequence[ProcessStats], top: int) -> None:
+    """Write every recorded process and the summary of format_usage_report() as JSON."""
+    report = summarize(stats, top)
+    report["processes"] = [s._asdict() | {"cpu": s.cpu} for s in stats]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
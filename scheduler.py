@@ -0,0 +1,132 @@
+"""Dependency-driven task scheduler for the generation pipeline.
+
+The pipeline is a list of Tasks, each naming the tasks whose outputs it needs.
+run_tasks() starts every task as soon as its dependencies have finished and
+runs it on its own worker thread.  Perl processes started anywhere inside a
+task hold a process_slot(), which caps how many run at once across the whole
+graph, so independent phases overlap without oversubscribing the machine.
+"""
+
+import asyncio
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import NamedTuple
+
+
+class Task(NamedTuple):
+    name: str
+    deps: tuple[str, ...]
+    run: Callable[[], None]
+
+
+class TaskTiming(NamedTuple):
+    """Start and end of a task, in seconds since run_tasks() began."""
+
+    name: str
+    start: float
+    end: float
+
+
+_process_slots: threading.BoundedSemaphore | None = None
+
+
+@contextmanager
+def process_slot() -> Iterator[None]:
+    """Hold one of the run_tasks() process slots; a no-op outside run_tasks()."""
+    slots = _process_slots
+    if slots is None:
+        yield
+        return
+    with slots:
+        yield
+
+
+def _check_graph(tasks: Sequence[Task]) -> None:
+    """Raise if task names repeat, a dependency is unknown, or the graph has a cycle."""
+    deps = {}
+    for task in tasks:
+        if task.name in deps:
+            raise RuntimeError(f"Duplicate task {task.name}")
+        deps[task.name] = task.deps
+    for name, task_deps in deps.items():
+        for dep in task_deps:
+            if dep not in deps:
+                raise RuntimeError(f"Task {name} depends on unknown task {dep}")
+
+    done: set[str] = set()
+    remaining = dict(deps)
+    while remaining:
+        ready = [name for name, task_deps in remaining.items() if done.issuperset(task_deps)]
+        if not ready:
+            raise RuntimeError(f"Dependency cycle among tasks: {', '.join(sorted(remaining))}")
+        for name in ready:
+            done.add(name)
+            del remaining[name]
+
+
+async def _run_graph(tasks: Sequence[Task]) -> dict[str, TaskTiming]:
+    loop = asyncio.get_running_loop()
+    epoch = time.monotonic()
+    timings: dict[str, TaskTiming] = {}
+    running: dict[str, asyncio.Task[None]] = {}
+
+    # Every task gets a thread: they mostly wait on Perl children, and those
+    # are bounded by process_slot() rather than by the number of tasks.
+    with ThreadPoolExecutor(max_workers=max(len(tasks), 1)) as executor:
+
+        async def _one(task: Task) -> None:
+            await asyncio.gather(*(running[dep] for dep in task.deps))
+            start = time.monotonic() - epoch
+            await loop.run_in_executor(executor, task.run)
+            timings[task.name] = TaskTiming(task.name, start, time.monotonic() - epoch)
+
+        for task in tasks:
+            running[task.name] = asyncio.create_task(_one(task), name=task.name)
+        try:
+            await asyncio.gather(*running.values())
+        except BaseException:
+            # Tasks already on a thread run to completion; nothing new starts.
+            for pending in running.values():
+                pending.cancel()
+            raise
+    return timings
+
+
+def run_tasks(tasks: Sequence[Task], jobs: int) -> dict[str, TaskTiming]:
+    """Run *tasks* in dependency order with at most *jobs* Perl processes at once.
+
+    The first failing task's exception is re-raised once every task that had
+    already started has returned; tasks that had not started are skipped.
+    """
+    global _process_slots
+    _check_graph(tasks)
+    _process_slots = threading.BoundedSemaphore(max(jobs, 1))
+    try:
+        return asyncio.run(_run_graph(tasks))
+    finally:
+        _process_slots = None
+
+
+def critical_path(tasks: Sequence[Task], timings: dict[str, TaskTiming]) -> list[TaskTiming]:
+    """Return the chain of tasks that determined the total run time.
+
+    Walks back from the task that finished last, each time to the dependency
+    that finished last.
+    """
+    deps = {task.name: task.deps for task in tasks}
+    current = max(timings.values(), key=lambda timing: timing.end)
+    path = [current]
+    while deps[current.name]:
+        current = max((timings[dep] for dep in deps[current.name]), key=lambda timing: timing.end)
+        path.append(current)
+    return path[::-1]
+
+
+def format_critical_path(path: list[TaskTiming]) -> str:
+    lines = [f"Critical path ({path[-1].end:.1f}s):"]
+    for timing in path:
+        lines.append(f"  {timing.start:7.1f}s -> {timing.end:7.1f}s  {timing.end - timing.start:6.1f}s  {timing.name}")
+    return "\n".join(lines)
@@ -0,0 +1,178 @@
+"""Splitting a run of the generator across machines, and checking the pieces.
+
+The pregen tree is made of parts (see pregen_index.py): the common files, one
+directory per config_name and one per perlasm flavor.  shard_plan() deals the
+parts out to N shards, and ``--shard i/N`` makes the generator produce only the
+parts of shard i, configuring only the targets those parts need.
+
+Each shard leaves SHARD_RECORD in its pregen directory: its place in the plan,
+the manifest units of the whole run, the PlatformData of the targets it
+configured, the inputs of their perlasm scripts (see perlasm_inputs.py) and
+the SHA-256 of every file it wrote.  The ``merge`` subcommand loads the
+records with load_shard() and refuses to combine them unless check_shards()
+finds that together they are exactly one plan, built from the same inputs,
+with every file where its shard left it and owned by that shard.
+Parts are disjoint, so two shards can only write the same file if one of them
+writes outside its own parts, which check_shards() reports.
+"""
+
+import hashlib
+import json
+from collections.abc import Callable, Mapping, Sequence
+from pathlib import Path, PurePosixPath
+from typing import Any, NamedTuple
+
+from pregen_index import part_of
+
+SHARD_RECORD = "shard.json"
+
+
+class Shard(NamedTuple):
+    # The pregen directory the shard wrote.
+    root: Path
+    number: int
+    total: int
+    parts: tuple[str, ...]
+    # Manifest unit name -> {"key", "outputs", "perl", "platform"} of the whole run.
+    units: dict[str, Any]
+    # Configure target -> PlatformData.to_dict().
+    platform_data: dict[str, Any]
+    # Perlasm script of those targets -> PerlasmInputs._asdict().
+    perlasm_inputs: dict[str, Any]
+    # Path relative to root -> SHA-256.
+    files: dict[str, str]
+
+
+def shard_plan(parts: Sequence[str], count: int) -> list[tuple[str, ...]]:
+    """Deal *parts* out to *count* shards in turn, so put the most expensive parts first."""
+    if not 1 <= count <= len(parts):
+        raise RuntimeError(f"Cannot split {len(parts)} pregen parts into {count} shards")
+    return [tuple(parts[i::count]) for i in range(count)]
+
+
+def label_part(label: str) -> str | None:
+    """Return the pregen part that owns an output label (see manifest.py), or None for anything else."""
+    root, _, rel = label.partition(":")
+    names = PurePosixPath(rel).parts
+    if root != "pregen" or len(names) < 2 or names[0] != "generated":
+        return None
+    if names[1] == "asm":
+        return f"asm_{names[2]}" if len(names) > 2 else None
+    return names[1]
+
+
+def generated_files(pregen_dir: Path) -> list[str]:
+    """List every file under *pregen_dir*/generated, relative to *pregen_dir*."""
+    generated = pregen_dir / "generated"
+    if not generated.is_dir():
+        return []
+    return sorted(path.relative_to(pregen_dir).as_posix() for path in generated.rglob("*") if path.is_file())
+
+
+def shard_record(
+    index: int,
+    count: int,
+    parts: Sequence[str],
+    units: Mapping[str, Any],
+    platform_data: Mapping[str, Any],
+    perlasm_inputs: Mapping[str, Any],
+    pregen_dir: Path,
+    digest: Callable[[Path], str],
+) -> str:
+    """Render the SHARD_RECORD of shard *index* of *count*, hashing its files with *digest*."""
+    record = {
+        "shard": [index, count],
+        "parts": list(parts),
+        "units": units,
+        "platform_data": platform_data,
+        "perlasm_inputs": perlasm_inputs,
+        "files": {rel: digest(pregen_dir / rel) for rel in generated_files(pregen_dir)},
+    }
+    return json.dumps(record, indent=1, sort_keys=True) + "\n"
+
+
+def load_shard(pregen_dir: Path) -> Shard:
+    path = pregen_dir / SHARD_RECORD
+    try:
+        record = json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"{pregen_dir} is not the pregen directory of a --shard run: {e}") from e
+    index, count = record["shard"]
+    return Shard(
+        pregen_dir,
+        index,
+        count,
+        tuple(record["parts"]),
+        record["units"],
+        record["platform_data"],
+        record["perlasm_inputs"],
+        record["files"],
+    )
+
+
+def check_shards(shards: Sequence[Shard], parts: Sequence[str]) -> list[str]:
+    """Return everything that keeps *shards* from adding up to one run over *parts*."""
+    if not shards:
+        return ["No shards given"]
+    counts = sorted({shard.total for shard in shards})
+    if len(counts) != 1:
+        return [f"Shards disagree on the shard count: {', '.join(map(str, counts))}"]
+    count = counts[0]
+    plan = shard_plan(parts, count)
+
+    errors = []
+    seen: dict[int, Path] = {}
+    for shard in shards:
+        if not 0 <= shard.number < count:
+            errors.append(f"{shard.root}: shard {shard.number}/{count} is not in the plan")
+            continue
+        if shard.number in seen:
+            errors.append(f"Shard {shard.number}/{count} given twice: {seen[shard.number]} and {shard.root}")
+        seen[shard.number] = shard.root
+        if shard.parts != plan[shard.number]:
+            errors.append(
+                f"{shard.root}: shard {shard.number}/{count} made {', '.join(shard.parts)}"
+                f" but the plan assigns it {', '.join(plan[shard.number])}"
+            )
+    errors += [f"Shard {index}/{count} is missing" for index in range(count) if index not in seen]
+
+    first = shards[0]
+    for shard in shards[1:]:
+        differing = sorted(
+            name for name in first.units.keys() | shard.units.keys() if first.units.get(name) != shard.units.get(name)
+        )
+        if differing:
+            errors.append(f"{shard.root} was generated from different inputs than {first.root}: {', '.join(differing)}")
+
+    configured: dict[str, tuple[Path, Any]] = {}
+    for shard in shards:
+        for platform, data in shard.platform_data.items():
+            if platform in configured and configured[platform][1] != data:
+                errors.append(
+                    f"{shard.root} and {configured[platform][0]} have different Configure results for {platform}"
+                )
+            configured.setdefault(platform, (shard.root, data))
+
+    scanned: dict[str, tuple[Path, Any]] = {}
+    for shard in shards:
+        for script, inputs in shard.perlasm_inputs.items():
+            if script in scanned and scanned[script][1] != inputs:
+                errors.append(f"{shard.root} and {scanned[script][0]} found different inputs for {script}")
+            scanned.setdefault(script, (shard.root, inputs))
+
+    for shard in shards:
+        errors += [
+            f"{shard.root}: {rel} is not in {SHARD_RECORD}"
+            for rel in generated_files(shard.root)
+            if rel not in shard.files
+        ]
+        for rel, sha256 in sorted(shard.files.items()):
+            path = shard.root / rel
+            if not path.is_file():
+                errors.append(f"{shard.root}: {rel} is missing")
+            elif hashlib.sha256(path.read_bytes()).hexdigest() != sha256:
+                errors.append(f"{shard.root}: {rel} changed after shard {shard.number}/{count} wrote it")
+            located = part_of(PurePosixPath(rel))
+            if located is None or located[0] not in shard.parts:
+                errors.append(f"{shard.root}: {rel} is outside the parts of shard {shard.number}/{count}")
+    return errors
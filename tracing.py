@@ -0,0 +1,87 @@
+"""Chrome trace recording for the generation pipeline.
+
+Between start_tracing() and write_trace(), every span() is recorded as a
+complete ("X") event in the Chrome trace event format, which loads in
+chrome://tracing and https://ui.perfetto.dev.  Spans are laid out per thread,
+so the phases of the task graph and the Perl processes they start show up
+side by side.  Outside of tracing, span() costs next to nothing.
+"""
+
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+
+class _Trace:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.epoch_ns = time.perf_counter_ns()
+        self.events: list[dict[str, Any]] = []
+        # threading.get_ident() -> (tid, thread name)
+        self.threads: dict[int, tuple[int, str]] = {}
+
+    def tid(self) -> int:
+        ident = threading.get_ident()
+        with self.lock:
+            if ident not in self.threads:
+                self.threads[ident] = (len(self.threads) + 1, threading.current_thread().name)
+            return self.threads[ident][0]
+
+
+_trace: _Trace | None = None
+
+
+def start_tracing() -> None:
+    global _trace
+    _trace = _Trace()
+
+
+@contextmanager
+def span(name: str, category: str, args: dict[str, Any] | None = None) -> Iterator[dict[str, Any]]:
+    """Record the with-block as a span; values added to the yielded dict become its args."""
+    span_args = dict(args or {})
+    trace = _trace
+    if trace is None:
+        yield span_args
+        return
+    tid = trace.tid()
+    start_ns = time.perf_counter_ns()
+    try:
+        yield span_args
+    finally:
+        end_ns = time.perf_counter_ns()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start_ns - trace.epoch_ns) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": span_args,
+        }
+        with trace.lock:
+            trace.events.append(event)
+
+
+def write_trace(path: Path) -> None:
+    """Write the spans recorded since start_tracing() to *path* and stop tracing."""
+    global _trace
+    trace = _trace
+    _trace = None
+    if trace is None:
+        return
+    pid = os.getpid()
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in trace.threads.values()
+    ]
+    metadata.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "generate_constants"}})
+    events = sorted(trace.events, key=lambda event: (event["ts"], -event["dur"]))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"traceEvents": metadata + events, "displayTimeUnit": "ms"}))